@@ -1,9 +1,8 @@
-import logging.config
 import os.path
 
 from XTBApi.__version__ import __version__
 
-logging.config.dictConfig({
+LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
     'formatters': {
@@ -38,4 +37,11 @@ logging.config.dictConfig({
             'level': 'DEBUG'
         }
     }
-})
+}
+
+
+def setup_logging(config=None):
+    """configure the standard logging of XTBApi, call once from the entry
+    point; applications add their own handlers"""
+    import logging.config
+    logging.config.dictConfig(config or LOGGING)
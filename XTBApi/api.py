@@ -9,18 +9,30 @@ Main module
 
 # import inspect
 import enum
-import json
+import os
+import threading
 import time
-from datetime import datetime
 from websockets.sync.client import connect
 from websockets.exceptions import WebSocketException
+from XTBApi import codec
 from XTBApi.exceptions import *
+from XTBApi.limiter import RateLimiter
+from XTBApi.symbol_cache import SymbolCache
+from XTBApi.trading_hours import TradingHoursCache
+from XTBApi.trades import Transaction, TradeStore, OrderHandle, REQUEST_PENDING
+from concurrent import futures
+from concurrent.futures import ThreadPoolExecutor
 import logging
 
 LOGGER = logging.getLogger('XTBApi.api')
 LOGGER.setLevel(logging.INFO)
 LOGIN_TIMEOUT = 120
 MAX_TIME_INTERVAL = 0.200
+# {mode} is demo or real, override with XTB_WS_URL to target a local
+# stand-in server
+WS_URL = "wss://ws.xtb.com/{mode}"
+# error codes answered when request or data limits are hit
+THROTTLE_ERROR_CODES = ('EX008', 'EX009', 'EX010')
 
 
 class STATUS(enum.Enum):
@@ -70,6 +82,18 @@ def _get_data(command, **parameters):
     return data
 
 
+def _convert_trading_hours(response):
+    """convert session bounds of getTradingHours from ms to s"""
+    for symbol in response:
+        for day in symbol['trading']:
+            day['fromT'] = int(day['fromT'] / 1000)
+            day['toT'] = int(day['toT'] / 1000)
+        for day in symbol['quotes']:
+            day['fromT'] = int(day['fromT'] / 1000)
+            day['toT'] = int(day['toT'] / 1000)
+    return response
+
+
 def _check_mode(mode):
     """check if mode acceptable"""
     modes = [x.value for x in MODES]
@@ -97,10 +121,16 @@ def _check_volume(volume):
 class BaseClient(object):
     """main client class"""
 
-    def __init__(self):
+    def __init__(self, limiter=None):
         self.ws = None
+        self.url = os.getenv("XTB_WS_URL", WS_URL)
         self._login_data = None
-        self._time_last_request = time.time() - MAX_TIME_INTERVAL
+        self._lock = threading.RLock()
+        self.limiter = limiter or RateLimiter(MAX_TIME_INTERVAL)
+        self.stream_session_id = None
+        # optional hooks: on_command(command, seconds, error), on_relogin()
+        self.on_command = None
+        self.on_relogin = None
         self.status = STATUS.NOT_LOGGED
         LOGGER.debug("BaseClient inited")
         self.LOGGER = logging.getLogger('XTBApi.api.BaseClient')
@@ -108,36 +138,71 @@ class BaseClient(object):
     def _login_decorator(self, func, *args, **kwargs):
         if self.status == STATUS.NOT_LOGGED:
             raise NotLogged()
+        ws = self.ws
         try:
             return func(*args, **kwargs)
         except SocketError as e:
-            LOGGER.info(f"re-logging in due to LOGIN_TIMEOUT gone. ({e})")
-            self.login(self._login_data[0], self._login_data[1])
+            LOGGER.info("re-logging in due to LOGIN_TIMEOUT gone. (%s)", e)
+            self._relogin(ws)
+            return func(*args, **kwargs)
+        except CommandFailed as e:
+            # the limiter has backed off, a new session would not help
+            if e.err_code in THROTTLE_ERROR_CODES:
+                raise
+            LOGGER.warning(e)
+            self._relogin(ws)
             return func(*args, **kwargs)
         except Exception as e:
             LOGGER.warning(e)
-            self.login(self._login_data[0], self._login_data[1])
+            self._relogin(ws)
             return func(*args, **kwargs)
 
+    def _relogin(self, failed_ws):
+        """login again unless another thread already did"""
+        with self._lock:
+            if self.ws is failed_ws:
+                self.login(*self._login_data)
+                if self.on_relogin:
+                    self.on_relogin()
+
     def _send_command(self, dict_data):
         """send command to api"""
-        time_interval = time.time() - self._time_last_request
-        self.LOGGER.debug("took {} s.".format(time_interval))
-        if time_interval < MAX_TIME_INTERVAL:
-            time.sleep(MAX_TIME_INTERVAL - time_interval)
+        waited = self.limiter.acquire()
+        self.LOGGER.debug("waited %s s.", waited)
+        start = time.perf_counter()
+        error = True
         try:
-            self.ws.send(json.dumps(dict_data))
-            response = self.ws.recv()
-        except WebSocketException:
-            raise SocketError()
-        self._time_last_request = time.time()
-        res = json.loads(response)
+            with self._lock:
+                try:
+                    self.ws.send(codec.dumps(dict_data))
+                    response = self.ws.recv()
+                except (WebSocketException, TimeoutError):
+                    # XTB drops connections exceeding the request rate
+                    self.limiter.throttled()
+                    raise SocketError()
+            res = self._handle_response(codec.loads(response))
+            error = False
+            return res
+        finally:
+            if self.on_command:
+                self.on_command(dict_data['command'],
+                                time.perf_counter() - start, error)
+
+    def _handle_response(self, res):
+        """check status and unwrap returnData of a response"""
         if res['status'] is False:
-            self.LOGGER.debug(res)
+            self.LOGGER.debug("%s", res)
+            if res.get('errorCode') in THROTTLE_ERROR_CODES:
+                self.limiter.throttled()
             raise CommandFailed(res)
+        self.limiter.success()
+        if 'streamSessionId' in res.keys():
+            self.stream_session_id = res['streamSessionId']
         if 'returnData' in res.keys():
             self.LOGGER.info("CMD: done")
-            self.LOGGER.debug(res['returnData'])
+            # formatting a chart payload is costly, only do it when read
+            if self.LOGGER.isEnabledFor(logging.DEBUG):
+                self.LOGGER.debug(res['returnData'])
             return res['returnData']
 
     def _send_command_with_check(self, dict_data):
@@ -147,9 +212,11 @@ class BaseClient(object):
     def login(self, user_id, password, mode='demo'):
         """login command"""
         data = _get_data("login", userId=user_id, password=password)
-        self.ws = connect(f"wss://ws.xtb.com/{mode}")
+        self._close_socket()
+        # chart backfills easily exceed the default 1 MiB frame limit
+        self.ws = connect(self.url.format(mode=mode), max_size=None)
         response = self._send_command(data)
-        self._login_data = (user_id, password)
+        self._login_data = (user_id, password, mode)
         self.status = STATUS.LOGGED
         self.LOGGER.info("CMD: login...")
         return response
@@ -158,10 +225,18 @@ class BaseClient(object):
         """logout command"""
         data = _get_data("logout")
         response = self._send_command(data)
-        self.status = STATUS.LOGGED
+        self.status = STATUS.NOT_LOGGED
         self.LOGGER.info("CMD: logout...")
+        self._close_socket()
         return response
 
+    def _close_socket(self):
+        if self.ws is not None:
+            try:
+                self.ws.close()
+            except (WebSocketException, OSError):
+                pass
+
     def get_all_symbols(self):
         """getAllSymbols command"""
         data = _get_data("getAllSymbols")
@@ -183,8 +258,9 @@ class BaseClient(object):
             "symbol": symbol
         }
         data = _get_data("getChartLastRequest", info=args)
-        self.LOGGER.info(f"CMD: get chart last request for {symbol} of period"
-                         f" {period} from {start}...")
+        self.LOGGER.info("CMD: get chart last request for %s of period %s "
+                         "from %s...",
+                         symbol, period, start)
 
         return self._send_command_with_check(data)
 
@@ -201,16 +277,16 @@ class BaseClient(object):
             "ticks": ticks
         }
         data = _get_data("getChartRangeRequest", info=args)
-        self.LOGGER.info(f"CMD: get chart range request for {symbol} of "
-                         f"{period} from {start} to {end} with ticks of "
-                         f"{ticks}...")
+        self.LOGGER.info("CMD: get chart range request for %s of %s from %s "
+                         "to %s with ticks of %s...",
+                         symbol, period, start, end, ticks)
         return self._send_command_with_check(data)
 
     def get_commission(self, symbol, volume):
         """getCommissionDef command"""
         volume = _check_volume(volume)
         data = _get_data("getCommissionDef", symbol=symbol, volume=volume)
-        self.LOGGER.info(f"CMD: get commission for {symbol} of {volume}...")
+        self.LOGGER.info("CMD: get commission for %s of %s...", symbol, volume)
         return self._send_command_with_check(data)
 
     def get_margin_level(self):
@@ -225,7 +301,8 @@ class BaseClient(object):
         get expected margin for volumes used symbol"""
         volume = _check_volume(volume)
         data = _get_data("getMarginTrade", symbol=symbol, volume=volume)
-        self.LOGGER.info(f"CMD: get margin trade for {symbol} of {volume}...")
+        self.LOGGER.info("CMD: get margin trade for %s of %s...",
+                         symbol, volume)
         return self._send_command_with_check(data)
 
     def get_profit_calculation(self, symbol, mode, volume, op_price, cl_price):
@@ -236,9 +313,9 @@ class BaseClient(object):
         data = _get_data("getProfitCalculation", closePrice=cl_price,
                          cmd=mode, openPrice=op_price, symbol=symbol,
                          volume=volume)
-        self.LOGGER.info(f"CMD: get profit calculation for {symbol} of "
-                         f"{volume} from {op_price} to {cl_price} in mode "
-                         f"{mode}...")
+        self.LOGGER.info("CMD: get profit calculation for %s of %s from %s "
+                         "to %s in mode %s...",
+                         symbol, volume, op_price, cl_price, mode)
         return self._send_command_with_check(data)
 
     def get_server_time(self):
@@ -250,23 +327,23 @@ class BaseClient(object):
     def get_symbol(self, symbol):
         """getSymbol command"""
         data = _get_data("getSymbol", symbol=symbol)
-        self.LOGGER.info(f"CMD: get symbol {symbol}...")
+        self.LOGGER.info("CMD: get symbol %s...", symbol)
         return self._send_command_with_check(data)
 
     def get_tick_prices(self, symbols, start, level=0):
         """getTickPrices command"""
         data = _get_data("getTickPrices", level=level, symbols=symbols,
                          timestamp=start)
-        self.LOGGER.info(f"CMD: get tick prices of {symbols} from {start} "
-                         f"with level {level}...")
+        self.LOGGER.info("CMD: get tick prices of %s from %s with level %s...",
+                         symbols, start, level)
         return self._send_command_with_check(data)
 
     def get_trade_records(self, trade_position_list):
         """getTradeRecords command
         takes a list of position id"""
         data = _get_data("getTradeRecords", orders=trade_position_list)
-        self.LOGGER.info(f"CMD: get trade records of len "
-                         f"{len(trade_position_list)}...")
+        self.LOGGER.info("CMD: get trade records of len %s...",
+                         len(trade_position_list))
         return self._send_command_with_check(data)
 
     def get_trades(self, opened_only=True):
@@ -279,24 +356,18 @@ class BaseClient(object):
         """getTradesHistory command
         can take 0 as actual time"""
         data = _get_data("getTradesHistory", end=end, start=start)
-        self.LOGGER.info(f"CMD: get trades history from {start} to {end}...")
+        self.LOGGER.info("CMD: get trades history from %s to %s...",
+                         start, end)
         return self._send_command_with_check(data)
 
     def get_trading_hours(self, trade_position_list):
         """getTradingHours command"""
         # EDITED IN ALPHA2
         data = _get_data("getTradingHours", symbols=trade_position_list)
-        self.LOGGER.info(f"CMD: get trading hours of len "
-                         f"{len(trade_position_list)}...")
+        self.LOGGER.info("CMD: get trading hours of len %s...",
+                         len(trade_position_list))
         response = self._send_command_with_check(data)
-        for symbol in response:
-            for day in symbol['trading']:
-                day['fromT'] = int(day['fromT'] / 1000)
-                day['toT'] = int(day['toT'] / 1000)
-            for day in symbol['quotes']:
-                day['fromT'] = int(day['fromT'] / 1000)
-                day['toT'] = int(day['toT'] / 1000)
-        return response
+        return _convert_trading_hours(response)
 
     def get_version(self):
         """getVersion command"""
@@ -343,15 +414,15 @@ class BaseClient(object):
         data = _get_data("tradeTransaction", tradeTransInfo=info)
         name_of_mode = [x.name for x in MODES if x.value == mode][0]
         name_of_type = [x.name for x in TXTYPE if x.value == trans_type][0]
-        self.LOGGER.info(f"CMD: trade transaction of {symbol} of mode "
-                         f"{name_of_mode} with type {name_of_type} of "
-                         f"{volume}, data={data}...")
+        self.LOGGER.info("CMD: trade transaction of %s of mode %s with type "
+                         "%s of %s, data=%s...",
+                         symbol, name_of_mode, name_of_type, volume, data)
         return self._send_command_with_check(data)
 
     def trade_transaction_status(self, order_id):
         """tradeTransactionStatus command"""
         data = _get_data("tradeTransactionStatus", order=order_id)
-        self.LOGGER.info(f"CMD: trade transaction status for {order_id}...")
+        self.LOGGER.info("CMD: trade transaction status for %s...", order_id)
         return self._send_command_with_check(data)
 
     def get_user_data(self):
@@ -361,55 +432,79 @@ class BaseClient(object):
         return self._send_command_with_check(data)
 
 
-class Transaction(object):
-    def __init__(self, trans_dict):
-        self.trans_dict = trans_dict
-        self.mode = {0: 'buy', 1: 'sell'}[trans_dict['cmd']]
-        self.order_id = trans_dict['order']
-        self.symbol = trans_dict['symbol']
-        self.volume = trans_dict['volume']
-        self.price = trans_dict['close_price']
-        self.actual_profit = trans_dict['profit']
-        self.timestamp = trans_dict['open_time'] / 1000
-        LOGGER.debug(f"Transaction {self.order_id} inited")
-
-
 class Client(BaseClient):
     """advanced class of client"""
-    def __init__(self):
-        super().__init__()
-        self.trade_rec = {}
+    # seconds to wait for the trade status stream before polling,
+    # and for a final status at all
+    status_grace = 1.0
+    confirm_timeout = 30.0
+    # tradeTransactionStatus polling interval, doubled up to the max
+    poll_interval = 0.05
+    poll_interval_max = 1.0
+
+    def __init__(self, limiter=None):
+        super().__init__(limiter)
+        self.trade_rec = TradeStore()
+        # trade_rec follows the trade stream, no getTrades refresh needed
+        self.streaming_trades = False
+        self.trading_hours = TradingHoursCache(self.get_trading_hours)
+        self.symbols = SymbolCache(self.get_symbol)
+        # submitted orders waiting for a final status, by order id
+        self._orders = {}
+        self._early_status = {}
+        self._orders_lock = threading.Lock()
+        self._confirmer = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix='xtb-confirm')
+        self.streaming_status = False
+        # hook called with ('submit' | 'confirm', seconds)
+        self.on_order = None
         self.LOGGER = logging.getLogger('XTBApi.api.Client')
         self.LOGGER.info("Client inited")
 
+    def get_margin_trade(self, symbol, volume):
+        """getMarginTrade command, cached as long as the quote"""
+        return self.symbols.memo(('margin', symbol, _check_volume(volume)),
+                                 lambda: super(Client, self).get_margin_trade(symbol, volume))
+
+    def get_commission(self, symbol, volume):
+        """getCommissionDef command, cached as long as the quote"""
+        return self.symbols.memo(('commission', symbol, _check_volume(volume)),
+                                 lambda: super(Client, self).get_commission(symbol, volume))
+
+    def stream_trades(self, stream):
+        """keep trade_rec current from a StreamClient"""
+        stream.subscribe_trades(self.trade_rec.on_trade)
+        stream.subscribe_profits(self.trade_rec.on_profit)
+        self.update_trades()
+        self.streaming_trades = True
+
+    def _refresh_trades(self):
+        if not self.streaming_trades:
+            self.update_trades()
+
+    def stream_quotes(self, stream, symbols):
+        """keep the cached quotes of symbols fresh from a StreamClient"""
+        for symbol in symbols:
+            self.symbols.static(symbol)
+            stream.subscribe_tick_prices(symbol, self.symbols.on_tick)
+
     def check_if_market_open(self, list_of_symbols):
         """check if market is open for symbol in symbols"""
-        _td = datetime.today()
-        actual_tmsp = _td.hour * 3600 + _td.minute * 60 + _td.second
-        response = self.get_trading_hours(list_of_symbols)
-        market_values = {}
-        for symbol in response:
-            today_values = [day for day in symbol['trading'] if day['day'] ==
-                            _td.isoweekday()]
-            if not today_values:
-                market_values[symbol['symbol']] = False
-                continue
-            today_values = today_values[0]
-            if today_values['fromT'] <= actual_tmsp <= today_values['toT']:
-                market_values[symbol['symbol']] = True
-            else:
-                market_values[symbol['symbol']] = False
-        return market_values
-
-    def get_lastn_candle_history(self, symbol, timeframe_in_seconds, number):
-        """get last n candles of timeframe"""
+        self.trading_hours.load(list_of_symbols)
+        return {symbol: self.trading_hours.is_open(symbol)
+                for symbol in list_of_symbols}
+
+    def get_lastn_candle_history(self, symbol, timeframe_in_seconds, number,
+                                 columnar=False):
+        """get last n candles of timeframe,
+        as a CandleBlock (use .decoded() for prices) if columnar"""
         acc_tmf = [60, 300, 900, 1800, 3600, 14400, 86400, 604800, 2592000]
         if timeframe_in_seconds not in acc_tmf:
             raise ValueError(f"timeframe not accepted, not in "
                              f"{', '.join([str(x) for x in acc_tmf])}")
         sec_prior = timeframe_in_seconds * number
-        LOGGER.debug(f"sym: {symbol}, tmf: {timeframe_in_seconds},"
-                     f" {time.time() - sec_prior}")
+        LOGGER.debug("sym: %s, tmf: %s, %s",
+                     symbol, timeframe_in_seconds, time.time() - sec_prior)
         res = {'rateInfos': []}
         while len(res['rateInfos']) < number:
             res = self.get_chart_last_request(
@@ -417,9 +512,12 @@ class Client(BaseClient):
                 timeframe_in_seconds // 60,
                 time.time() - sec_prior
             )
-            LOGGER.debug(res)
+            LOGGER.debug("%s", res)
             res['rateInfos'] = res['rateInfos'][-number:]
             sec_prior *= 3
+        if columnar:
+            from XTBApi.columnar import CandleBlock
+            return CandleBlock.from_rate_infos(res['rateInfos'], res['digits'])
         candle_history = []
         for candle in res['rateInfos']:
             _pr = candle['open']
@@ -432,49 +530,31 @@ class Client(BaseClient):
                 'high': hg_pr, 'low': lw_pr, 'volume': candle['vol']
             }
             candle_history.append(new_candle_entry)
-        LOGGER.debug(candle_history)
+        LOGGER.debug("%s", candle_history)
         return candle_history
 
+    def get_chart_range_block(self, symbol, period, start, end, ticks):
+        """getChartRangeRequest as a columnar CandleBlock"""
+        from XTBApi.columnar import CandleBlock
+        res = self.get_chart_range_request(symbol, period, start, end, ticks)
+        return CandleBlock.from_rate_infos(res['rateInfos'], res['digits'])
+
     def update_trades(self):
-        """update trade list"""
-        trades = self.get_trades()
-        self.trade_rec.clear()
-        for trade in trades:
-            obj_trans = Transaction(trade)
-            self.trade_rec[obj_trans.order_id] = obj_trans
-        # values_to_del = [key for key, trad_not_listed in
-        #                 self.trade_rec.items() if trad_not_listed.order_id
-        #                 not in [x['order'] for x in trades]]
-        # for key in values_to_del:
-        #    del self.trade_rec[key]
-        self.LOGGER.info(f"updated {len(self.trade_rec)} trades")
+        """update trade list, changed trades are updated in place"""
+        self.trade_rec.sync(self.get_trades())
+        self.LOGGER.info("updated %s trades", len(self.trade_rec))
         # self.LOGGER.info(trades)
         return self.trade_rec
 
     def get_trade_profit(self, trans_id):
         """get profit of trade"""
-        self.update_trades()
+        self._refresh_trades()
         profit = self.trade_rec[trans_id].actual_profit
-        self.LOGGER.info(f"got trade profit of {profit}")
+        self.LOGGER.info("got trade profit of %s", profit)
         return profit
 
-    def open_trade(self, mode, symbol, volume, **kwargs):
-        """open trade transaction"""
-        mode_enum: MODES = MODES.BUY
-        if mode in [MODES.BUY.value, MODES.SELL.value]:
-            mode_enum = [x for x in MODES if x.value == mode][0]
-        elif mode in ['buy', 'sell']:
-            modes = {'buy': MODES.BUY, 'sell': MODES.SELL}
-            mode_enum = modes[mode]
-        else:
-            raise ValueError("mode can be buy or sell")
-        mode_name = mode_enum.name
-        mode_value = mode_enum.value
-        self.LOGGER.info(f"opening trade of {symbol} of {volume} with {mode_name}")
-        conversion_mode = {MODES.BUY.value: 'ask', MODES.SELL.value: 'bid'}
-        res_symbol = self.get_symbol(symbol)
-        price = res_symbol[conversion_mode[mode_value]]
-        digits = res_symbol['precision']
+    def _trade_levels(self, mode_value, price, digits, kwargs):
+        """(tp, sl) from the rate_*, pip_* or tp/sl kwargs"""
         _tp = _sl = 0
         # safeguard by rate
         rate_tp = kwargs.pop("rate_tp", 0)
@@ -495,21 +575,113 @@ class Client(BaseClient):
             _tp = price - pip_tp if pip_tp else _tp
             _sl = price + pip_sl if pip_sl else _sl
         # safeguard by value
-        tp = kwargs.pop("tp", _tp)
-        sl = kwargs.pop("sl", _sl)
+        return kwargs.pop("tp", _tp), kwargs.pop("sl", _sl)
+
+    def submit_trade(self, mode, symbol, volume, **kwargs):
+        """open trade transaction without waiting for its status,
+        priced from the cached quote. Returns an OrderHandle"""
+        mode_enum: MODES = MODES.BUY
+        if mode in [MODES.BUY.value, MODES.SELL.value]:
+            mode_enum = [x for x in MODES if x.value == mode][0]
+        elif mode in ['buy', 'sell']:
+            modes = {'buy': MODES.BUY, 'sell': MODES.SELL}
+            mode_enum = modes[mode]
+        else:
+            raise ValueError("mode can be buy or sell")
+        mode_name = mode_enum.name
+        mode_value = mode_enum.value
+        self.LOGGER.info("opening trade of %s of %s with %s",
+                         symbol, volume, mode_name)
+        conversion_mode = {MODES.BUY.value: 'ask', MODES.SELL.value: 'bid'}
+        res_symbol = self.symbols.get(symbol)
+        price = res_symbol[conversion_mode[mode_value]]
+        tp, sl = self._trade_levels(mode_value, price, res_symbol['precision'], kwargs)
+        submitted = time.monotonic()
         response = self.trade_transaction(symbol, mode_value, 0, volume,
                                           price=price, take_profit=tp, stop_loss=sl)
-        self.update_trades()
-        status = self.trade_transaction_status(response['order'])['requestStatus']
-        self.LOGGER.info(f"open_trade completed with status of {status}")
+        handle = OrderHandle(response['order'], symbol, price, submitted,
+                             time.monotonic() - submitted)
+        self._observe_order('submit', handle.submit_seconds)
+        self._track(handle)
+        return handle
+
+    def open_trade(self, mode, symbol, volume, **kwargs):
+        """open trade transaction and wait for its status"""
+        handle = self.submit_trade(mode, symbol, volume, **kwargs)
+        status = handle.result()
+        self._refresh_trades()
+        self.LOGGER.info("open_trade completed with status of %s", status)
         if status != 3:
             raise TransactionRejected(status)
-        return response
+        return {'order': handle.order}
+
+    def _observe_order(self, stage, seconds):
+        if self.on_order is not None and seconds is not None:
+            self.on_order(stage, seconds)
+
+    def _track(self, handle):
+        """confirm handle from the trade status stream, else by polling"""
+        handle.add_done_callback(self._untrack)
+        with self._orders_lock:
+            early = self._early_status.pop(handle.order, None)
+            if early is None:
+                self._orders[handle.order] = handle
+        if early is not None:
+            handle.set_status(*early)
+            return
+        delay = self.status_grace if self.streaming_status else 0.0
+        self._confirmer.submit(self._poll_status, handle, delay)
+
+    def _untrack(self, handle):
+        with self._orders_lock:
+            self._orders.pop(handle.order, None)
+        self._observe_order('confirm', handle.confirm_seconds)
+
+    def _poll_status(self, handle, delay=0.0):
+        """poll until a final status, backing off while it is pending.
+        A streamed status ends the wait early, past confirm_timeout the
+        handle fails with TimeoutError"""
+        deadline = time.monotonic() + self.confirm_timeout
+        interval = self.poll_interval
+        try:
+            if delay:
+                futures.wait([handle.future], timeout=min(delay, self.confirm_timeout))
+            while not handle.done():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"no final status for order {handle.order}")
+                res = self.trade_transaction_status(handle.order)
+                if handle.set_status(res['requestStatus'], res.get('message')):
+                    break
+                futures.wait([handle.future], timeout=min(interval, remaining))
+                interval = min(interval * 2, self.poll_interval_max)
+        except Exception as e:
+            handle.set_exception(e)
+
+    def _on_trade_status(self, record):
+        """trade status stream record"""
+        if record['requestStatus'] == REQUEST_PENDING:
+            return
+        status = (record['requestStatus'], record.get('message'))
+        with self._orders_lock:
+            handle = self._orders.get(record['order'])
+            if handle is None:
+                # arrived before tradeTransaction returned, or not ours
+                self._early_status[record['order']] = status
+                while len(self._early_status) > 100:
+                    del self._early_status[next(iter(self._early_status))]
+        if handle is not None:
+            handle.set_status(*status)
+
+    def stream_trade_status(self, stream):
+        """confirm submitted orders from a StreamClient"""
+        stream.subscribe_trade_status(self._on_trade_status)
+        self.streaming_status = True
 
     def close_trade_only(self, order_id):
         """faster but less secure"""
         trade = self.trade_rec[order_id]
-        self.LOGGER.debug(f"closing trade {order_id}")
+        self.LOGGER.debug("closing trade %s", order_id)
         try:
             response = self.trade_transaction(
                 trade.symbol, 0, 2, trade.volume, order=trade.order_id,
@@ -521,9 +693,10 @@ class Client(BaseClient):
             else:
                 raise
         status = self.trade_transaction_status(response['order'])['requestStatus']
-        self.LOGGER.debug(f"close_trade completed with status of {status}")
+        self.LOGGER.debug("close_trade completed with status of %s", status)
         if status != 3:
             raise TransactionRejected(status)
+        self.trade_rec.pop(order_id, None)
         return response
 
     def close_trade(self, trans):
@@ -532,36 +705,20 @@ class Client(BaseClient):
             order_id = trans.order_id
         else:
             order_id = trans
-        self.update_trades()
+        self._refresh_trades()
         return self.close_trade_only(order_id)
 
     def close_all_trades(self):
         """close all trades"""
-        self.update_trades()
-        self.LOGGER.debug(f"closing {len(self.trade_rec)} trades")
-        trade_ids = self.trade_rec.keys()
+        self._refresh_trades()
+        self.LOGGER.debug("closing %s trades", len(self.trade_rec))
+        trade_ids = list(self.trade_rec.keys())
         for trade_id in trade_ids:
             self.close_trade_only(trade_id)
 
     def get_market_status(self, list_of_symbols):
         """check if market status is open for symbol in symbols"""
-        from pytz import utc
-        gmt_time = datetime.now(tz=utc)
-        gmt_date = gmt_time.date()
-        sec_from_gmt_midnight = 3600*gmt_time.hour + 60*gmt_time.minute + gmt_time.second
-        response = self.get_trading_hours(list_of_symbols)
-        status = {}
-        for res in response:
-            today_market = {'open': mkt for mkt in res['trading'] if mkt['day'] == gmt_date.isoweekday()}
-            if not today_market:
-                status[res['symbol']] = False
-                continue
-            market_open = today_market['open']
-            if market_open['fromT'] <= sec_from_gmt_midnight <= market_open['toT']:
-                status[res['symbol']] = True
-            else:
-                status[res['symbol']] = False
-        return status
+        return self.check_if_market_open(list_of_symbols)
 
 # - next features -
 # TODO: withdraw
@@ -0,0 +1,149 @@
+# -*- coding utf-8 -*-
+
+"""
+XTBApi.async_api
+~~~~~~~
+
+Asyncio client module, commands are pipelined over one websocket
+and matched back to their callers by customTag
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+from websockets.asyncio.client import connect
+from websockets.exceptions import WebSocketException
+from XTBApi.api import BaseClient, STATUS, _get_data, _convert_trading_hours
+from XTBApi import codec
+from XTBApi.exceptions import *
+
+LOGGER = logging.getLogger('XTBApi.async_api')
+
+
+class AsyncClient(BaseClient):
+    """asyncio client with the command surface of BaseClient,
+    every command method returns an awaitable"""
+    # seconds to wait for the response of a command
+    timeout = 30.0
+
+    def __init__(self, limiter=None):
+        super().__init__(limiter)
+        self._pending = {}
+        self._tags = itertools.count(1)
+        self._reader = None
+        self._login_lock = asyncio.Lock()
+        self.LOGGER = logging.getLogger('XTBApi.async_api.AsyncClient')
+
+    async def _read_loop(self, ws):
+        """dispatch responses to the awaiting callers"""
+        try:
+            async for message in ws:
+                res = codec.loads(message)
+                future, _ = self._pending.pop(res.get('customTag'), (None, ws))
+                if future is None:
+                    self.LOGGER.warning("unmatched response: %s", res)
+                elif not future.done():
+                    future.set_result(res)
+        except WebSocketException as e:
+            self.LOGGER.warning("reader stopped (%s)", e)
+        finally:
+            # fail every command still waiting on this socket
+            for tag, (future, future_ws) in list(self._pending.items()):
+                if future_ws is ws:
+                    del self._pending[tag]
+                    if not future.done():
+                        future.set_exception(SocketError())
+
+    async def _send_command(self, dict_data):
+        """send command to api and wait for its tagged response"""
+        delay = await self.limiter.acquire_async()
+        self.LOGGER.debug("waited %s s.", delay)
+        tag = str(next(self._tags))
+        future = asyncio.get_running_loop().create_future()
+        self._pending[tag] = (future, self.ws)
+        start = time.perf_counter()
+        error = True
+        try:
+            try:
+                await self.ws.send(codec.dumps(dict(dict_data, customTag=tag)))
+            except WebSocketException:
+                self._pending.pop(tag, None)
+                self.limiter.throttled()
+                raise SocketError()
+            try:
+                res = await asyncio.wait_for(future, self.timeout)
+            except asyncio.TimeoutError:
+                # lost, or dropped by the broker for exceeding the rate
+                self._pending.pop(tag, None)
+                self.limiter.throttled()
+                raise SocketError()
+            res = self._handle_response(res)
+            error = False
+            return res
+        finally:
+            if self.on_command:
+                self.on_command(dict_data['command'],
+                                time.perf_counter() - start, error)
+
+    async def _send_command_with_check(self, dict_data):
+        """with check login"""
+        if self.status == STATUS.NOT_LOGGED:
+            raise NotLogged()
+        ws = self.ws
+        try:
+            return await self._send_command(dict_data)
+        except SocketError as e:
+            LOGGER.info("re-logging in due to LOGIN_TIMEOUT gone. (%s)", e)
+            await self._relogin(ws)
+            return await self._send_command(dict_data)
+
+    async def _relogin(self, failed_ws):
+        """login again unless another coroutine already did"""
+        async with self._login_lock:
+            if self.ws is failed_ws:
+                await self.login(*self._login_data)
+                if self.on_relogin:
+                    self.on_relogin()
+
+    async def login(self, user_id, password, mode='demo'):
+        """login command"""
+        data = _get_data("login", userId=user_id, password=password)
+        await self._close_socket()
+        self.ws = await connect(self.url.format(mode=mode), max_size=None)
+        self._reader = asyncio.create_task(self._read_loop(self.ws))
+        response = await self._send_command(data)
+        self._login_data = (user_id, password, mode)
+        self.status = STATUS.LOGGED
+        self.LOGGER.info("CMD: login...")
+        return response
+
+    async def logout(self):
+        """logout command"""
+        data = _get_data("logout")
+        response = await self._send_command(data)
+        self.status = STATUS.NOT_LOGGED
+        self.LOGGER.info("CMD: logout...")
+        await self._close_socket()
+        return response
+
+    async def _close_socket(self):
+        if self.ws is not None:
+            await self.ws.close()
+        if self._reader is not None:
+            await self._reader
+            self._reader = None
+
+    async def get_trading_hours(self, trade_position_list):
+        """getTradingHours command"""
+        data = _get_data("getTradingHours", symbols=trade_position_list)
+        self.LOGGER.info("CMD: get trading hours of len %s...",
+                         len(trade_position_list))
+        response = await self._send_command_with_check(data)
+        return _convert_trading_hours(response)
+
+    async def ping(self):
+        """ping command"""
+        data = _get_data("ping")
+        self.LOGGER.info("CMD: get ping...")
+        await self._send_command_with_check(data)
@@ -0,0 +1,32 @@
+# -*- coding utf-8 -*-
+
+"""
+XTBApi.codec
+~~~~~~~
+
+JSON codec module, uses orjson or ujson when installed
+and falls back to the standard library
+"""
+
+import json
+
+try:
+    import orjson
+
+    def dumps(obj):
+        """encode to str, websocket frames must be text"""
+        return orjson.dumps(obj).decode()
+
+    loads = orjson.loads
+    NAME = 'orjson'
+except ImportError:
+    try:
+        import ujson
+
+        dumps = ujson.dumps
+        loads = ujson.loads
+        NAME = 'ujson'
+    except ImportError:
+        dumps = json.dumps
+        loads = json.loads
+        NAME = 'json'
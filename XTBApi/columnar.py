@@ -0,0 +1,126 @@
+# -*- coding utf-8 -*-
+
+"""
+XTBApi.columnar
+~~~~~~~
+
+Columnar chart data module, needs numpy
+"""
+
+from datetime import datetime
+
+import numpy as np
+
+from XTBApi.trading_hours import SERVER_TZ
+
+# raw rateInfos fields: open in points, close/high/low as deltas from open
+CANDLE_DTYPE = np.dtype([
+    ('ctm', np.int64),
+    ('open', np.float64),
+    ('close', np.float64),
+    ('high', np.float64),
+    ('low', np.float64),
+    ('vol', np.float64),
+])
+
+
+def format_ctm(ctm):
+    """ctmString of a ctm (ms), in server time as the broker sends it"""
+    return datetime.fromtimestamp(ctm / 1000, SERVER_TZ).strftime('%b %d, %Y, %I:%M:%S %p')
+
+
+class CandleBlock(object):
+    """chart data as one structured array plus the ctmString column"""
+    __slots__ = ('data', 'ctm_string', 'digits')
+
+    def __init__(self, data, ctm_string, digits):
+        self.data = data
+        self.ctm_string = ctm_string
+        self.digits = digits
+
+    @classmethod
+    def from_rate_infos(cls, rate_infos, digits):
+        """build from the rateInfos list of a chart response"""
+        data = np.array([
+            (c['ctm'], c['open'], c['close'], c['high'], c['low'], c['vol'])
+            for c in rate_infos
+        ], dtype=CANDLE_DTYPE)
+        return cls(data, [c['ctmString'] for c in rate_infos], digits)
+
+    @classmethod
+    def empty(cls, digits=0):
+        return cls(np.empty(0, dtype=CANDLE_DTYPE), [], digits)
+
+    @classmethod
+    def concat(cls, blocks):
+        blocks = [b for b in blocks if len(b)]
+        if not blocks:
+            return cls.empty()
+        return cls(np.concatenate([b.data for b in blocks]),
+                   [s for b in blocks for s in b.ctm_string], blocks[0].digits)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, field):
+        return self.data[field]
+
+    @property
+    def ctm(self):
+        return self.data['ctm']
+
+    def decoded(self):
+        """prices in base currency, timestamps in seconds"""
+        scale = 10.0 ** self.digits
+        _open = self.data['open']
+        return {
+            'timestamp': self.data['ctm'] / 1000,
+            'open': _open / scale,
+            'close': (_open + self.data['close']) / scale,
+            'high': (_open + self.data['high']) / scale,
+            'low': (_open + self.data['low']) / scale,
+            'volume': self.data['vol'].copy(),
+        }
+
+    def to_rate_infos(self):
+        """back to the rateInfos list of dicts"""
+        return [
+            {'ctm': ctm, 'ctmString': ctm_string, 'open': _open,
+             'close': close, 'high': high, 'low': low, 'vol': vol}
+            for ctm, ctm_string, _open, close, high, low, vol in zip(
+                self.data['ctm'].tolist(), self.ctm_string,
+                self.data['open'].tolist(), self.data['close'].tolist(),
+                self.data['high'].tolist(), self.data['low'].tolist(),
+                self.data['vol'].tolist())
+        ]
+
+    def closed(self, period, until):
+        """the candles of `period` minutes closed by `until` (ms), time ordered"""
+        n = int(np.searchsorted(self.data['ctm'] + period * 60000, until, side='right'))
+        return CandleBlock(self.data[:n], self.ctm_string[:n], self.digits)
+
+    def resample(self, period, until=None):
+        """aggregate to a higher period (minutes), a multiple of this one.
+        Bars start at multiples of the period since the epoch; with `until`
+        (ms) bars not closed by then are left out."""
+        if not len(self):
+            return CandleBlock.empty(self.digits)
+        span = period * 60000
+        ctm = self.data['ctm']
+        _open = self.data['open']
+        bucket = ctm - ctm % span
+        starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+        ends = np.r_[starts[1:], len(ctm)] - 1
+        data = np.empty(len(starts), dtype=CANDLE_DTYPE)
+        data['ctm'] = bucket[starts]
+        data['open'] = _open[starts]
+        data['close'] = (_open + self.data['close'])[ends] - data['open']
+        data['high'] = np.maximum.reduceat(_open + self.data['high'], starts) - data['open']
+        data['low'] = np.minimum.reduceat(_open + self.data['low'], starts) - data['open']
+        data['vol'] = np.add.reduceat(self.data['vol'], starts)
+        # the first candle of a bucket need not be at its start
+        ctm_string = [format_ctm(ctm) for ctm in data['ctm'].tolist()]
+        if until is not None:
+            closed = int(np.searchsorted(data['ctm'] + span, until, side='right'))
+            data, ctm_string = data[:closed], ctm_string[:closed]
+        return CandleBlock(data, ctm_string, self.digits)
@@ -0,0 +1,105 @@
+# -*- coding utf-8 -*-
+
+"""
+XTBApi.limiter
+~~~~~~~
+
+Request rate limiter module
+"""
+
+import asyncio
+import threading
+import time
+import logging
+
+LOGGER = logging.getLogger('XTBApi.limiter')
+
+
+class TokenBucket(object):
+    """token bucket of rate requests/s with burst capacity,
+    can be shared between threads, coroutines and client instances.
+    The rate halves on throttled() and recovers on success()"""
+    def __init__(self, rate, burst=1, min_rate=None, recover_after=20):
+        self.base_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate or rate / 16
+        self.recover_after = recover_after
+        self._tokens = burst
+        self._stamp = time.monotonic()
+        self._streak = 0
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.backoffs = 0
+
+    def _refill(self, now):
+        self._tokens = min(self.burst,
+                           self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def reserve(self):
+        """take a token, going in debt if needed
+        return seconds to wait before using it"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= 1
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.requests += 1
+            if delay > 0:
+                self.waits += 1
+                self.wait_seconds += delay
+        return delay
+
+    def acquire(self):
+        """block until a token is available"""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    async def acquire_async(self):
+        """wait in the event loop until a token is available"""
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+    def throttled(self):
+        """broker refused or dropped a request, slow down"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, 0)
+            self._streak = 0
+            self.backoffs += 1
+        LOGGER.warning("throttled, rate down to %.2f/s", self.rate)
+
+    def success(self):
+        """request went through, creep back to the base rate"""
+        if self.rate >= self.base_rate:
+            return
+        with self._lock:
+            self._streak += 1
+            if self._streak >= self.recover_after:
+                self._refill(time.monotonic())
+                self.rate = min(self.base_rate, self.rate * 2)
+                self._streak = 0
+                LOGGER.info("rate recovered to %.2f/s", self.rate)
+
+    def stats(self):
+        return {
+            'rate': self.rate,
+            'requests': self.requests,
+            'waits': self.waits,
+            'wait_seconds': self.wait_seconds,
+            'backoffs': self.backoffs,
+        }
+
+
+class RateLimiter(TokenBucket):
+    """keep a minimum interval between requests"""
+    def __init__(self, interval, **kwargs):
+        super().__init__(1 / interval, burst=1, **kwargs)
+        self.interval = interval
@@ -0,0 +1,290 @@
+# -*- coding utf-8 -*-
+
+"""
+XTBApi.mock_server
+~~~~~~~
+
+Local stand-in for the XTB websocket API, for offline tests and benchmarks.
+Serves synthetic candles and in-memory trades with configurable latency,
+throttling and error injection.
+
+    python -m XTBApi.mock_server --port 8765 --latency 0.005
+    XTB_WS_URL=ws://localhost:8765/{mode} python candles.py
+"""
+
+import argparse
+import itertools
+import random
+import threading
+import time
+import zlib
+import logging
+from websockets.sync.server import serve
+from websockets.exceptions import WebSocketException
+from XTBApi import codec, setup_logging
+
+LOGGER = logging.getLogger('XTBApi.mock_server')
+
+# symbol: (digits, base price)
+DEFAULT_SYMBOLS = {
+    'GOLD': (2, 1950.0),
+    'GOLD.FUT': (2, 1960.0),
+    'OIL.WTI': (2, 78.0),
+    'USDJPY': (3, 149.5),
+    'EURUSD': (5, 1.08),
+    'BITCOIN': (2, 37000.0),
+}
+# Monday to Friday, all day, in ms from midnight
+DEFAULT_HOURS = [{'day': day, 'fromT': 0, 'toT': 86400000} for day in range(1, 6)]
+MAX_CANDLES = 50000
+
+
+def _seed(symbol):
+    return zlib.crc32(symbol.encode())
+
+
+def _error(code, descr):
+    return {'status': False, 'errorCode': code, 'errorDescr': descr}
+
+
+class MockServer(object):
+    """XTB protocol stand-in
+
+    latency: seconds added before every response
+    min_interval: requests closer than this on one connection are throttled,
+        answered with throttle_code or dropped if drop_on_throttle
+    error_rate: share of commands answered with error_code
+    order_status: requestStatus answered by tradeTransactionStatus,
+        1 (pending) leaves orders to be confirmed otherwise
+    on_transaction: called with the order id before tradeTransaction returns
+    """
+    def __init__(self, host='localhost', port=0, latency=0.0,
+                 min_interval=0.0, drop_on_throttle=False,
+                 throttle_code='EX008', error_rate=0.0, error_code='EX001',
+                 symbols=None, trading_hours=None, seed=0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.min_interval = min_interval
+        self.drop_on_throttle = drop_on_throttle
+        self.throttle_code = throttle_code
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.symbols = symbols or DEFAULT_SYMBOLS
+        self.trading_hours = trading_hours or DEFAULT_HOURS
+        self.requests = {}
+        self.trades = {}
+        self.order_status = 3
+        self.on_transaction = None
+        self._orders = itertools.count(1000)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        """client url template, as XTBApi.api.WS_URL"""
+        return f"ws://{self.host}:{self.port}/{{mode}}"
+
+    def start(self):
+        self._server = serve(self._handler, self.host, self.port)
+        self.port = self._server.socket.getsockname()[1]
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name='xtb-mock', daemon=True)
+        self._thread.start()
+        LOGGER.info("mock server on %s", self.url)
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _handler(self, ws):
+        last_request = 0.0
+        try:
+            for message in ws:
+                req = codec.loads(message)
+                now = time.monotonic()
+                throttled = now - last_request < self.min_interval
+                last_request = now
+                with self._lock:
+                    command = req.get('command')
+                    self.requests[command] = self.requests.get(command, 0) + 1
+                if throttled and self.drop_on_throttle:
+                    ws.close()
+                    return
+                if self.latency:
+                    time.sleep(self.latency)
+                if throttled:
+                    res = _error(self.throttle_code, 'Request limit exceeded')
+                else:
+                    res = self.respond(req)
+                if 'customTag' in req:
+                    res['customTag'] = req['customTag']
+                ws.send(codec.dumps(res))
+        except WebSocketException:
+            pass
+
+    def respond(self, req):
+        """response document for one request"""
+        command = req.get('command')
+        if command != 'login' and self.error_rate and \
+                self._random.random() < self.error_rate:
+            return _error(self.error_code, 'Injected error')
+        handler = getattr(self, f'_cmd_{command}', None)
+        if handler is None:
+            return _error('EX000', f'Unsupported command {command}')
+        try:
+            return handler(**req.get('arguments', {}))
+        except KeyError as e:
+            return _error('BE005', f'Unknown symbol {e}')
+
+    # - commands -
+    def _cmd_login(self, userId, password, **_):
+        return {'status': True, 'streamSessionId': f'mock-{userId}'}
+
+    def _cmd_logout(self):
+        return {'status': True}
+
+    def _cmd_ping(self):
+        return {'status': True}
+
+    def _cmd_getServerTime(self):
+        now = time.time()
+        return {'status': True, 'returnData': {
+            'time': int(now * 1000),
+            'timeString': time.strftime('%b %d, %Y, %I:%M:%S %p', time.gmtime(now))}}
+
+    def _cmd_getSymbol(self, symbol):
+        digits, base = self.symbols[symbol]
+        price = self._price(symbol, int(time.time()))
+        spread = 10 ** -digits * 20
+        return {'status': True, 'returnData': {
+            'symbol': symbol, 'precision': digits, 'ask': price + spread,
+            'bid': price, 'contractSize': 100, 'lotMin': 0.01, 'lotStep': 0.01,
+            'lotMax': 100.0, 'time': int(time.time() * 1000)}}
+
+    def _cmd_getMarginTrade(self, symbol, volume):
+        price = self._price(symbol, int(time.time()))
+        return {'status': True, 'returnData': {
+            'margin': round(price * 100 * volume * 0.05, 2)}}
+
+    def _cmd_getCommissionDef(self, symbol, volume):
+        self.symbols[symbol]  # unknown symbol: BE005
+        return {'status': True, 'returnData': {
+            'commission': 0.0, 'rateOfExchange': 1.0}}
+
+    def _cmd_getTradingHours(self, symbols):
+        return {'status': True, 'returnData': [
+            {'symbol': symbol,
+             'trading': [dict(day) for day in self.trading_hours],
+             'quotes': [dict(day) for day in self.trading_hours]}
+            for symbol in symbols]}
+
+    def _cmd_getChartRangeRequest(self, info):
+        return self._chart(info['symbol'], info['period'], info['start'],
+                           info['end'], info.get('ticks', 0))
+
+    def _cmd_getChartLastRequest(self, info):
+        return self._chart(info['symbol'], info['period'], info['start'],
+                           int(time.time() * 1000), 0)
+
+    def _cmd_getTrades(self, openedOnly=True):
+        return {'status': True, 'returnData': list(self.trades.values())}
+
+    def _cmd_tradeTransaction(self, tradeTransInfo):
+        info = tradeTransInfo
+        order = next(self._orders)
+        if info['type'] == 2:
+            self.trades.pop(info.get('order'), None)
+        else:
+            self.trades[order] = {
+                'order': order, 'position': order, 'cmd': info['cmd'],
+                'symbol': info['symbol'], 'volume': info['volume'],
+                'open_price': info['price'], 'close_price': info['price'],
+                'sl': info.get('sl', 0), 'tp': info.get('tp', 0),
+                'profit': 0.0, 'open_time': int(time.time() * 1000),
+                'closed': False}
+        if self.on_transaction is not None:
+            self.on_transaction(order)
+        return {'status': True, 'returnData': {'order': order}}
+
+    def _cmd_tradeTransactionStatus(self, order):
+        return {'status': True, 'returnData': {
+            'order': order, 'requestStatus': self.order_status, 'message': None,
+            'ask': 0.0, 'bid': 0.0, 'customComment': ''}}
+
+    # - synthetic data -
+    def _price(self, symbol, seconds):
+        """deterministic smooth price walk"""
+        digits, base = self.symbols[symbol]
+        step = (_seed(symbol) % 1000) / 1000
+        return round(base * (1 + 0.01 * ((seconds // 60 * 7919 + step * 1e6)
+                                         % 1000 / 1000 - 0.5)), digits)
+
+    def _chart(self, symbol, period, start, end, ticks):
+        digits, _ = self.symbols[symbol]
+        span = period * 60000
+        now = int(time.time() * 1000)
+        if ticks < 0:
+            last = min(start, now) // span * span
+            first = last + (ticks + 1) * span
+        elif ticks > 0:
+            first = -(-start // span) * span
+            last = min(first + (ticks - 1) * span, now // span * span)
+        else:
+            first = -(-start // span) * span
+            last = min(end, now) // span * span
+        first = max(first, last - (MAX_CANDLES - 1) * span)
+        scale = 10 ** digits
+        rate_infos = []
+        for ctm in range(first, last + 1, span):
+            seed = (ctm // span * 2654435761 + _seed(symbol)) % 4294967296
+            _open = round(self._price(symbol, ctm // 1000) * scale)
+            move = seed % 41 - 20
+            rate_infos.append({
+                'ctm': ctm,
+                'ctmString': time.strftime('%b %d, %Y, %I:%M:%S %p',
+                                           time.gmtime(ctm / 1000)),
+                'open': float(_open),
+                'close': float(move),
+                'high': float(max(move, 0) + seed % 7),
+                'low': float(min(move, 0) - seed % 5),
+                'vol': float(seed % 500),
+            })
+        return {'status': True, 'returnData': {'digits': digits,
+                                               'rateInfos': rate_infos}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--min-interval', type=float, default=0.0)
+    parser.add_argument('--drop-on-throttle', action='store_true')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    setup_logging()
+    server = MockServer(args.host, args.port, latency=args.latency,
+                        min_interval=args.min_interval,
+                        drop_on_throttle=args.drop_on_throttle,
+                        error_rate=args.error_rate).start()
+    LOGGER.info("XTB mock server listening, XTB_WS_URL=%s", server.url)
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
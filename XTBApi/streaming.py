@@ -0,0 +1,146 @@
+# -*- coding utf-8 -*-
+
+"""
+XTBApi.streaming
+~~~~~~~
+
+Streaming session module
+"""
+
+import os
+import threading
+import time
+import logging
+from websockets.sync.client import connect
+from websockets.exceptions import WebSocketException
+from XTBApi import codec
+from XTBApi.exceptions import *
+
+LOGGER = logging.getLogger('XTBApi.streaming')
+PING_INTERVAL = 10
+# override with XTB_STREAM_URL
+STREAM_URL = "wss://ws.xtb.com/{mode}Stream"
+
+
+class StreamClient(object):
+    """streaming client, needs the streamSessionId of a logged client
+    and pushes every received record to the subscribed callbacks"""
+    def __init__(self, stream_session_id, mode='demo'):
+        self.stream_session_id = stream_session_id
+        self.mode = mode
+        self.url = os.getenv("XTB_STREAM_URL", STREAM_URL)
+        self.ws = None
+        self._callbacks = {}
+        self._subscriptions = []
+        self._thread = None
+        self._running = threading.Event()
+        self._lock = threading.Lock()
+        self.LOGGER = logging.getLogger('XTBApi.streaming.StreamClient')
+
+    def _send(self, command, **arguments):
+        data = dict(command=command, streamSessionId=self.stream_session_id,
+                    **arguments)
+        with self._lock:
+            try:
+                self.ws.send(codec.dumps(data))
+            except WebSocketException:
+                raise SocketError()
+
+    def _subscribe(self, command, record, callback, **arguments):
+        self._callbacks.setdefault(record, []).append(callback)
+        self._subscriptions.append((command, arguments))
+        if self.ws is not None:
+            self._send(command, **arguments)
+        self.LOGGER.info("CMD: %s %s...", command, arguments)
+
+    def subscribe_candles(self, symbol, callback):
+        """getCandles command
+        callback receives every closed 1 minute candle"""
+        self._subscribe("getCandles", "candle", callback, symbol=symbol)
+
+    def subscribe_tick_prices(self, symbol, callback, min_arrival_time=0,
+                              max_level=0):
+        """getTickPrices command"""
+        self._subscribe("getTickPrices", "tickPrices", callback,
+                        symbol=symbol, minArrivalTime=min_arrival_time,
+                        maxLevel=max_level)
+
+    def subscribe_trades(self, callback):
+        """getTrades command
+        callback receives every trade opened, changed or closed"""
+        self._subscribe("getTrades", "trade", callback)
+
+    def subscribe_trade_status(self, callback):
+        """getTradeStatus command"""
+        self._subscribe("getTradeStatus", "tradeStatus", callback)
+
+    def subscribe_profits(self, callback):
+        """getProfits command"""
+        self._subscribe("getProfits", "profit", callback)
+
+    def connect(self):
+        """open the stream socket and replay subscriptions"""
+        self.ws = connect(self.url.format(mode=self.mode))
+        for command, arguments in self._subscriptions:
+            self._send(command, **arguments)
+        self.LOGGER.info("stream connected")
+
+    def set_session(self, stream_session_id):
+        """switch to the streamSessionId of a new login, reconnecting and
+        replaying the subscriptions"""
+        if stream_session_id == self.stream_session_id:
+            return
+        self.stream_session_id = stream_session_id
+        if self.ws is None:
+            return
+        self.LOGGER.info("stream session changed, reconnecting")
+        self.ws.close()
+        # a running read loop reconnects on its own
+        if self._thread is None:
+            self.connect()
+
+    def start(self):
+        """connect and read records in a background thread"""
+        self.connect()
+        self._running.set()
+        self._thread = threading.Thread(target=self._read_loop,
+                                        name='xtb-stream', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running.clear()
+        if self.ws is not None:
+            self.ws.close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.LOGGER.info("stream stopped")
+
+    def _read_loop(self):
+        last_ping = time.monotonic()
+        while self._running.is_set():
+            try:
+                if time.monotonic() - last_ping > PING_INTERVAL:
+                    self._send("ping")
+                    last_ping = time.monotonic()
+                message = self.ws.recv(timeout=PING_INTERVAL)
+            except TimeoutError:
+                continue
+            except (WebSocketException, SocketError) as e:
+                if not self._running.is_set():
+                    break
+                self.LOGGER.warning("stream lost, reconnecting (%s)", e)
+                time.sleep(1)
+                try:
+                    self.connect()
+                except (OSError, WebSocketException, SocketError) as e:
+                    self.LOGGER.error("stream reconnect failed (%s)", e)
+                continue
+            self._dispatch(codec.loads(message))
+
+    def _dispatch(self, record):
+        for callback in self._callbacks.get(record.get('command'), []):
+            try:
+                callback(record['data'])
+            except Exception as e:
+                self.LOGGER.exception("stream callback failed (%s)", e)
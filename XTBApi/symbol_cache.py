@@ -0,0 +1,118 @@
+# -*- coding utf-8 -*-
+
+"""
+XTBApi.symbol_cache
+~~~~~~~
+
+Symbol metadata and quote cache
+"""
+
+import threading
+import time
+import logging
+
+LOGGER = logging.getLogger('XTBApi.symbol_cache')
+QUOTE_FIELDS = ('ask', 'bid', 'high', 'low', 'spreadRaw', 'spreadTable',
+                'time', 'timeString')
+
+
+class SymbolCache(object):
+    """getSymbol records by symbol.
+
+    Static fields (precision, contractSize, lotStep, ...) are kept for
+    static_ttl seconds, quotes for quote_ttl seconds, or stream_ttl
+    seconds after the last tick of a price stream feeding on_tick().
+    fetch is called with a symbol and returns its getSymbol record,
+    e.g. Client.get_symbol"""
+    def __init__(self, fetch, static_ttl=86400, quote_ttl=1.0, stream_ttl=30.0):
+        self.fetch = fetch
+        self.static_ttl = static_ttl
+        self.quote_ttl = quote_ttl
+        self.stream_ttl = stream_ttl
+        self._records = {}
+        self._loaded = {}
+        self._quoted = {}
+        self._streamed = set()
+        self._memo = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self, symbol, now):
+        record = self.fetch(symbol)
+        with self._lock:
+            self.misses += 1
+            self._records[symbol] = dict(record)
+            self._loaded[symbol] = self._quoted[symbol] = now
+        return dict(record)
+
+    def get(self, symbol):
+        """record with a fresh quote"""
+        now = time.monotonic()
+        with self._lock:
+            ttl = self.stream_ttl if symbol in self._streamed else self.quote_ttl
+            if now - self._loaded.get(symbol, -self.static_ttl) < self.static_ttl and \
+                    now - self._quoted.get(symbol, -ttl) < ttl:
+                self.hits += 1
+                return dict(self._records[symbol])
+        return self._load(symbol, now)
+
+    def static(self, symbol):
+        """record whose quote fields may be stale"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._loaded.get(symbol, -self.static_ttl) < self.static_ttl:
+                self.hits += 1
+                return dict(self._records[symbol])
+        return self._load(symbol, now)
+
+    def memo(self, key, fetch, ttl=None):
+        """result of fetch() cached under key, a (kind, symbol, ...) tuple,
+        for ttl (default quote_ttl). For quote dependent requests like
+        margin and commission"""
+        ttl = self.quote_ttl if ttl is None else ttl
+        now = time.monotonic()
+        with self._lock:
+            stamp, value = self._memo.get(key, (None, None))
+            if stamp is not None and now - stamp < ttl:
+                self.hits += 1
+                return value
+        value = fetch()
+        with self._lock:
+            self.misses += 1
+            self._memo[key] = (now, value)
+        return value
+
+    def on_tick(self, tick):
+        """StreamClient tickPrices callback, keeps the quote fresh"""
+        if tick.get('level', 0) != 0:
+            return
+        symbol = tick['symbol']
+        with self._lock:
+            record = self._records.get(symbol)
+            if record is None:
+                return
+            record.update((k, tick[k]) for k in QUOTE_FIELDS if k in tick)
+            if 'timestamp' in tick:
+                record['time'] = tick['timestamp']
+            self._quoted[symbol] = time.monotonic()
+            self._streamed.add(symbol)
+
+    def invalidate(self, symbol=None):
+        """drop one symbol, or everything"""
+        with self._lock:
+            if symbol is None:
+                self._loaded.clear()
+                self._quoted.clear()
+                self._streamed.clear()
+                self._memo.clear()
+            else:
+                self._loaded.pop(symbol, None)
+                self._quoted.pop(symbol, None)
+                self._streamed.discard(symbol)
+                self._memo = {k: v for k, v in self._memo.items()
+                              if k[1] != symbol}
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'symbols': len(self._records)}
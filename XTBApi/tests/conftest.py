@@ -0,0 +1,28 @@
+"""
+tests.conftest.py
+~~~~~~~
+
+shared fixtures
+"""
+
+import pytest
+
+from XTBApi.mock_server import MockServer
+
+
+@pytest.fixture
+def mock_server():
+    """local XTB stand-in, point clients at it with client.url = mock_server.url"""
+    with MockServer() as server:
+        yield server
+
+
+@pytest.fixture
+def client(mock_server):
+    """Client logged in to mock_server"""
+    from XTBApi.api import Client
+    client = Client()
+    client.url = mock_server.url
+    client.login('user', 'pass')
+    yield client
+    client.logout()
@@ -0,0 +1,72 @@
+"""
+tests.test_async_api.py
+~~~~~~~
+
+test the pipelined asyncio client against the local XTB stand-in
+"""
+
+import asyncio
+import logging
+
+import pytest
+
+from XTBApi.async_api import AsyncClient
+from XTBApi.exceptions import CommandFailed, SocketError
+from XTBApi.limiter import RateLimiter
+
+LOGGER = logging.getLogger('XTBApi.test_async_api')
+
+
+async def _login(server):
+    client = AsyncClient(RateLimiter(0.001))
+    client.url = server.url
+    await client.login('mock', 'mock')
+    return client
+
+
+def test_responses_matched_by_tag(mock_server):
+    async def _run():
+        client = await _login(mock_server)
+        symbols = ['GOLD', 'EURUSD', 'USDJPY']
+        res = await asyncio.gather(*[client.get_symbol(s) for s in symbols],
+                                   client.get_server_time(), return_exceptions=True)
+        await client.logout()
+        return symbols, res
+
+    symbols, res = asyncio.run(_run())
+    assert [r['symbol'] for r in res[:3]] == symbols
+    assert 'time' in res[3]
+    LOGGER.debug("passed")
+
+
+def test_command_failed(mock_server):
+    async def _run():
+        client = await _login(mock_server)
+        with pytest.raises(CommandFailed):
+            await client.get_symbol('UNKNOWN')
+        # the pipeline keeps working
+        res = await client.get_symbol('GOLD')
+        await client.logout()
+        return res
+
+    assert asyncio.run(_run())['symbol'] == 'GOLD'
+    LOGGER.debug("passed")
+
+
+def test_response_timeout(mock_server):
+    async def _run():
+        client = await _login(mock_server)
+        client.timeout = 0.1
+        mock_server.latency = 0.3
+        with pytest.raises(SocketError):
+            await client.get_server_time()
+        assert client.limiter.stats()['backoffs'] >= 1
+        # late responses are dropped, later commands still match
+        mock_server.latency = 0.0
+        await asyncio.sleep(0.7)
+        res = await client.get_symbol('GOLD')
+        await client.logout()
+        return res
+
+    assert asyncio.run(_run())['symbol'] == 'GOLD'
+    LOGGER.debug("passed")
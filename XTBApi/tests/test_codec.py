@@ -0,0 +1,25 @@
+"""
+tests.test_codec.py
+~~~~~~~
+
+test the json codec
+"""
+
+import json
+import logging
+
+from XTBApi import codec
+
+LOGGER = logging.getLogger('XTBApi.test_codec')
+
+
+def test_round_trip():
+    data = {"command": "getChartRangeRequest",
+            "arguments": {"info": {"symbol": "EURUSD", "period": 5,
+                                   "start": 1700000000000, "ticks": -300}}}
+    text = codec.dumps(data)
+    assert isinstance(text, str)
+    assert json.loads(text) == data
+    assert codec.loads(text) == data
+    assert codec.loads(text.encode()) == data
+    LOGGER.debug("passed with %s", codec.NAME)
@@ -0,0 +1,63 @@
+"""
+tests.test_columnar.py
+~~~~~~~
+
+test the columnar chart data
+"""
+
+import logging
+
+from XTBApi.columnar import CandleBlock, format_ctm
+
+LOGGER = logging.getLogger('XTBApi.test_columnar')
+
+RATE_INFOS = [
+    {'ctm': 1700000000000 + i * 300000, 'ctmString': f'candle {i}',
+     'open': 185012.0 + i, 'close': 12.0, 'high': 20.0, 'low': -7.0,
+     'vol': 431.0}
+    for i in range(5)
+]
+
+
+def test_decoded():
+    block = CandleBlock.from_rate_infos(RATE_INFOS, 2)
+    decoded = block.decoded()
+    for i, candle in enumerate(RATE_INFOS):
+        _pr = candle['open']
+        assert decoded['open'][i] == _pr / 10 ** 2
+        assert decoded['close'][i] == (_pr + candle['close']) / 10 ** 2
+        assert decoded['high'][i] == (_pr + candle['high']) / 10 ** 2
+        assert decoded['low'][i] == (_pr + candle['low']) / 10 ** 2
+        assert decoded['timestamp'][i] == candle['ctm'] / 1000
+    LOGGER.debug("passed")
+
+
+def test_round_trip():
+    block = CandleBlock.from_rate_infos(RATE_INFOS, 2)
+    assert block.to_rate_infos() == RATE_INFOS
+    both = CandleBlock.concat([block, CandleBlock.empty(), block])
+    assert len(both) == 2 * len(RATE_INFOS)
+    assert both.ctm_string[len(RATE_INFOS)] == 'candle 0'
+    LOGGER.debug("passed")
+
+
+def test_resample():
+    # 5 minute candles from a 15 minute boundary: bars of 3 and 2 candles
+    rate_infos = [dict(c, ctm=1699999200000 + i * 300000)
+                  for i, c in enumerate(RATE_INFOS)]
+    block = CandleBlock.from_rate_infos(rate_infos, 2)
+    bars = block.resample(15)
+    assert bars.ctm.tolist() == [1699999200000, 1700000100000]
+    first, second = bars.to_rate_infos()
+    assert first['open'] == 185012.0 and first['vol'] == 3 * 431.0
+    assert first['close'] == 185014.0 + 12.0 - 185012.0
+    assert first['high'] == 185014.0 + 20.0 - 185012.0
+    assert first['low'] == -7.0
+    assert second['ctmString'] == 'Nov 14, 2023, 11:15:00 PM' and second['vol'] == 2 * 431.0
+    # bars missing their first candle still carry the bucket time
+    partial = CandleBlock.from_rate_infos(rate_infos[1:], 2).resample(15)
+    assert partial.ctm_string[0] == format_ctm(1699999200000) == 'Nov 14, 2023, 11:00:00 PM'
+    # the second bar closes at 1700001000000
+    assert len(block.resample(15, until=1700000999999)) == 1
+    assert len(block.resample(15, until=1700001000000)) == 2
+    LOGGER.debug("passed")
@@ -0,0 +1,62 @@
+"""
+tests.test_limiter.py
+~~~~~~~
+
+test the request rate limiter
+"""
+
+import logging
+import threading
+import time
+
+from XTBApi.limiter import RateLimiter, TokenBucket
+
+LOGGER = logging.getLogger('XTBApi.test_limiter')
+
+
+def test_reserve_spacing():
+    limiter = RateLimiter(0.1)
+    delays = [limiter.reserve() for _ in range(3)]
+    assert delays[0] == 0
+    assert abs(delays[1] - 0.1) < 0.01
+    assert abs(delays[2] - 0.2) < 0.01
+    LOGGER.debug("passed")
+
+
+def test_shared_between_threads():
+    limiter = RateLimiter(0.05)
+    stamps = []
+
+    def _worker():
+        limiter.acquire()
+        stamps.append(time.monotonic())
+
+    threads = [threading.Thread(target=_worker) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stamps.sort()
+    gaps = [b - a for a, b in zip(stamps, stamps[1:])]
+    assert min(gaps) > 0.04
+    LOGGER.debug("passed")
+
+
+def test_burst():
+    bucket = TokenBucket(10, burst=3)
+    delays = [bucket.reserve() for _ in range(4)]
+    assert delays[:3] == [0, 0, 0]
+    assert abs(delays[3] - 0.1) < 0.01
+    assert bucket.stats()['waits'] == 1
+    LOGGER.debug("passed")
+
+
+def test_backoff_and_recover():
+    bucket = TokenBucket(10, recover_after=2)
+    bucket.throttled()
+    assert bucket.rate == 5
+    assert bucket.stats()['backoffs'] == 1
+    bucket.success()
+    bucket.success()
+    assert bucket.rate == 10
+    LOGGER.debug("passed")
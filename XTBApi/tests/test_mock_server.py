@@ -0,0 +1,117 @@
+"""
+tests.test_mock_server.py
+~~~~~~~
+
+test the clients against the local XTB stand-in
+"""
+
+import asyncio
+import logging
+import time
+
+import pytest
+from websockets.protocol import State
+
+from XTBApi.api import STATUS, BaseClient, Client
+from XTBApi.async_api import AsyncClient
+from XTBApi.exceptions import CommandFailed
+from XTBApi.limiter import RateLimiter
+
+LOGGER = logging.getLogger('XTBApi.test_mock_server')
+
+DEFAULT_CURRENCY = 'EURUSD'
+
+
+def _login(client, server):
+    client.url = server.url
+    client.login('mock', 'mock')
+    assert client.stream_session_id == 'mock-mock'
+    return client
+
+
+def test_chart_range_request(mock_server):
+    client = _login(BaseClient(), mock_server)
+    now = int(time.time())
+    res = client.get_chart_range_request(DEFAULT_CURRENCY, 5, now, now, -300)
+    assert res['digits'] == 5
+    assert len(res['rateInfos']) == 300
+    ctms = [c['ctm'] for c in res['rateInfos']]
+    assert ctms == sorted(ctms) and ctms[1] - ctms[0] == 300000
+    res = client.get_chart_range_request(DEFAULT_CURRENCY, 60, now - 3600 * 10, now, 0)
+    assert 10 <= len(res['rateInfos']) <= 11
+    client.logout()
+    LOGGER.debug("passed")
+
+
+def test_trading_hours(mock_server):
+    client = _login(BaseClient(), mock_server)
+    res = client.get_trading_hours([DEFAULT_CURRENCY])
+    assert res[0]['trading'][0]['toT'] == 86400
+    LOGGER.debug("passed")
+
+
+def test_trade_round_trip(mock_server):
+    client = _login(Client(), mock_server)
+    response = client.open_trade('buy', DEFAULT_CURRENCY, 0.1, rate_tp=0.01)
+    assert response['order'] in client.trade_rec
+    client.close_all_trades()
+    assert client.update_trades() == {}
+    LOGGER.debug("passed")
+
+
+def test_injected_error(mock_server):
+    client = _login(BaseClient(), mock_server)
+    mock_server.error_rate = 1.0
+    with pytest.raises(CommandFailed):
+        client.get_symbol(DEFAULT_CURRENCY)
+    LOGGER.debug("passed")
+
+
+def test_throttle_error_no_relogin(mock_server):
+    client = _login(BaseClient(), mock_server)
+    mock_server.error_rate = 1.0
+    mock_server.error_code = 'EX009'
+    rate = client.limiter.rate
+    with pytest.raises(CommandFailed):
+        client.get_symbol(DEFAULT_CURRENCY)
+    # backed off, not logged in again and retried at once
+    assert client.limiter.rate < rate
+    assert mock_server.requests['login'] == 1
+    assert mock_server.requests['getSymbol'] == 1
+    LOGGER.debug("passed")
+
+
+def test_relogin_closes_socket(mock_server):
+    client = _login(BaseClient(), mock_server)
+    ws = client.ws
+    client.login('mock', 'mock')
+    assert ws.state is State.CLOSED and client.ws is not ws
+    client.logout()
+    assert client.ws.state is State.CLOSED and client.status is STATUS.NOT_LOGGED
+    LOGGER.debug("passed")
+
+
+def test_throttling_backs_off(mock_server):
+    mock_server.min_interval = 0.05
+    client = _login(BaseClient(RateLimiter(0.01)), mock_server)
+    rate = client.limiter.rate
+    with pytest.raises(CommandFailed):
+        for _ in range(5):
+            client.get_server_time()
+    assert client.limiter.rate < rate
+    LOGGER.debug("passed")
+
+
+def test_async_pipelining(mock_server):
+    async def _run():
+        client = AsyncClient(RateLimiter(0.001))
+        client.url = mock_server.url
+        await client.login('mock', 'mock')
+        symbols = list(mock_server.symbols)
+        res = await asyncio.gather(*[client.get_symbol(s) for s in symbols])
+        await client.logout()
+        return symbols, res
+
+    symbols, res = asyncio.run(_run())
+    assert [r['symbol'] for r in res] == symbols
+    LOGGER.debug("passed")
@@ -0,0 +1,53 @@
+"""
+tests.test_symbol_cache.py
+~~~~~~~
+
+test the symbol metadata and quote cache
+"""
+
+import logging
+import time
+
+from XTBApi.symbol_cache import SymbolCache
+
+LOGGER = logging.getLogger('XTBApi.test_symbol_cache')
+
+
+def test_ttl_and_ticks():
+    calls = []
+
+    def _fetch(symbol):
+        calls.append(symbol)
+        return {'symbol': symbol, 'precision': 2, 'ask': 1.5, 'bid': 1.4}
+
+    cache = SymbolCache(_fetch, quote_ttl=0.05)
+    assert cache.get('GOLD')['ask'] == 1.5
+    assert cache.get('GOLD')['ask'] == 1.5
+    assert len(calls) == 1
+    time.sleep(0.06)
+    # static fields stay, the quote is stale
+    assert cache.static('GOLD')['precision'] == 2
+    assert len(calls) == 1
+    cache.get('GOLD')
+    assert len(calls) == 2
+    # streamed quotes
+    cache.on_tick({'symbol': 'GOLD', 'ask': 1.7, 'bid': 1.6, 'level': 0})
+    time.sleep(0.06)
+    assert cache.get('GOLD')['ask'] == 1.7
+    assert len(calls) == 2
+    cache.invalidate('GOLD')
+    cache.get('GOLD')
+    assert len(calls) == 3
+    assert cache.stats() == {'hits': 3, 'misses': 3, 'symbols': 1}
+    LOGGER.debug("passed")
+
+
+def test_open_trade_uses_cache(client, mock_server):
+    client.symbols.quote_ttl = 60
+    client.get_margin_trade('GOLD', 0.01)
+    client.get_margin_trade('GOLD', 0.01)
+    assert mock_server.requests['getMarginTrade'] == 1
+    client.open_trade('buy', 'GOLD', 0.01)
+    client.open_trade('buy', 'GOLD', 0.01)
+    assert mock_server.requests['getSymbol'] == 1
+    LOGGER.debug("passed")
@@ -0,0 +1,93 @@
+"""
+tests.test_trades.py
+~~~~~~~
+
+test the incremental trade store
+"""
+
+import logging
+
+import pytest
+
+from XTBApi.trades import TradeStore
+
+LOGGER = logging.getLogger('XTBApi.test_trades')
+
+
+def _trade(order, profit=0.0, **kw):
+    return dict({'order': order, 'cmd': 0, 'symbol': 'GOLD', 'volume': 0.01,
+                 'close_price': 1950.0, 'profit': profit,
+                 'open_time': 1700000000000}, **kw)
+
+
+def test_sync_diff():
+    store = TradeStore()
+    assert store.sync([_trade(1), _trade(2)]) == ([1, 2], [])
+    first = store[1]
+    assert store.sync([_trade(1, profit=3.5), _trade(3)]) == ([3], [2])
+    # updated in place, not rebuilt
+    assert store[1] is first and first.actual_profit == 3.5
+    assert sorted(store) == [1, 3]
+    LOGGER.debug("passed")
+
+
+def test_stream_records():
+    store = TradeStore()
+    store.on_trade(_trade(1, type=0, state='Modified'))
+    store.on_trade(_trade(2, type=1, state='Modified'))
+    assert list(store) == [1]
+    store.on_profit({'order': 1, 'order2': 5, 'position': 1, 'profit': -1.2})
+    assert store[1].actual_profit == -1.2
+    store.on_trade(_trade(1, type=2, closed=True))
+    assert not store
+    LOGGER.debug("passed")
+
+
+def test_client_trades(client, mock_server):
+    client.open_trade('buy', 'GOLD', 0.01)
+    client.open_trade('sell', 'EURUSD', 0.01)
+    assert len(client.trade_rec) == 2
+    client.close_all_trades()
+    assert not client.trade_rec and not mock_server.trades
+    LOGGER.debug("passed")
+
+
+class _Stream(object):
+    """StreamClient stand-in, pushes trade status records by hand"""
+    def subscribe_trade_status(self, callback):
+        self.push = callback
+
+
+def test_submit_trade(client, mock_server):
+    stages = []
+    client.on_order = lambda stage, secs: stages.append(stage)
+    handle = client.submit_trade('buy', 'GOLD', 0.01)
+    assert handle.result(timeout=5) == 3 and handle.accepted
+    assert handle.submit_seconds <= handle.confirm_seconds
+    assert stages == ['submit', 'confirm']
+    # streamed status, before and after the order is tracked
+    stream = _Stream()
+    client.stream_trade_status(stream)
+    client.status_grace = 5
+    mock_server.on_transaction = lambda order: stream.push(
+        {'order': order, 'requestStatus': 4, 'message': 'rejected'})
+    status_calls = mock_server.requests['tradeTransactionStatus']
+    assert client.submit_trade('sell', 'GOLD', 0.01).result(timeout=1) == 4
+    mock_server.on_transaction = None
+    late = client.submit_trade('sell', 'GOLD', 0.01)
+    assert not late.done()
+    stream.push({'order': late.order, 'requestStatus': 3})
+    assert late.result(timeout=1) == 3
+    assert mock_server.requests['tradeTransactionStatus'] == status_calls
+    LOGGER.debug("passed")
+
+
+def test_submit_trade_timeout(client, mock_server):
+    client.confirm_timeout = 0.5
+    mock_server.order_status = 1
+    handle = client.submit_trade('buy', 'GOLD', 0.01)
+    with pytest.raises(TimeoutError):
+        handle.result(timeout=5)
+    # polled with backoff: 0.05, 0.1, 0.2 s apart
+    assert 2 <= mock_server.requests['tradeTransactionStatus'] <= 5
+    LOGGER.debug("passed")
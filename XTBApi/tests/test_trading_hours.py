@@ -0,0 +1,51 @@
+"""
+tests.test_trading_hours.py
+~~~~~~~
+
+test the trading hours cache
+"""
+
+import logging
+from datetime import datetime
+
+from XTBApi.trading_hours import TradingHoursCache, SERVER_TZ
+
+LOGGER = logging.getLogger('XTBApi.test_trading_hours')
+
+# Monday to Friday 01:00-23:00, server time
+HOURS = [{'symbol': 'EURUSD', 'trading': [
+    {'day': day, 'fromT': 3600, 'toT': 82800} for day in range(1, 6)]}]
+
+
+def _ts(*args):
+    return datetime(*args, tzinfo=SERVER_TZ).timestamp()
+
+
+def test_is_open_and_next_open():
+    calls = []
+
+    def _fetch(symbols):
+        calls.append(symbols)
+        return HOURS
+
+    cache = TradingHoursCache(_fetch)
+    # 2024-01-03 is a Wednesday, 2024-01-06 a Saturday
+    assert cache.is_open('EURUSD', _ts(2024, 1, 3, 12))
+    assert not cache.is_open('EURUSD', _ts(2024, 1, 3, 23, 30))
+    assert cache.next_open('EURUSD', _ts(2024, 1, 3, 23, 30)) == _ts(2024, 1, 4, 1)
+    assert cache.next_open('EURUSD', _ts(2024, 1, 6, 12)) == _ts(2024, 1, 8, 1)
+    assert cache.next_open('EURUSD', _ts(2024, 1, 3, 12)) == _ts(2024, 1, 3, 12)
+    # one request, until invalidated
+    assert calls == [['EURUSD']]
+    cache.invalidate('EURUSD')
+    cache.is_open('EURUSD')
+    assert len(calls) == 2
+    LOGGER.debug("passed")
+
+
+def test_client_market_status(client, mock_server):
+    status = client.get_market_status(['GOLD', 'EURUSD'])
+    assert set(status) == {'GOLD', 'EURUSD'}
+    client.check_if_market_open(['GOLD'])
+    assert mock_server.requests['getTradingHours'] == 1
+    LOGGER.debug("passed")
@@ -0,0 +1,133 @@
+# -*- coding utf-8 -*-
+
+"""
+XTBApi.trades
+~~~~~~~
+
+Open trade state, updated in place from getTrades polling or the
+trade/profit stream
+"""
+
+import threading
+import time
+import logging
+from concurrent.futures import Future
+
+LOGGER = logging.getLogger('XTBApi.trades')
+# tradeTransactionStatus requestStatus values
+REQUEST_ERROR = 0
+REQUEST_PENDING = 1
+REQUEST_ACCEPTED = 3
+REQUEST_REJECTED = 4
+
+
+class Transaction(object):
+    __slots__ = ('trans_dict', 'mode', 'order_id', 'symbol', 'volume',
+                 'price', 'actual_profit', 'timestamp')
+
+    def __init__(self, trans_dict):
+        self.update(trans_dict)
+        LOGGER.debug("Transaction %s inited", self.order_id)
+
+    def update(self, trans_dict):
+        """refresh from a getTrades record or a trade stream record"""
+        self.trans_dict = trans_dict
+        self.mode = {0: 'buy', 1: 'sell'}[trans_dict['cmd']]
+        self.order_id = trans_dict['order']
+        self.symbol = trans_dict['symbol']
+        self.volume = trans_dict['volume']
+        self.price = trans_dict['close_price']
+        self.actual_profit = trans_dict['profit']
+        self.timestamp = trans_dict['open_time'] / 1000
+
+
+class TradeStore(dict):
+    """open Transactions by order id.
+
+    sync() applies a full getTrades list as a diff, on_trade() and
+    on_profit() are the StreamClient trade and profit callbacks"""
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+
+    def _put(self, record):
+        trade = self.get(record['order'])
+        if trade is None:
+            self[record['order']] = Transaction(record)
+        else:
+            trade.update(record)
+
+    def sync(self, trades):
+        """apply getTrades, return (added, removed) order ids"""
+        with self._lock:
+            orders = {trade['order'] for trade in trades}
+            removed = [order for order in self if order not in orders]
+            added = [trade['order'] for trade in trades if trade['order'] not in self]
+            for order in removed:
+                del self[order]
+            for record in trades:
+                self._put(record)
+        LOGGER.debug("trades synced, +%s -%s", len(added), len(removed))
+        return added, removed
+
+    def on_trade(self, record):
+        """trade stream record"""
+        with self._lock:
+            if record.get('closed') or record.get('state') == 'Deleted':
+                self.pop(record['order'], None)
+            elif record.get('type') != 1:
+                # pending orders (type 1) are not trades yet
+                self._put(record)
+
+    def on_profit(self, record):
+        """profit stream record"""
+        trade = self.get(record['order'])
+        if trade is not None:
+            trade.actual_profit = record['profit']
+            trade.trans_dict['profit'] = record['profit']
+
+
+class OrderHandle(object):
+    """submitted order, confirmed later by polling or the trade status
+    stream. result() waits for the final requestStatus"""
+    __slots__ = ('order', 'symbol', 'price', 'submitted', 'submit_seconds',
+                 'confirm_seconds', 'message', 'future')
+
+    def __init__(self, order, symbol, price, submitted, submit_seconds):
+        self.order = order
+        self.symbol = symbol
+        self.price = price
+        self.submitted = submitted
+        self.submit_seconds = submit_seconds
+        self.confirm_seconds = None
+        self.message = None
+        self.future = Future()
+
+    def set_status(self, status, message=None):
+        """resolve with a final requestStatus, later calls are ignored"""
+        if status == REQUEST_PENDING or self.future.done():
+            return False
+        self.confirm_seconds = time.monotonic() - self.submitted
+        self.message = message
+        self.future.set_result(status)
+        return True
+
+    def set_exception(self, exc):
+        if not self.future.done():
+            self.future.set_exception(exc)
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+    def done(self):
+        return self.future.done()
+
+    def add_done_callback(self, fn):
+        self.future.add_done_callback(lambda _: fn(self))
+
+    @property
+    def accepted(self):
+        return self.done() and self.result() == REQUEST_ACCEPTED
+
+    def __repr__(self):
+        return f"OrderHandle({self.order}, {self.symbol}, done={self.done()})"
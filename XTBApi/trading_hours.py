@@ -0,0 +1,100 @@
+# -*- coding utf-8 -*-
+
+"""
+XTBApi.trading_hours
+~~~~~~~
+
+Cached trading sessions, as sorted weekly intervals per symbol
+"""
+
+import threading
+import time
+import logging
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+LOGGER = logging.getLogger('XTBApi.trading_hours')
+WEEK = 7 * 86400
+# getTradingHours bounds are seconds from midnight CET/CEST
+SERVER_TZ = ZoneInfo('Europe/Warsaw')
+
+
+def _intervals(days):
+    """merged (start, end) seconds from Monday 00:00, sorted"""
+    spans = sorted(((day['day'] - 1) * 86400 + day['fromT'],
+                    (day['day'] - 1) * 86400 + day['toT']) for day in days)
+    merged = []
+    for start, end in spans:
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [start for start, _ in merged], [end for _, end in merged]
+
+
+class TradingHoursCache(object):
+    """trading sessions of every symbol, fetched at most once per ttl.
+
+    fetch is called with a list of symbols and returns getTradingHours
+    with bounds in seconds, e.g. Client.get_trading_hours"""
+    def __init__(self, fetch, ttl=86400, tz=SERVER_TZ):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.tz = tz
+        self._hours = {}
+        self._loaded = {}
+        self._lock = threading.Lock()
+
+    def load(self, symbols):
+        """fetch the symbols not cached or expired, in one request"""
+        now = time.monotonic()
+        with self._lock:
+            missing = [s for s in symbols
+                       if now - self._loaded.get(s, -self.ttl) >= self.ttl]
+            if not missing:
+                return
+            for res in self.fetch(missing):
+                self._hours[res['symbol']] = _intervals(res['trading'])
+                self._loaded[res['symbol']] = now
+            LOGGER.debug("trading hours loaded for %s", missing)
+
+    def invalidate(self, symbol=None):
+        with self._lock:
+            if symbol is None:
+                self._loaded.clear()
+            else:
+                self._loaded.pop(symbol, None)
+
+    def _week(self, ts):
+        """(naive local Monday 00:00, seconds since then) of timestamp ts"""
+        local = datetime.fromtimestamp(ts, self.tz).replace(tzinfo=None)
+        monday = datetime.combine(local.date() - timedelta(days=local.weekday()),
+                                  datetime.min.time())
+        return monday, (local - monday).total_seconds()
+
+    def _get(self, symbol):
+        self.load([symbol])
+        return self._hours.get(symbol, ([], []))
+
+    def is_open(self, symbol, ts=None):
+        """market of symbol open at timestamp ts (s), default now"""
+        starts, ends = self._get(symbol)
+        _, sec = self._week(time.time() if ts is None else ts)
+        i = bisect_right(starts, sec) - 1
+        return i >= 0 and sec < ends[i]
+
+    def next_open(self, symbol, ts=None):
+        """timestamp of the next session start, ts itself when open,
+        None for symbols without sessions"""
+        ts = time.time() if ts is None else ts
+        starts, ends = self._get(symbol)
+        if not starts:
+            return None
+        monday, sec = self._week(ts)
+        i = bisect_right(starts, sec) - 1
+        if i >= 0 and sec < ends[i]:
+            return ts
+        start = starts[i + 1] if i + 1 < len(starts) else starts[0] + WEEK
+        local = monday + timedelta(seconds=start)
+        return local.replace(tzinfo=self.tz).timestamp()
@@ -1,13 +1,28 @@
 """
 Logging service
+
+Records are level-checked on the calling thread, put on a bounded queue
+and formatted/written by a background thread. When the queue runs full,
+records below WARNING are dropped first, then everything; drops are
+counted and reported.
+
+Importing has no side effects: entry points call init_logging(), which
+loads .env, opens the file handler and starts the writer thread. Records
+logged before that wait in the queue.
 """
 import os
+import sys
+import time
+import queue
+import atexit
 import logging
+import threading
+import traceback
 from logging.handlers import TimedRotatingFileHandler
-import logging_loki.emitter
 from loguru import logger as loguru_logger
-from dotenv import load_dotenv
-load_dotenv()
+
+# default of LOG_QUEUE_SIZE
+LOG_QUEUE_SIZE = 10000
 
 
 def _get_file_handler(name: str = 'logfile') -> TimedRotatingFileHandler:
@@ -21,16 +36,51 @@ def _get_file_handler(name: str = 'logfile') -> TimedRotatingFileHandler:
     return file_handler
 
 
-def _get_loki_handler() -> logging_loki.LokiHandler:
-    logging_loki.emitter.LokiEmitter.level_tag = "level"
-    loki_handler = logging_loki.LokiHandler(
+class _LokiBatcher:
+    """Buffer log lines and push them to Loki in batches"""
+    def __init__(self, url: str, size: int = 500, secs: float = 2) -> None:
+        import requests
+        self.url = url
+        self.size = size
+        self.secs = secs
+        self.session = requests.Session()
+        self.streams: dict[tuple, list] = {}
+        self.count = 0
+        self.first = 0.0
+
+    def add(self, tags: dict, levelname: str, line: str) -> None:
+        labels = tuple(sorted(dict(tags, level=levelname.lower()).items()))
+        self.streams.setdefault(labels, []).append([str(time.time_ns()), line])
+        if not self.count:
+            self.first = time.monotonic()
+        self.count += 1
+        if self.count >= self.size:
+            self.flush()
+
+    def due(self) -> bool:
+        return self.count > 0 and time.monotonic() - self.first >= self.secs
+
+    def flush(self) -> None:
+        if not self.count:
+            return
+        payload = {'streams': [{'stream': dict(labels), 'values': values}
+                               for labels, values in self.streams.items()]}
+        self.streams, self.count = {}, 0
+        try:
+            self.session.post(self.url, json=payload, timeout=5)
+        except Exception as err:
+            loguru_logger.warning('Loki push failed: {}', err)
+
+
+def _get_loki_batcher() -> _LokiBatcher:
+    return _LokiBatcher(
         url="http://%s:%s/loki/api/v1/push" % (
             os.getenv("LOKI_HOST"),
             os.getenv("LOKI_PORT"),
         ),
-        version="1",
+        size=int(os.getenv("LOKI_BATCH_SIZE", 500)),
+        secs=float(os.getenv("LOKI_BATCH_SECS", 2)),
     )
-    return loki_handler
 
 
 class Loggers:
@@ -38,37 +88,135 @@ class Loggers:
         self.name: str = kwargs.pop('name', "python")
         self.app: str = kwargs.pop('app', self.name)
         self.service: str = kwargs.pop('service', self.name)
+        self.level: int = logging.DEBUG
         self.loguru = loguru_logger
         self.logging = logging.getLogger(name=self.name)
-        self.logging.setLevel(logging.DEBUG)
-        self.logging.addHandler(_get_file_handler(name=self.app))
-        # self.logging.addHandler(_get_loki_handler())
+        self.loki = None
+        self.dropped = 0
+        self._reported = 0
+        self.queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self._high_water = LOG_QUEUE_SIZE * 8 // 10
+        self._thread = None
+        self._init_lock = threading.Lock()
+
+    def init(self) -> None:
+        """read LOG_LEVEL and LOG_QUEUE_SIZE, add the file and Loki sinks,
+        start the writer thread"""
+        with self._init_lock:
+            if self._thread is not None:
+                return
+            self.level = logging.getLevelName(os.getenv("LOG_LEVEL", "DEBUG").upper())
+            size = int(os.getenv("LOG_QUEUE_SIZE", LOG_QUEUE_SIZE))
+            # Queue reads maxsize on every put, records already queued stay
+            self.queue.maxsize = size
+            self._high_water = size * 8 // 10
+            self.logging.setLevel(logging.DEBUG)
+            self.logging.addHandler(_get_file_handler(name=self.app))
+            self.loki = _get_loki_batcher() if os.getenv("LOKI_ENABLED") else None
+            self._thread = threading.Thread(target=self._drain, name='loggers', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
 
-    def _log(self, level=logging.DEBUG, message='') -> None:
+    def isEnabledFor(self, level: int) -> bool:
+        return level >= self.level
+
+    def _log(self, level=logging.DEBUG, message='', *args) -> None:
+        if level < self.level:
+            return
+        if level < logging.WARNING and self.queue.qsize() >= self._high_water:
+            self.dropped += 1
+            return
+        try:
+            self.queue.put_nowait((level, message, args, self.service))
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self) -> None:
+        while True:
+            timeout = self.loki.secs if self.loki else None
+            try:
+                record = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                record = ()
+            if record is None:
+                break
+            if record:
+                self._emit(record)
+            if self.dropped > self._reported and self.queue.empty():
+                dropped, self._reported = self.dropped - self._reported, self.dropped
+                self._emit((logging.WARNING, 'Logging queue full, dropped %d records', (dropped,), self.service))
+            if self.loki and self.loki.due():
+                self.loki.flush()
+        if self.loki:
+            self.loki.flush()
+
+    def _emit(self, record: tuple) -> None:
+        try:
+            self._write(*record)
+        except Exception:
+            self._handle_error(record)
+
+    def _handle_error(self, record: tuple) -> None:
+        """report a record that could not be written on stderr, as
+        logging.Handler.handleError does; the writer thread keeps running"""
+        if not logging.raiseExceptions or sys.stderr is None:
+            return
+        _, message, args, service = record
+        try:
+            sys.stderr.write('--- Logging error ---\n')
+            traceback.print_exc(file=sys.stderr)
+            sys.stderr.write(f'Message: {message!r}\nArguments: {args!r}\nService: {service}\n')
+        except Exception:
+            pass
+
+    def _write(self, level: int, message: str, args: tuple, service: str) -> None:
+        if args:
+            message = message % args
         levelname: str = logging.getLevelName(level)
-        extra = {"tags": {"service": self.service, "application": self.app}}
+        extra = {"tags": {"service": service, "application": self.app}}
         # Loguru: default
         self.loguru.log(levelname, message)
-        # Logging: [TimedRotatingFile, Loki]
+        # Logging: [TimedRotatingFile]
         self.logging.log(level, message, extra=extra)
+        # Loki: batched
+        if self.loki:
+            self.loki.add(extra["tags"], levelname, message)
+
+    def close(self) -> None:
+        """write out queued records and stop the writer thread"""
+        if self._thread is not None and self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join(timeout=10)
+
+    def debug(self, message: str, *args):
+        return self._log(logging.DEBUG, message, *args)
+
+    def info(self, message: str, *args):
+        return self._log(logging.INFO, message, *args)
+
+    def warning(self, message: str, *args):
+        return self._log(logging.WARNING, message, *args)
 
-    def debug(self, message: str):
-        return self._log(logging.DEBUG, message)
+    def error(self, message: str, *args):
+        return self._log(logging.ERROR, message, *args)
 
-    def info(self, message: str):
-        return self._log(logging.INFO, message)
+    def critical(self, message: str, *args):
+        return self._log(logging.CRITICAL, message, *args)
 
-    def warning(self, message: str):
-        return self._log(logging.WARNING, message)
 
-    def error(self, message: str):
-        return self._log(logging.ERROR, message)
+logger = Loggers()
 
-    def critical(self, message: str):
-        return self._log(logging.CRITICAL, message)
 
+def init_logging() -> Loggers:
+    """load .env and start the module logger, once, from the entry point"""
+    from dotenv import load_dotenv
+    load_dotenv()
+    if logger._thread is None:
+        logger.app = os.getenv("APPLICATION", "")
+    logger.init()
+    return logger
 
-logger = Loggers(app=os.getenv("APPLICATION", ""))
 
 if __name__ == '__main__':
+    init_logging()
     logger.warning("New logger service!")
@@ -0,0 +1,88 @@
+"""
+JSON codec micro-benchmark for broker payloads
+
+    python -m benchmarks.bench_codec [--payload getChartRangeRequest.json ...] [--number 50]
+
+Without --payload, synthetic getChartRangeRequest (5000 candles) and
+getAllSymbols (2000 symbols) responses are used. Recorded payloads are
+full response documents as received from the websocket.
+"""
+import argparse
+import importlib
+import json
+import time
+import tracemalloc
+
+from XTBApi import codec
+
+
+def _chart_payload(n: int = 5000) -> dict:
+    return {'status': True, 'returnData': {'digits': 2, 'rateInfos': [
+        {'ctm': 1700000000000 + i * 300000, 'ctmString': 'Nov 14, 2023, 11:15:00 PM',
+         'open': 195012.0 + i % 97, 'close': 12.0, 'high': 20.0, 'low': -7.0, 'vol': 431.0}
+        for i in range(n)
+    ]}}
+
+
+def _symbols_payload(n: int = 2000) -> dict:
+    return {'status': True, 'returnData': [
+        {'symbol': f'SYM{i}', 'description': f'Symbol number {i}', 'categoryName': 'FX',
+         'currency': 'USD', 'currencyProfit': 'JPY', 'groupName': 'Major', 'ask': 149.123,
+         'bid': 149.101, 'high': 150.2, 'low': 148.9, 'precision': 3, 'contractSize': 100000,
+         'lotMin': 0.01, 'lotMax': 100.0, 'lotStep': 0.01, 'leverage': 3.33, 'spreadRaw': 0.022,
+         'swapLong': -1.2, 'swapShort': 0.4, 'time': 1700000000000, 'timeString': 'Tue Nov 14',
+         'trailingEnabled': True, 'shortSelling': True, 'quoteId': 5, 'type': 21}
+        for i in range(n)
+    ]}
+
+
+def _codecs() -> dict:
+    found = {'json': (json.dumps, json.loads)}
+    for name in ('orjson', 'ujson'):
+        try:
+            module = importlib.import_module(name)
+        except ImportError:
+            continue
+        if name == 'orjson':
+            found[name] = (lambda obj, _d=module.dumps: _d(obj).decode(), module.loads)
+        else:
+            found[name] = (module.dumps, module.loads)
+    return found
+
+
+def _measure(func, arg, number: int) -> tuple[float, int]:
+    """mean seconds and peak allocated bytes per call"""
+    start = time.perf_counter()
+    for _ in range(number):
+        func(arg)
+    elapsed = (time.perf_counter() - start) / number
+    tracemalloc.start()
+    func(arg)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--payload', nargs='*', default=[])
+    parser.add_argument('--number', type=int, default=50)
+    args = parser.parse_args()
+
+    payloads = {path: json.load(open(path)) for path in args.payload} or {
+        'getChartRangeRequest': _chart_payload(),
+        'getAllSymbols': _symbols_payload(),
+    }
+    print(f'XTBApi.codec selects: {codec.NAME}')
+    print(f'{"payload":<24} {"codec":<8} {"encode ms":>10} {"decode ms":>10} {"enc KiB":>9} {"dec KiB":>9}')
+    for name, payload in payloads.items():
+        text = json.dumps(payload)
+        for codec_name, (dumps, loads) in _codecs().items():
+            enc_t, enc_m = _measure(dumps, payload, args.number)
+            dec_t, dec_m = _measure(loads, text, args.number)
+            print(f'{name:<24} {codec_name:<8} {enc_t * 1e3:>10.3f} {dec_t * 1e3:>10.3f} '
+                  f'{enc_m / 1024:>9.0f} {dec_m / 1024:>9.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Indicator backfill benchmark: incremental engine vs batch engine
+
+Recomputes the ind_presets indicators of every Const.SYMBOL_DEFAULT series
+over synthetic history served by the in-memory sinks (benchmarks.sinks).
+The incremental engine is timed on one series and extrapolated, the batch
+engine runs all series on its process pool and its documents are checked
+against the incremental ones.
+
+    python -m benchmarks.bench_indicators [--candles 100000] [--workers 4]
+"""
+import argparse
+import time
+import bson
+import numpy as np
+from benchmarks.sinks import MemoryDBConnections, MemoryPostgres
+from indicators import SeriesIndicators, series_name
+from indicators_batch import BatchEngine
+from initials import Const, ind_presets
+
+
+def _rows(n: int, seed: int) -> np.ndarray:
+    """fetch_candles rows of a random walk, closed by now"""
+    rng = np.random.default_rng(seed)
+    rows = np.empty((n, 5))
+    rows[:, 0] = 1_500_000_000_000 + np.arange(n) * 300_000
+    rows[:, 1] = 185_000 + np.cumsum(rng.normal(0, 30, n)).round()
+    rows[:, 2] = rng.normal(0, 20, n).round()
+    rows[:, 3] = np.maximum(rows[:, 2], 0) + rng.integers(0, 20, n)
+    rows[:, 4] = np.minimum(rows[:, 2], 0) - rng.integers(0, 20, n)
+    return rows
+
+
+def _incremental(rows: np.ndarray) -> tuple[float, list[dict]]:
+    series = SeriesIndicators(ind_presets)
+    _open = rows[:, 1]
+    start = time.perf_counter()
+    docs = [doc for doc in (series.update(*row) for row in zip(
+        rows[:, 0].astype(np.int64).tolist(), (_open + rows[:, 3]).tolist(),
+        (_open + rows[:, 4]).tolist(), (_open + rows[:, 2]).tolist())) if doc]
+    return time.perf_counter() - start, docs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--candles', type=int, default=100_000, help='history per series')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    series = Const.SYMBOL_DEFAULT
+    history = {(Const.SYMBOL_ID[s], Const.PERIOD_ID[tf]): _rows(args.candles, i)
+               for i, (s, tf) in enumerate(series)}
+    MemoryPostgres.fetch_candles = lambda self, symbol_id, timeframe_id, since=0: \
+        history[(symbol_id, timeframe_id)]
+    dbs = MemoryDBConnections()
+
+    elapsed, expected = _incremental(history[(Const.SYMBOL_ID[series[0][0]], Const.PERIOD_ID[series[0][1]])])
+    total = len(series) * args.candles
+    print(f'{len(series)} series x {args.candles:,} candles')
+    print(f'incremental  {elapsed * len(series):8.2f} s  {args.candles / elapsed:12,.0f} candles/s  (extrapolated)')
+
+    start = time.perf_counter()
+    counts = BatchEngine(dbs, workers=args.workers).run(series)
+    elapsed = time.perf_counter() - start
+    print(f'batch        {elapsed:8.2f} s  {total / elapsed:12,.0f} candles/s  ({sum(counts.values()):,} documents)')
+
+    name = series_name(*series[0])
+    docs = dbs.get_mongo().collections[f'ind_{name}']
+    assert len(docs) == len(expected), f'{name}: {len(docs)} documents, expected {len(expected)}'
+    error = 0.0
+    for doc, raw in zip(expected, docs.values()):
+        batch = bson.decode(raw.raw)
+        assert batch['_id'] == doc['_id'], f"{name}: {batch['_id']} instead of {doc['_id']}"
+        assert batch['signals'] == doc['signals'], f"{name} {doc['_id']}: signals differ"
+        for key, value in doc['values'].items():
+            error = max(error, float(np.max(np.abs(np.subtract(batch['values'][key], value)))))
+    print(f'{name}: batch documents match the incremental ones, max error {error:.2e}')
+
+
+if __name__ == '__main__':
+    main()
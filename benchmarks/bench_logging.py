@@ -0,0 +1,72 @@
+"""
+Per-call logging overhead on the calling thread
+
+    python -m benchmarks.bench_logging [--calls 20000] [--threads 4]
+
+Compares base_loggers.Loggers (queued, level-gated, lazy %-args) with
+the former inline path (f-string, then loguru and file handler written
+on the caller). Sinks go to a temp directory.
+"""
+import argparse
+import logging
+import os
+import tempfile
+import threading
+import time
+
+TMP = tempfile.mkdtemp(prefix='bench_logging_')
+os.environ['LOG_PATH'] = os.path.join(TMP, 'bench.log')
+
+from loguru import logger as loguru_logger  # noqa: E402
+from base_loggers import Loggers  # noqa: E402
+
+loguru_logger.remove()
+loguru_logger.add(os.path.join(TMP, 'loguru.log'))
+
+
+def _inline(log: Loggers):
+    """pre-queue behaviour: format eagerly, write both sinks on the caller"""
+    def debug(message: str, *args):
+        message = message % args if args else message
+        log.loguru.log('DEBUG', message)
+        log.logging.log(logging.DEBUG, message, extra={'tags': {'service': log.service, 'application': log.app}})
+    return debug
+
+
+def _run(debug, calls: int, threads: int) -> float:
+    """mean caller-side microseconds per call"""
+    payload = {'symbol': 'GOLD', 'period': 5, 'rateInfos': list(range(20))}
+
+    def _work():
+        for i in range(calls):
+            debug('Mongo.%s.%s %s', 'xtb', f'candles_{i % 4}', payload)
+
+    workers = [threading.Thread(target=_work) for _ in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return (time.perf_counter() - start) / (calls * threads) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=20000)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    log = Loggers(name='bench', app='bench')
+    log.init()
+    cases = {'inline': _inline(log), 'queued': log.debug}
+    for name, debug in cases.items():
+        print(f'{name:<10} {_run(debug, args.calls, args.threads):8.2f} us/call')
+    log.close()
+    print(f'{"dropped":<10} {log.dropped:8d}')
+
+    log.level = logging.INFO
+    print(f'{"gated":<10} {_run(log.debug, args.calls, args.threads):8.2f} us/call')
+
+
+if __name__ == '__main__':
+    main()
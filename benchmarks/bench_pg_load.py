@@ -0,0 +1,67 @@
+"""
+Postgres candle load benchmark: execute_values vs COPY
+
+    python -m benchmarks.bench_pg_load [--dbname tinyco] [--sizes 1000 100000 1000000]
+
+Needs PGSQL_HOST / PGSQL_USER / PGSQL_PASS like the collector. Works on a
+scratch table shaped like `candles`, dropped afterwards.
+"""
+import argparse
+import time
+from classes.postgres import Postgres
+
+TABLE = 'bench_candles'
+
+
+def _rows(n: int, offset: int):
+    ctm0 = 1_600_000_000_000
+    for i in range(n):
+        ctm = ctm0 + (offset + i) * 300_000
+        yield (11 + ctm, 1, 1, ctm, 'Jan 10, 2023, 3:00:00 PM', 185012, 12, 20, -7, 431.0)
+
+
+def _run(pgdb: Postgres, method: str, n: int, offset: int) -> float:
+    rows = list(_rows(n, offset))
+    start = time.perf_counter()
+    if method == 'copy':
+        inserted = pgdb.copy_many(TABLE, rows)
+    else:
+        inserted = pgdb.upsert_many(TABLE, rows)
+    elapsed = time.perf_counter() - start
+    assert inserted == n, f'{method}: inserted {inserted} of {n}'
+    return n / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dbname', default='tinyco')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    pgdb = Postgres(args.dbname)
+    with pgdb.cursor() as cursor:
+        cursor.execute(f"""
+            DROP TABLE IF EXISTS {TABLE};
+            CREATE TABLE {TABLE} (
+                id bigint PRIMARY KEY, symbol_id int, timeframe_id int, ctm bigint,
+                ctm_string text, open double precision, close double precision,
+                high double precision, low double precision, vol double precision
+            );
+        """)
+    try:
+        offset = 0
+        print(f'{"rows":>10} {"execute_values":>16} {"copy":>16}  (rows/sec)')
+        for n in args.sizes:
+            result = {}
+            for method in ('execute_values', 'copy'):
+                result[method] = _run(pgdb, method, n, offset)
+                offset += n
+            print(f'{n:>10} {result["execute_values"]:>16,.0f} {result["copy"]:>16,.0f}')
+    finally:
+        with pgdb.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {TABLE};")
+        pgdb.close()
+
+
+if __name__ == '__main__':
+    main()
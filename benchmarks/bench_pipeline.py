@@ -0,0 +1,179 @@
+"""
+End-to-end candle collection benchmark
+
+Runs CandlesTask over the XTB mock server with in-memory sinks
+(benchmarks.sinks), one fresh process per scenario so peak RSS is
+per scenario. Reports throughput, p50/p99 per-series latency, peak RSS
+and time per stage (broker round trip, JSON decoding, Postgres, Mongo;
+stage times are summed over worker threads).
+
+    python -m benchmarks.bench_pipeline
+    python -m benchmarks.bench_pipeline --save benchmarks/baselines/pipeline.json
+    python -m benchmarks.bench_pipeline --compare benchmarks/baselines/pipeline.json
+
+A scenario is SERIESxCANDLES: SERIES (symbol, timeframe) pairs, each with
+a stored watermark CANDLES candles behind now.
+"""
+import argparse
+import json
+import multiprocessing
+import resource
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+DEFAULT_SCENARIOS = ['16x300', '100x300', '1000x300', '16x5000', '16x50000']
+TIMEFRAMES = (5, 15, 30, 60)
+# relative slowdown of a metric flagged as regression by --compare
+TOLERANCE = 0.20
+
+
+class StageTimer:
+    def __init__(self) -> None:
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def wrap(self, stage: str, func):
+        def _timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self.seconds[stage] += elapsed
+                    self.calls[stage] += 1
+        return _timed
+
+
+def _series(n: int) -> list[tuple[str, int]]:
+    return [(f'SYM{i // len(TIMEFRAMES)}', TIMEFRAMES[i % len(TIMEFRAMES)]) for i in range(n)]
+
+
+def _run_scenario(n_series: int, n_candles: int, workers: int, sessions: int,
+                  rate: float, latency: float, columnar: bool, resample: bool, indicators: bool) -> dict:
+    from XTBApi import codec
+    from XTBApi.limiter import RateLimiter
+    from XTBApi.mock_server import MockServer
+    from initials import Const
+    from candles import CandlesTask, collect_series
+    from connections import BrokerPool
+    from benchmarks.sinks import MemoryDBConnections
+
+    series = _series(n_series)
+    symbols = sorted({s for s, _ in series})
+    for i, symbol in enumerate(symbols):
+        Const.SYMBOL_ID.setdefault(symbol, 100 + i)
+    # open all week, so runs on any day fetch the same
+    hours = [{'day': day, 'fromT': 0, 'toT': 86400000} for day in range(1, 8)]
+    server = MockServer(latency=latency, symbols={s: (2, 100.0 + i) for i, s in enumerate(symbols)},
+                        trading_hours=hours).start()
+
+    import XTBApi.api
+    import initials
+    XTBApi.api.WS_URL = server.url
+    # the mock server accepts any password, no account.json needed
+    initials.accounts = {'bench': {'pass': ''}}
+    broker = BrokerPool(users=('bench',), sessions_per_user=sessions)
+    timer = StageTimer()
+    for session in broker.sessions:
+        session.client.limiter = RateLimiter(1 / rate)
+        session.client._send_command = timer.wrap('broker', session.client._send_command)
+    codec.loads = timer.wrap('json_decode', codec.loads)
+    dbs = MemoryDBConnections()
+    pgdb, mongodb = dbs.get_pg(), dbs.get_mongo()
+    pgdb.upsert_many_candles = timer.wrap('postgres', pgdb.upsert_many_candles)
+    mongodb.upsert_candles = timer.wrap('mongo', mongodb.upsert_candles)
+
+    # watermarks n_candles behind now, backfill already done
+    now_ms = int(time.time() * 1000)
+    mongodb.set_many('candles_time', [{
+        '_id': f'real_{symbol}_{tf}',
+        'candles': f'real_{symbol}_{tf}',
+        'last_backdate': date(2000, 1, 1).isoformat(),
+        'last_ctm': now_ms - n_candles * tf * 60_000,
+    } for symbol, tf in series])
+
+    task = CandlesTask(dbs=dbs, broker=broker, columnar=columnar, resample=resample, indicators=indicators)
+    start = time.perf_counter()
+    elapsed = collect_series(task, series, workers=workers)
+    wall = time.perf_counter() - start
+    server.stop()
+
+    latencies = sorted(elapsed.values())
+    candles = sum(len(v) for v in pgdb.tables.values())
+    return {
+        'series': n_series,
+        'candles_per_series': n_candles,
+        'wall_s': wall,
+        'candles_stored': candles,
+        'candles_per_s': candles / wall,
+        'series_per_s': n_series / wall,
+        'p50_series_s': statistics.median(latencies),
+        'p99_series_s': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'broker_calls': timer.calls['broker'],
+        'stage_s': dict(timer.seconds),
+    }
+
+
+def _compare(results: dict, baseline: dict) -> list[str]:
+    regressions = []
+    for name, res in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for key, higher_is_better in (('candles_per_s', True), ('p99_series_s', False), ('peak_rss_mb', False)):
+            ratio = res[key] / base[key] if base[key] else 1.0
+            if (higher_is_better and ratio < 1 - TOLERANCE) or (not higher_is_better and ratio > 1 + TOLERANCE):
+                regressions.append(f'{name} {key}: {base[key]:.3f} -> {res[key]:.3f}')
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('scenarios', nargs='*', default=DEFAULT_SCENARIOS)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--sessions', type=int, default=2)
+    parser.add_argument('--rate', type=float, default=1000.0, help='broker requests/s per session')
+    parser.add_argument('--latency', type=float, default=0.002, help='mock server latency (s)')
+    parser.add_argument('--columnar', action='store_true')
+    parser.add_argument('--resample', action='store_true', help='build higher timeframes from the lowest')
+    parser.add_argument('--indicators', action='store_true', help='update the ind_presets indicators')
+    parser.add_argument('--save', help='write results as baseline JSON')
+    parser.add_argument('--compare', help='baseline JSON to check for regressions')
+    args = parser.parse_args()
+
+    results = {}
+    context = multiprocessing.get_context('fork')
+    print(f'{"scenario":<10} {"wall s":>8} {"candles/s":>11} {"p50 ms":>8} {"p99 ms":>8} {"RSS MB":>8}  stages (s)')
+    for scenario in args.scenarios:
+        n_series, n_candles = (int(x) for x in scenario.split('x'))
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            res = pool.submit(_run_scenario, n_series, n_candles, args.workers, args.sessions,
+                              args.rate, args.latency, args.columnar, args.resample,
+                              args.indicators).result()
+        results[scenario] = res
+        stages = ' '.join(f'{k}={v:.2f}' for k, v in sorted(res['stage_s'].items()))
+        print(f'{scenario:<10} {res["wall_s"]:>8.2f} {res["candles_per_s"]:>11,.0f} '
+              f'{res["p50_series_s"] * 1e3:>8.1f} {res["p99_series_s"] * 1e3:>8.1f} '
+              f'{res["peak_rss_mb"]:>8.1f}  {stages}')
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        regressions = _compare(results, json.load(open(args.compare)))
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Cold-start import time of the entry point modules
+
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --save benchmarks/baselines/startup.json
+    python -m benchmarks.bench_startup --compare benchmarks/baselines/startup.json
+
+Each module is imported in a fresh `python -X importtime` process, best of
+--repeat runs. Reports the cumulative import time and the heaviest
+dependencies, and flags modules that must stay out of the import graph
+(database drivers, pydantic) when they show up.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+MODULES = ['XTBApi.api', 'initials', 'connections', 'candles', 'stream']
+# loaded only when a process actually talks to the databases / reads settings
+DEFERRED = ('psycopg2', 'pymongo', 'pydantic', 'logging_loki', 'http.server')
+# relative slowdown flagged as regression by --compare
+TOLERANCE = 0.30
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _importtime(module: str) -> dict[str, int]:
+    """cumulative microseconds per imported module"""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                          cwd=ROOT, capture_output=True, text=True, check=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def measure(module: str, repeat: int) -> dict:
+    runs = [_importtime(module) for _ in range(repeat)]
+    best = min(runs, key=lambda t: t[module])
+    top_level = {name: us for name, us in best.items() if name.split('.')[0] == name and name != module}
+    return {
+        'import_ms': best[module] / 1000,
+        'modules': len(best),
+        'heaviest': sorted(top_level.items(), key=lambda kv: -kv[1])[:5],
+        'deferred_loaded': sorted(name for name in best if name.startswith(DEFERRED)),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('modules', nargs='*', default=MODULES)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save', help='write results as baseline JSON')
+    parser.add_argument('--compare', help='baseline JSON to check for regressions')
+    args = parser.parse_args()
+
+    results = {}
+    failed = []
+    print(f'{"module":<14} {"import ms":>10} {"modules":>8}  heaviest (ms)')
+    for module in args.modules:
+        res = results[module] = measure(module, args.repeat)
+        heaviest = ' '.join(f'{name}={us / 1000:.1f}' for name, us in res['heaviest'])
+        print(f'{module:<14} {res["import_ms"]:>10.1f} {res["modules"]:>8}  {heaviest}')
+        if res['deferred_loaded']:
+            failed.append(f'{module} imports {", ".join(res["deferred_loaded"])}')
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        for module, res in results.items():
+            base = baseline.get(module)
+            if base and res['import_ms'] > base['import_ms'] * (1 + TOLERANCE):
+                failed.append(f'{module} import_ms: {base["import_ms"]:.1f} -> {res["import_ms"]:.1f}')
+    for line in failed:
+        print(f'REGRESSION {line}')
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+In-memory stand-ins for the Postgres and Mongo sinks
+
+They keep the real row/document building of classes.Postgres and
+classes.Mongo and only replace the network writes, so benchmarks measure
+the collector's own cost.
+"""
+import threading
+from classes import Postgres, Mongo
+from connections import DBConnections
+from initials import Const
+
+
+class MemoryPostgres(Postgres):
+    def __init__(self, dbname: str) -> None:
+        self.dbname = dbname
+        self.db = True
+        self.tables: dict[str, dict] = {}
+        # candles rows by (symbol_id, timeframe_id), like the table's index
+        self.series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def _insert(self, table, data) -> int:
+        rows = {row[0]: row for row in data}
+        with self._lock:
+            stored = self.tables.setdefault(table, {})
+            before = len(stored)
+            for key, row in rows.items():
+                if key not in stored:
+                    stored[key] = row
+                    if table == 'candles':
+                        self.series.setdefault((row[1], row[2]), []).append(row)
+            return len(stored) - before
+
+    def fetch_candles(self, symbol_id: int, timeframe_id: int, since: int = 0):
+        import numpy as np
+        with self._lock:
+            rows = [(row[3], row[5], row[6], row[7], row[8])
+                    for row in self.series.get((symbol_id, timeframe_id), []) if row[3] >= since]
+        return np.array(sorted(rows), dtype=np.float64).reshape(-1, 5)
+
+    def upsert_many(self, table, data, page_size: int = 1000) -> int:
+        return self._insert(table, data)
+
+    def copy_many(self, table, data) -> int:
+        return self._insert(table, data)
+
+    def ping(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryMongo(Mongo):
+    def __init__(self, dbname: str) -> None:
+        self.dbname = dbname
+        self.collections: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def _collection(self, collection: str) -> dict:
+        with self._lock:
+            return self.collections.setdefault(collection, {})
+
+    def find_all(self, collection: str, projection: dict = None):
+        return list(self._collection(collection).values())
+
+    def find_one(self, collection: str, match: dict, projection: dict = None):
+        return self._collection(collection).get(match.get('_id'))
+
+    def upsert_list_of_dict(self, collection: str, data: list, batch_size: int = 0) -> dict:
+        docs = self._collection(collection)
+        inserted = 0
+        with self._lock:
+            for doc in data:
+                if doc['_id'] not in docs:
+                    docs[doc['_id']] = doc
+                    inserted += 1
+        skipped = len(data) - inserted
+        return {'inserted': inserted, 'matched': skipped, 'skipped': skipped}
+
+    def set_many(self, collection: str, data: list, batch_size: int = 0) -> int:
+        docs = self._collection(collection)
+        with self._lock:
+            for doc in data:
+                docs.setdefault(doc['_id'], {}).update(doc)
+        return len(data)
+
+    def replace_collection(self, collection: str, data: list, batch_size: int = 0) -> int:
+        # kept in order by position: reading _id would decode RawBSONDocuments,
+        # which the real insert sends as they are
+        with self._lock:
+            self.collections[collection] = dict(enumerate(data))
+        return len(data)
+
+    def ping(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryDBConnections(DBConnections):
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.dbname = {Mongo: Const.MONGODB, Postgres: Const.PGDB}
+        self.dbs = {
+            Mongo: MemoryMongo(self.dbname[Mongo]),
+            Postgres: MemoryPostgres(self.dbname[Postgres]),
+        }
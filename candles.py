@@ -1,129 +1,454 @@
+import argparse
+import heapq
+import metrics
 from initials import Const
-from connections import BrokerConnection, DBConnections
+from connections import BrokerConnection, BrokerPool, DBConnections
 from datetime import datetime, date, time, timedelta, timezone
-from time import sleep
-from base_loggers import logger
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import Lock
+from time import perf_counter, monotonic, sleep
+from XTBApi.api import LOGIN_TIMEOUT
+from XTBApi.trading_hours import TradingHoursCache
+from indicators import IndicatorEngine
+from base_loggers import logger, init_logging
+from XTBApi import setup_logging
 logger.service = __name__
 
 
-class CandlesTime:
-    def __init__(self, dbs: DBConnections, symbol: str, timeframe: int) -> None:
+class WatermarkStore:
+    """Present and backdate watermarks of every series, read once per run
+    and written back in one bulk write"""
+    collection = 'candles_time'
+    projection = {'last_backdate': 1, 'last_ctm': 1}
+
+    def __init__(self, dbs: DBConnections) -> None:
         self.dbs = dbs
+        self.docs: dict[str, dict] | None = None
+        self.dirty: dict[str, dict] = {}
+        self._lock = Lock()
+
+    def load(self) -> None:
+        mongodb = self.dbs.get_mongo()
+        docs = mongodb.find_all(self.collection, projection=self.projection)
+        self.docs = {doc['_id']: doc for doc in docs}
+        logger.debug('Loaded %s watermarks', len(self.docs))
+
+    def get(self, name: str) -> dict | None:
+        if self.docs is None:
+            mongodb = self.dbs.get_mongo()
+            return mongodb.find_one(self.collection, match={'_id': name}, projection=self.projection)
+        return self.docs.get(name)
+
+    def put(self, name: str, doc: dict) -> None:
+        doc = dict(doc, _id=name, candles=name)
+        with self._lock:
+            if self.docs is not None:
+                self.docs[name] = doc
+            self.dirty[name] = doc
+
+    def flush(self) -> int:
+        with self._lock:
+            docs, self.dirty = list(self.dirty.values()), {}
+        if not docs:
+            return 0
+        mongodb = self.dbs.get_mongo()
+        return mongodb.set_many(self.collection, docs)
+
+
+class CandlesTime:
+    def __init__(self, watermarks: WatermarkStore, symbol: str, timeframe: int) -> None:
+        self.watermarks = watermarks
         self.symbol = symbol
         self.timeframe = timeframe
         self.name = f'real_{symbol}_{timeframe}'
         now = datetime.now(timezone.utc)
         self.max_backdate = now.date() - timedelta(days=12*timeframe)
         self.last_backdate = now.date()
+        # ctm (ms) of the latest stored candle, 0 until first run
+        self.last_ctm = 0
         if timeframe == 30:
             self.max_backdate = max(self.max_backdate, date(2023, 7, 21))
 
     def query(self):
-        mongodb = self.dbs.get_mongo()
-        docs = mongodb.find_all('candles_time')
-        for doc in docs:
-            if doc['candles'] == self.name:
-                self.last_backdate = date.fromisoformat(doc['last_backdate'])
+        doc = self.watermarks.get(self.name)
+        if doc:
+            self.last_backdate = date.fromisoformat(doc['last_backdate'])
+            self.last_ctm = int(doc.get('last_ctm', 0))
 
     def update(self):
-        mongodb = self.dbs.get_mongo()
-        doc = {
-            '_id': self.name,
-            'candles': self.name,
-            'last_backdate': self.last_backdate.isoformat()
-        }
-        mongodb.upsert_one('candles_time', match={'candles': self.name}, data=doc)
+        """buffer watermarks, written by WatermarkStore.flush()"""
+        self.watermarks.put(self.name, {
+            'last_backdate': self.last_backdate.isoformat(),
+            'last_ctm': self.last_ctm,
+        })
+
+
+def _ctms(candles) -> list[int]:
+    """ctm column of candles, given as list of dicts or CandleBlock"""
+    if isinstance(candles, list):
+        return [int(c['ctm']) for c in candles]
+    return candles.ctm.tolist()
+
+
+def _closed(candles, timeframe: int, now_ms: int):
+    """candles closed by now_ms, without the one still forming: stored
+    candles are never updated"""
+    if isinstance(candles, list):
+        return [c for c in candles if c['ctm'] + timeframe * 60_000 <= now_ms]
+    return candles.closed(timeframe, now_ms)
+
+
+def _concat(candles, more):
+    if isinstance(candles, list) and isinstance(more, list):
+        return candles + more
+    from XTBApi.columnar import CandleBlock
+    return CandleBlock.concat([c for c in (candles, more) if len(c)])
+
+
+def _resample_groups(series) -> list[tuple[str, list[int]]]:
+    """(symbol, [base, *higher]) per symbol, higher timeframes being multiples of the lowest"""
+    by_symbol: dict[str, list[int]] = {}
+    for symbol, timeframe in series:
+        by_symbol.setdefault(symbol, []).append(timeframe)
+    groups = []
+    for symbol, timeframes in by_symbol.items():
+        base, *higher = sorted(set(timeframes))
+        groups.append((symbol, [base] + [tf for tf in higher if tf % base == 0]))
+        groups.extend((symbol, [tf]) for tf in higher if tf % base)
+    return groups
 
 
 class CandlesTask:
-    def __init__(self, dbs: DBConnections, broker: BrokerConnection) -> None:
+    def __init__(self, dbs: DBConnections, broker: BrokerConnection | BrokerPool, columnar: bool = False,
+                 resample: bool = Const.RESAMPLE, check_every: int = Const.RESAMPLE_CHECK_EVERY,
+                 skip_closed: bool = Const.SKIP_CLOSED, indicators: bool = Const.INDICATORS) -> None:
         self.dbs = dbs
         self.broker = broker
+        self.columnar = columnar
+        self.resample = resample
+        self.check_every = check_every
+        self.watermarks = WatermarkStore(dbs)
+        self.hours = TradingHoursCache(self._get_trading_hours) if skip_closed else None
+        self.indicators = IndicatorEngine(dbs, hours=self.hours) if indicators else None
+        self._runs: dict[str, int] = {}
+
+    def _get_trading_hours(self, symbols: list[str]) -> list:
+        with self.broker.lease() as bkr_client:
+            return bkr_client.get_trading_hours(symbols)
+
+    def closed_since(self, symbol: str, timeframe: int, ctm: int) -> bool:
+        """market closed since the end of the candle at ctm (ms), nothing new to fetch"""
+        if not self.hours or not ctm:
+            return False
+        try:
+            next_open = self.hours.next_open(symbol, (ctm + timeframe * 60_000) / 1000)
+        except Exception as e:
+            logger.warning('Trading hours of %s unavailable, %s', symbol, e)
+            return False
+        return next_open is None or next_open > datetime.now(timezone.utc).timestamp()
 
-    def _get_chart_from_ts(self, ts:int, symbol: str, timeframe: int, tick: int):
-        bkr_client = self.broker.client
-        res = bkr_client.get_chart_range_request(symbol, timeframe, ts, ts, tick) if bkr_client else {}
-        candles = res.get('rateInfos', [])
-        # digits = res.get('digits', 0)
-        logger.info(f'Got {symbol}_{timeframe} {len(candles)} ticks from {ts}')
+    def _get_chart(self, symbol: str, timeframe: int, start: int, end: int, tick: int):
+        with self.broker.lease() as bkr_client:
+            if self.columnar:
+                candles = bkr_client.get_chart_range_block(symbol, timeframe, start, end, tick)
+            else:
+                res = bkr_client.get_chart_range_request(symbol, timeframe, start, end, tick)
+                candles = res.get('rateInfos', [])
+        logger.info('Got %s_%s %s ticks from %s to %s', symbol, timeframe, len(candles), start, end)
         return candles
 
+    def _get_chart_from_ts(self, ts: int, symbol: str, timeframe: int, tick: int):
+        return self._get_chart(symbol, timeframe, ts, ts, tick)
+
     def gather_present_candles(self, ct: CandlesTime):
-        """get present charts"""
-        ts = int(datetime.now(timezone.utc).timestamp())
-        return self._get_chart_from_ts(ts, ct.symbol, ct.timeframe, tick=-300)
+        """get present charts, from the latest stored candle when known"""
+        if self.closed_since(ct.symbol, ct.timeframe, ct.last_ctm):
+            logger.debug('Market closed, skip %s_%s', ct.symbol, ct.timeframe)
+            return []
+        now_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
+        ts = now_ms // 1000
+        if ct.last_ctm:
+            candles = self._get_chart(ct.symbol, ct.timeframe, ct.last_ctm // 1000, ts, tick=0)
+        else:
+            candles = self._get_chart_from_ts(ts, ct.symbol, ct.timeframe, tick=-300)
+        return _closed(candles, ct.timeframe, now_ms)
 
     def gather_olden_candles(self, ct: CandlesTime):
         """get olden charts"""
         if ct.max_backdate >= ct.last_backdate:
             return []
-        sleep(0.5)
         ts = int(datetime.combine(ct.last_backdate, time(0, 0)).timestamp())
         return self._get_chart_from_ts(ts, ct.symbol, ct.timeframe, tick=-500)
 
-    def collect(self, symbol: str, timeframe: int) -> None:
-        logger.debug(f'Initialize CandlesTime ({symbol}, {timeframe})')
-        ct = CandlesTime(self.dbs, symbol, timeframe)
+    def collect_resampled(self, symbol: str, timeframes: list[int]) -> None:
+        """fetch the base timeframe only, build the higher ones from it"""
+        cts = [CandlesTime(self.watermarks, symbol, tf) for tf in timeframes]
+        for ct in cts:
+            ct.query()
+        # from the start of the oldest bar to refresh, so every bar is complete
+        span = max(timeframes) * 60_000
+        start = min(ct.last_ctm for ct in cts) // span * span
+        now_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
+        if not start or (now_ms - start) / (timeframes[0] * 60_000) > Const.RESAMPLE_MAX_CANDLES or \
+                self.closed_since(symbol, timeframes[0], cts[0].last_ctm):
+            # first run, far behind or market closed: series by series
+            for tf in timeframes:
+                self.collect(symbol, tf)
+            return
+
+        with self.broker.lease() as bkr_client:
+            block = bkr_client.get_chart_range_block(symbol, timeframes[0], start // 1000, now_ms // 1000, 0)
+        block = block.closed(timeframes[0], now_ms)
+        logger.info('Got %s_%s %s ticks for %s', symbol, timeframes[0], len(block), timeframes)
+
+        runs = self._runs[symbol] = self._runs.get(symbol, 0) + 1
+        for tf in timeframes:
+            bars = block if tf == timeframes[0] else block.resample(tf, until=now_ms)
+            if tf != timeframes[0] and self.check_every and runs % self.check_every == 0:
+                self.check_resampled(symbol, tf, bars)
+            self.collect(symbol, tf, present=bars if self.columnar else bars.to_rate_infos())
+
+    def check_resampled(self, symbol: str, timeframe: int, bars) -> int:
+        """compare resampled bars with the broker's, return the number that differ"""
+        if not len(bars):
+            return 0
+        start, end = int(bars.ctm[0]) // 1000, int(bars.ctm[-1]) // 1000
+        with self.broker.lease() as bkr_client:
+            broker = bkr_client.get_chart_range_block(symbol, timeframe, start, end, 0)
+        ours = dict(zip(bars.ctm.tolist(), bars.data.tolist()))
+        theirs = dict(zip(broker.ctm.tolist(), broker.data.tolist()))
+        mismatches = sum(ours.get(ctm) != row for ctm, row in theirs.items()) + len(ours.keys() - theirs.keys())
+        series = f'{symbol}_{timeframe}'
+        metrics.RESAMPLE_CHECKS.inc(len(theirs), series=series)
+        if mismatches:
+            metrics.RESAMPLE_MISMATCHES.inc(mismatches, series=series)
+            logger.warning('Resampled %s: %s of %s candles differ from the broker', series, mismatches, len(theirs))
+        return mismatches
+
+    def collect(self, symbol: str, timeframe: int, present=None) -> None:
+        logger.debug('Initialize CandlesTime (%s, %s)', symbol, timeframe)
+        ct = CandlesTime(self.watermarks, symbol, timeframe)
         ct.query()
 
         # gather candles
-        candles = self.gather_present_candles(ct)
+        candles = self.gather_present_candles(ct) if present is None else present
+        present_ctm = max(_ctms(candles), default=0)
         olden_candles = self.gather_olden_candles(ct)
-        candles.extend(olden_candles)
+        candles = _concat(candles, olden_candles)
 
         # return if no new candles
-        if not candles:
+        series = f'{symbol}_{timeframe}'
+        metrics.CANDLES_FETCHED.inc(len(candles), series=series)
+        if not len(candles):
             return
 
         # store new candles in Postgres
         pgdb = self.dbs.get_pg()
-        logger.debug(f'Using Postgres conn: {pgdb}')
+        logger.debug('Using Postgres conn: %s', pgdb)
         symbol_id = Const.SYMBOL_ID.get(symbol)
         timeframe_id = Const.PERIOD_ID.get(timeframe)
         rowcount = pgdb.upsert_many_candles(symbol_id, timeframe_id, candles)
 
         # store new candles in Mongo
         mongodb = self.dbs.get_mongo()
-        logger.debug(f'Using Mongo conn: {mongodb}')
-        n_inserted = mongodb.insert_list_of_dict(
+        logger.debug('Using Mongo conn: %s', mongodb)
+        n_inserted = mongodb.upsert_candles(
             collection=f'real_{symbol}_{timeframe}',
-            data=[dict(d, **{'_id': d.get('ctm')}) for d in candles]
-        )
-        # update last backdate
-        olden_ts = 0 if not olden_candles else min([int(c['ctm']) for c in olden_candles]) / 1000
-        if n_inserted >= 0 and olden_ts > datetime(2020, 7, 1).timestamp():
-            ct.last_backdate = date.fromtimestamp(olden_ts) + timedelta(days=1)
+            candles=candles,
+        )['inserted']
+        for sink, n in (('postgres', rowcount), ('mongo', n_inserted)):
+            if n >= 0:
+                metrics.CANDLES_INSERTED.inc(n, series=series, sink=sink)
+                metrics.CANDLES_SKIPPED.inc(len(candles) - n, series=series, sink=sink)
+        # update last backdate and high-water mark
+        olden_ts = min(_ctms(olden_candles), default=0) / 1000
+        if n_inserted >= 0 and rowcount >= 0:
+            if olden_ts > datetime(2020, 7, 1).timestamp():
+                ct.last_backdate = date.fromtimestamp(olden_ts) + timedelta(days=1)
+            ct.last_ctm = max(ct.last_ctm, present_ctm)
             ct.update()
+            # only from candles that were stored
+            if self.indicators:
+                self.indicators.update(symbol, timeframe, candles)
 
         # summary
         logger.info(
-            f'Collect {symbol}_{timeframe}: ' +
-            f'PG {rowcount} ticks, ' +
-            f'Mongo {n_inserted} ticks, ' +
-            f'Backdate: {ct.last_backdate.isoformat()}'
+            'Collect %s_%s: PG %s ticks, Mongo %s ticks, Backdate: %s',
+            symbol, timeframe, rowcount, n_inserted, ct.last_backdate.isoformat()
         )
 
 
-def collect() -> None:
-    logger.debug(f'Initialize BrokerConnection()')
-    broker = BrokerConnection()
-    logger.debug(f'Initialize DBConnection()')
+def collect_series(task: CandlesTask, series, workers: int = Const.COLLECT_WORKERS) -> dict:
+    """collect every (symbol, timeframe) on a worker pool, return seconds per
+    (symbol, timeframe) or per (symbol, base timeframe) when resampling"""
+    elapsed = {}
+
+    def _collect(symbol: str, timeframes: list[int]) -> None:
+        start = perf_counter()
+        try:
+            if len(timeframes) > 1:
+                task.collect_resampled(symbol, timeframes)
+            else:
+                task.collect(symbol=symbol, timeframe=timeframes[0])
+        finally:
+            elapsed[(symbol, timeframes[0])] = perf_counter() - start
+
+    if task.resample:
+        groups = _resample_groups(series)
+    else:
+        groups = [(symbol, [period]) for symbol, period in series]
+    if task.watermarks.docs is None:
+        task.watermarks.load()
+    if task.indicators and task.indicators.docs is None:
+        task.indicators.load()
+    if task.hours:
+        try:
+            task.hours.load(sorted({symbol for symbol, _ in series}))
+        except Exception as e:
+            logger.warning('Trading hours unavailable, %s', e)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='collect') as pool:
+        futures = {pool.submit(_collect, symbol, tfs): (symbol, tfs) for symbol, tfs in groups}
+        for future in as_completed(futures):
+            symbol, timeframes = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                logger.error('Collect %s_%s failed, %s', symbol, timeframes, e)
+    task.watermarks.flush()
+    if task.indicators:
+        task.indicators.flush()
+    return elapsed
+
+
+def collect(workers: int = Const.COLLECT_WORKERS) -> None:
+    logger.debug('Initialize BrokerPool()')
+    broker = BrokerPool()
+    logger.debug('Initialize DBConnection()')
     dbs = DBConnections()
 
-    # Collect candles
+    # Collect candles, broker calls are paced by the client rate limiters
     task = CandlesTask(dbs=dbs, broker=broker)
-    for symbol_period in Const.SYMBOL_DEFAULT:
-        symbol, period = symbol_period
-        task.collect(
-            symbol=symbol,
-            timeframe=period,
-        )
-        # Delay before next symbol
-        sleep(1)
+    collect_series(task, Const.SYMBOL_DEFAULT, workers=workers)
+    logger.info('Broker limiters: %s', broker.stats())
+    metrics.observe_limiters(broker.stats())
+    metrics.export()
 
     dbs.close_all()
     broker.logout()
 
 
+class ServerClock:
+    """Broker server time, from an offset to the local clock that is
+    refreshed with getServerTime every `sync_secs`"""
+    def __init__(self, broker: BrokerConnection | BrokerPool, sync_secs: float = Const.CLOCK_SYNC_SECS) -> None:
+        self.broker = broker
+        self.sync_secs = sync_secs
+        self.offset = 0.0
+        self.synced = None
+
+    def sync(self) -> None:
+        with self.broker.lease() as bkr_client:
+            server = bkr_client.get_server_time()['time'] / 1000
+        # the request may wait on the rate limiter, so only the receive time
+        # is reliable; the error is the one-way latency
+        self.offset = server - datetime.now(timezone.utc).timestamp()
+        self.synced = monotonic()
+        logger.debug('Server clock offset: %.3f s', self.offset)
+
+    def now(self) -> float:
+        """server time in seconds; once synced, a failed resync keeps the
+        last offset and is retried on the next call"""
+        if self.synced is None or monotonic() - self.synced > self.sync_secs:
+            try:
+                self.sync()
+            except Exception as e:
+                if self.synced is None:
+                    raise
+                logger.warning('Server clock sync failed, %s', e)
+        return datetime.now(timezone.utc).timestamp() + self.offset
+
+
+class CloseSchedule:
+    """Next run of every (symbol, timeframe), `delay` seconds after its
+    next candle close. Candles are aligned to multiples of the timeframe
+    since the epoch, which holds up to H1."""
+    def __init__(self, series, now: float, delay: float = Const.CLOSE_DELAY) -> None:
+        self.delay = delay
+        self.heap = [(self.next_close(timeframe, now), symbol, timeframe) for symbol, timeframe in series]
+        heapq.heapify(self.heap)
+
+    def next_close(self, timeframe: int, now: float) -> float:
+        span = timeframe * 60
+        return (now - self.delay) // span * span + span + self.delay
+
+    def next_due(self) -> float:
+        return self.heap[0][0]
+
+    def pop_due(self, now: float) -> list[tuple[str, int]]:
+        """series due at `now`, rescheduled to their following close"""
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            _, symbol, timeframe = heapq.heappop(self.heap)
+            due.append((symbol, timeframe))
+        for symbol, timeframe in due:
+            heapq.heappush(self.heap, (self.next_close(timeframe, now), symbol, timeframe))
+        return due
+
+
+def daemon(workers: int = Const.COLLECT_WORKERS, series=Const.SYMBOL_DEFAULT,
+           retry_secs: float = Const.RETRY_SECS) -> None:
+    """keep broker and DB sessions open, collect each series right after its
+    candle close. A failed run is logged and retried after retry_secs"""
+    logger.debug('Initialize BrokerPool()')
+    broker = BrokerPool()
+    logger.debug('Initialize DBConnection()')
+    dbs = DBConnections()
+    task = CandlesTask(dbs=dbs, broker=broker)
+    clock = ServerClock(broker)
+    try:
+        metrics.serve()
+    except OSError as e:
+        logger.error('Metrics endpoint unavailable, %s', e)
+
+    schedule = None
+    try:
+        while True:
+            try:
+                if schedule is None:
+                    # catch up once, then only what has closed since
+                    collect_series(task, series, workers=workers)
+                    schedule = CloseSchedule(series, clock.now())
+                    continue
+                wait = schedule.next_due() - clock.now()
+                if wait > 0:
+                    # keep the sessions alive over long waits
+                    sleep(min(wait, LOGIN_TIMEOUT / 2))
+                    if wait > LOGIN_TIMEOUT / 2:
+                        broker.ping()
+                    continue
+                due = schedule.pop_due(clock.now())
+                collect_series(task, due, workers=workers)
+                logger.info('Collected %d series, next in %.0f s', len(due), schedule.next_due() - clock.now())
+                metrics.observe_limiters(broker.stats())
+                metrics.export()
+            except Exception as e:
+                logger.error('Collector daemon run failed, retry in %s s: %s', retry_secs, e)
+                sleep(retry_secs)
+    except KeyboardInterrupt:
+        logger.info('Collector daemon interrupted')
+    finally:
+        dbs.close_all()
+        broker.logout()
+
+
 if __name__ == '__main__':
-    collect()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--daemon', action='store_true', help='keep running, collect after every candle close')
+    parser.add_argument('--workers', type=int, default=Const.COLLECT_WORKERS)
+    args = parser.parse_args()
+    setup_logging()
+    init_logging()
+    if args.daemon:
+        daemon(workers=args.workers)
+    else:
+        collect(workers=args.workers)
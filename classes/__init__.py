@@ -1,4 +1,19 @@
-from classes.profile import Settings, Account, Profile
-from classes.mongo import Mongo
-from classes.postgres import Postgres
+import importlib
+
+# submodules import on first attribute access, psycopg2/pymongo/pydantic
+# are only loaded by processes that use them
+_MODULES = {
+    "Settings": "classes.profile",
+    "Account": "classes.profile",
+    "Profile": "classes.profile",
+    "Mongo": "classes.mongo",
+    "Postgres": "classes.postgres",
+}
 __all__ = ["Settings", "Account", "Profile", "Postgres", "Mongo"]
+
+
+def __getattr__(name: str):
+    module = _MODULES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(module), name)
@@ -1,39 +1,79 @@
 import os
-from pymongo import MongoClient
-from pymongo.errors import BulkWriteError
-# from decorators import timer
+import threading
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from decorators import timer
 from base_loggers import logger
 logger.service = __name__
 
+# documents per bulk_write round trip
+BULK_BATCH_SIZE = 1000
+
+
+def _new_client() -> MongoClient:
+    return MongoClient(
+        "mongodb://%s:%s@%s" % (
+            os.getenv("MONGODB_USER"),
+            os.getenv("MONGODB_PASS"),
+            os.getenv("MONGODB_HOST"),
+        ),
+        maxPoolSize=int(os.getenv("MONGODB_POOL_MAX", 16)),
+        minPoolSize=1,
+        maxIdleTimeMS=60_000,
+        connectTimeoutMS=5_000,
+        serverSelectionTimeoutMS=5_000,
+        socketTimeoutMS=30_000,
+        retryWrites=True,
+    )
+
 
 class Mongo:
-    """class of Mongo DB client"""
+    """class of Mongo DB client, every instance shares one pooled MongoClient"""
+    _client = None
+    _client_lock = threading.Lock()
+
     def __init__(self, dbname: str) -> None:
-        self.client: MongoClient = MongoClient("mongodb://%s:%s@%s" % (
-                os.getenv("MONGODB_USER"),
-                os.getenv("MONGODB_PASS"),
-                os.getenv("MONGODB_HOST"),
-            )
-        )
+        with Mongo._client_lock:
+            if Mongo._client is None:
+                Mongo._client = _new_client()
+        self.client: MongoClient = Mongo._client
         self.dbname = dbname
         self.db = self.client[dbname]
 
+    def ping(self) -> bool:
+        try:
+            self.client.admin.command('ping')
+            return True
+        except PyMongoError as err:
+            logger.error('Mongo.%s ping failed: %s', self.dbname, err)
+            return False
+
     def close(self) -> None:
+        with Mongo._client_lock:
+            if Mongo._client is self.client:
+                Mongo._client = None
         if isinstance(self.client, MongoClient):
             self.client.close()
 
-    def find_all(self, collection: str):
+    def find_all(self, collection: str, projection: dict = None):
         try:
             db_collection = self.db[collection]
-            with db_collection.find() as cursor:
+            with db_collection.find(projection=projection) as cursor:
                 res = [doc for doc in cursor]
                 if res:
-                    logger.debug(f'Mongo.{self.dbname}.{collection}: found {len(res)} documents')
+                    logger.debug('Mongo.%s.%s: found %d documents', self.dbname, collection, len(res))
             return res
         except TypeError as err:
             logger.error(str(err))
             return []
 
+    def find_one(self, collection: str, match: dict, projection: dict = None):
+        try:
+            return self.db[collection].find_one(filter=match, projection=projection)
+        except TypeError as err:
+            logger.error(str(err))
+            return None
+
     def upsert_one(self, collection: str, match: dict, data: dict):
         n_upsert = -1
         try:
@@ -43,7 +83,7 @@ class Mongo:
                 upsert=True
             )
             n_upsert = res.modified_count
-            logger.debug(f'Mongo.{self.dbname}.{collection}: upsert {match}')
+            logger.debug('Mongo.%s.%s: upsert %s', self.dbname, collection, match)
         except AttributeError as err:
             logger.error(str(err))
         finally:
@@ -55,12 +95,92 @@ class Mongo:
             db_collection = self.db[collection]
             res = db_collection.insert_many(data, ordered=False)
             n_inserted = len(res.inserted_ids)
-            logger.debug(f'Mongo.{self.dbname}.{collection} nInserted: {n_inserted}')
+            logger.debug('Mongo.%s.%s nInserted: %s', self.dbname, collection, n_inserted)
         except BulkWriteError as err:
             n_errors = len(err.details.get('writeErrors'))
             n_inserted = int(err.details.get('nInserted'))
-            logger.debug(f'Mongo.{self.dbname}.{collection} nInserted: {n_inserted}, writeErrors: {n_errors}')
+            logger.debug('Mongo.%s.%s nInserted: %s, writeErrors: %s', self.dbname, collection, n_inserted, n_errors)
         except AttributeError as err:
             logger.error(str(err))
         finally:
             return n_inserted
+
+    def upsert_list_of_dict(self, collection: str, data: list, batch_size: int = BULK_BATCH_SIZE) -> dict:
+        """insert documents missing by _id, leave existing ones untouched"""
+        counts = {'inserted': 0, 'matched': 0, 'skipped': 0}
+        try:
+            db_collection = self.db[collection]
+            for i in range(0, len(data), batch_size):
+                batch = data[i:i + batch_size]
+                ops = [UpdateOne(
+                    filter={'_id': doc['_id']},
+                    update={'$setOnInsert': {k: v for k, v in doc.items() if k != '_id'}},
+                    upsert=True,
+                ) for doc in batch]
+                res = db_collection.bulk_write(ops, ordered=False)
+                counts['inserted'] += res.upserted_count
+                counts['matched'] += res.matched_count
+                counts['skipped'] += len(batch) - res.upserted_count
+            logger.debug('Mongo.%s.%s %s', self.dbname, collection, counts)
+        except BulkWriteError as err:
+            counts['inserted'] += int(err.details.get('nUpserted', 0))
+            logger.error('Mongo.%s.%s writeErrors: %s', self.dbname, collection, len(err.details.get("writeErrors")))
+        except AttributeError as err:
+            logger.error(str(err))
+            counts['inserted'] = -1
+        finally:
+            return counts
+
+    def set_many(self, collection: str, data: list, batch_size: int = BULK_BATCH_SIZE) -> int:
+        """upsert documents by _id, overwriting the given fields"""
+        n_upsert = 0
+        try:
+            db_collection = self.db[collection]
+            for i in range(0, len(data), batch_size):
+                ops = [UpdateOne(
+                    filter={'_id': doc['_id']},
+                    update={'$set': {k: v for k, v in doc.items() if k != '_id'}},
+                    upsert=True,
+                ) for doc in data[i:i + batch_size]]
+                res = db_collection.bulk_write(ops, ordered=False)
+                n_upsert += res.upserted_count + res.modified_count
+            logger.debug('Mongo.%s.%s nUpserted: %s', self.dbname, collection, n_upsert)
+        except (BulkWriteError, AttributeError) as err:
+            logger.error(str(err))
+            n_upsert = -1
+        finally:
+            return n_upsert
+
+    def replace_collection(self, collection: str, data: list, batch_size: int = BULK_BATCH_SIZE) -> int:
+        """replace every document of collection: insert into a scratch
+        collection, then rename it over the old one in one step"""
+        n_inserted = 0
+        scratch = f'{collection}_replace'
+        try:
+            self.db.drop_collection(scratch)
+            db_scratch = self.db[scratch]
+            for i in range(0, len(data), batch_size):
+                res = db_scratch.insert_many(data[i:i + batch_size], ordered=False)
+                n_inserted += len(res.inserted_ids)
+            if n_inserted:
+                db_scratch.rename(collection, dropTarget=True)
+            else:
+                self.db.drop_collection(collection)
+            logger.debug('Mongo.%s.%s nReplaced: %s', self.dbname, collection, n_inserted)
+        except (BulkWriteError, PyMongoError) as err:
+            logger.error('Mongo.%s.%s replace failed: %s', self.dbname, collection, err)
+            self.db.drop_collection(scratch)
+            n_inserted = -1
+        finally:
+            return n_inserted
+
+    @timer
+    def upsert_candles(self, collection: str, candles, batch_size: int = BULK_BATCH_SIZE) -> dict:
+        """store rateInfos candles keyed by ctm, given as list of dicts or XTBApi CandleBlock"""
+        if isinstance(candles, list):
+            data = [dict(d, _id=d['ctm']) for d in candles]
+        else:
+            data = candles.to_rate_infos()
+            for d in data:
+                d['_id'] = d['ctm']
+        return self.upsert_list_of_dict(collection, data, batch_size=batch_size)
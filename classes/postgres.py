@@ -1,69 +1,234 @@
 import os
-import psycopg2
-from typing import List, Dict, Any
+import io
+import csv
+import time
+import threading
+from contextlib import contextmanager
+from itertools import repeat
+from typing import List, Dict, Any, Iterable
 from psycopg2.extras import execute_values
-from psycopg2 import OperationalError
-# from decorators import timer
+from psycopg2.pool import ThreadedConnectionPool
+from psycopg2 import OperationalError, InterfaceError
+from decorators import timer
 from base_loggers import logger
 logger.service = __name__
 
+# batches of at least this many rows are bulk loaded with COPY
+COPY_THRESHOLD = 5000
+# pooled connections idle for longer are pinged before reuse
+IDLE_CHECK_SECS = 30
+
+
+class _CsvStream(io.TextIOBase):
+    """file-like CSV view of rows, encoded lazily as COPY reads it"""
+
+    def __init__(self, rows: Iterable) -> None:
+        self.rows = iter(rows)
+        self.buf = io.StringIO()
+        self.writer = csv.writer(self.buf, lineterminator='\n')
+        self.pending = ''
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self.pending) < size:
+            chunk = self._encode(1000)
+            if not chunk:
+                break
+            self.pending += chunk
+        if size < 0:
+            size = len(self.pending)
+        out, self.pending = self.pending[:size], self.pending[size:]
+        return out
+
+    def _encode(self, n: int) -> str:
+        self.buf.seek(0)
+        self.buf.truncate()
+        for _, row in zip(range(n), self.rows):
+            self.writer.writerow(row)
+        return self.buf.getvalue()
+
 
 class Postgres:
-    """class of PostgresSQL DB client"""
+    """class of PostgresSQL DB client, backed by a bounded thread-safe pool"""
 
-    def __init__(self, dbname: str) -> None:
+    def __init__(self, dbname: str, maxconn: int | None = None) -> None:
         self.dbname = dbname
+        self.maxconn = maxconn or int(os.getenv("PGSQL_POOL_MAX", 8))
         self.db = None
+        self._slots = threading.BoundedSemaphore(self.maxconn)
+        self._lock = threading.Lock()
+        self._last_used: Dict[int, float] = {}
+        self._connect()
+
+    def _connect(self) -> None:
         try:
-            self.db = psycopg2.connect(
+            self.db = ThreadedConnectionPool(
+                1, self.maxconn,
                 host=os.getenv("PGSQL_HOST"),
-                database=dbname,
+                database=self.dbname,
                 user=os.getenv("PGSQL_USER"),
                 password=os.getenv("PGSQL_PASS"),
+                connect_timeout=int(os.getenv("PGSQL_CONNECT_TIMEOUT", 10)),
             )
         except OperationalError as err:
-            logger.error(f"Unable to connect: {err}")
-            return
-        self.db.autocommit = True
+            logger.error("Unable to connect: %s", err)
+
+    def _is_alive(self, conn) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - self._last_used.get(id(conn), 0) < IDLE_CHECK_SECS:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1;")
+            return True
+        except (OperationalError, InterfaceError):
+            return False
+
+    def _checkout(self):
+        self._slots.acquire()
+        try:
+            with self._lock:
+                if self.db is None:
+                    self._connect()
+                if self.db is None:
+                    raise OperationalError(f"Postgres.{self.dbname} unavailable")
+            conn = self.db.getconn()
+            while not self._is_alive(conn):
+                logger.warning('Postgres.%s: replace dead connection', self.dbname)
+                self._discard(conn)
+                conn = self.db.getconn()
+            conn.autocommit = True
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _discard(self, conn) -> None:
+        self._last_used.pop(id(conn), None)
+        self.db.putconn(conn, close=True)
+
+    def _checkin(self, conn, broken: bool = False) -> None:
+        if broken or conn.closed:
+            self._discard(conn)
+        else:
+            self._last_used[id(conn)] = time.monotonic()
+            self.db.putconn(conn)
+        self._slots.release()
+
+    @contextmanager
+    def cursor(self):
+        """cursor on a pooled connection, dead connections are replaced"""
+        conn = self._checkout()
+        broken = False
+        try:
+            with conn.cursor() as cursor:
+                yield cursor
+        except (OperationalError, InterfaceError):
+            broken = True
+            raise
+        finally:
+            self._checkin(conn, broken)
+
+    def ping(self) -> bool:
+        try:
+            with self.cursor() as cursor:
+                cursor.execute("SELECT 1;")
+            return True
+        except (OperationalError, InterfaceError) as err:
+            logger.error('Postgres.%s ping failed: %s', self.dbname, err)
+            return False
 
     def close(self) -> None:
         if self.db:
-            self.db.close()
+            self.db.closeall()
+            self.db = None
 
     def fetch_many(self, table: str, limit: int) -> List:
-        with self.db.cursor() as cursor:
+        with self.cursor() as cursor:
             cursor.execute("SELECT * FROM %s;" % table)
             res: List = cursor.fetchmany(limit)
         return res
 
+    def fetch_candles(self, symbol_id: int, timeframe_id: int, since: int = 0):
+        """(ctm, open, close, high, low) of one series ordered by ctm, as a
+        float64 array of shape (n, 5) read with COPY, needs numpy"""
+        import numpy as np
+        buf = io.StringIO()
+        with self.cursor() as cursor:
+            query = cursor.mogrify(
+                "SELECT ctm, open, close, high, low FROM candles "
+                "WHERE symbol_id = %s AND timeframe_id = %s AND ctm >= %s ORDER BY ctm",
+                (symbol_id, timeframe_id, since)).decode()
+            cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv);", buf, size=65536)
+        buf.seek(0)
+        return np.loadtxt(buf, delimiter=',', dtype=np.float64, ndmin=2).reshape(-1, 5)
+
     def upsert_many(self, table, data, page_size: int = 1000) -> int:
-        with self.db.cursor() as cursor:
-            execute_values(
+        # execute_values runs one statement per page and rowcount only covers
+        # the last one, so count the returned ids of every page instead
+        with self.cursor() as cursor:
+            inserted = len(execute_values(
                 cursor,
                 f"""
-                INSERT INTO {table} VALUES %s ON CONFLICT (id) DO NOTHING; 
+                INSERT INTO {table} VALUES %s ON CONFLICT (id) DO NOTHING RETURNING id;
                 """,
-                data, page_size=page_size)
-        logger.debug(f'Postgres.{self.dbname}.{table} nInserted: {cursor.rowcount}')
-        return cursor.rowcount
+                data, page_size=page_size, fetch=True))
+        logger.debug('Postgres.%s.%s nInserted: %s', self.dbname, table, inserted)
+        return inserted
 
+    def copy_many(self, table, data) -> int:
+        """bulk load rows with COPY into a session staging table,
+        then merge them into table in one statement"""
+        staging = f'{table}_staging'
+        with self.cursor() as cursor:
+            cursor.execute(f"CREATE TEMP TABLE IF NOT EXISTS {staging} (LIKE {table} INCLUDING DEFAULTS);")
+            cursor.execute(f"TRUNCATE {staging};")
+            cursor.copy_expert(f"COPY {staging} FROM STDIN WITH (FORMAT csv);", _CsvStream(data), size=65536)
+            cursor.execute(f"INSERT INTO {table} SELECT * FROM {staging} ON CONFLICT (id) DO NOTHING;")
+            rowcount = cursor.rowcount
+            cursor.execute(f"TRUNCATE {staging};")
+        logger.debug('Postgres.%s.%s nInserted: %s (COPY)', self.dbname, table, rowcount)
+        return rowcount
+
+    @timer
     def upsert_many_candles(
             self,
             symbol_id: int,
             timeframe_id: int,
-            candles: List[Dict[str, Any]],
+            candles: List[Dict[str, Any]] | Any,
     ) -> int:
-        data = [(
-            symbol_id * 10 + timeframe_id + candle['ctm'],
-            symbol_id,
-            timeframe_id,
-            candle['ctm'],
-            candle['ctmString'],
-            candle['open'],
-            candle['close'],
-            candle['high'],
-            candle['low'],
-            candle['vol'],
-        ) for candle in candles]
+        """store rateInfos candles, given as list of dicts or XTBApi CandleBlock"""
+        if isinstance(candles, list):
+            data = [(
+                symbol_id * 10 + timeframe_id + candle['ctm'],
+                symbol_id,
+                timeframe_id,
+                candle['ctm'],
+                candle['ctmString'],
+                candle['open'],
+                candle['close'],
+                candle['high'],
+                candle['low'],
+                candle['vol'],
+            ) for candle in candles]
+        else:
+            ctm = candles['ctm']
+            data = zip(
+                (ctm + (symbol_id * 10 + timeframe_id)).tolist(),
+                repeat(symbol_id),
+                repeat(timeframe_id),
+                ctm.tolist(),
+                candles.ctm_string,
+                candles['open'].tolist(),
+                candles['close'].tolist(),
+                candles['high'].tolist(),
+                candles['low'].tolist(),
+                candles['vol'].tolist(),
+            )
         table = 'candles'
+        if len(candles) >= COPY_THRESHOLD:
+            return self.copy_many(table=table, data=data)
         return self.upsert_many(table=table, data=data)
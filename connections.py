@@ -1,25 +1,36 @@
-from initials import Const, accounts    # , settings
+import threading
+import time
+from contextlib import contextmanager
+from websockets.exceptions import WebSocketException
+import classes
+import initials
+from initials import Const
 from XTBApi.api import Client as XTB
 from XTBApi.api import STATUS
-from XTBApi.exceptions import CommandFailed
-from classes import Postgres, Mongo
+from XTBApi.exceptions import CommandFailed, SocketError, NotLogged
+import metrics
 from base_loggers import logger
 logger.service = __name__
 
 # Get account information
-# profile = settings[0]
-user = "50155431"
-account: dict = accounts.get(user, {})
-secret = account.get('pass', '')
+# profile = initials.settings[0]
+user = Const.BROKER_USERS[0]
+
+
+def _secret(user: str) -> str:
+    """account password, account.json is read on first use"""
+    return initials.accounts.get(user, {}).get('pass', '')
 
 
 class BrokerConnection:
+    mode = 'real'
+
     def __init__(self) -> None:
         self.client = XTB()
         try:
-            self.client.login(user, secret, mode='real')
+            self.client.login(user, _secret(user), mode=self.mode)
         except CommandFailed as e:
-            logger.error(f'Exchange command failed, {e}')
+            logger.error('Exchange command failed, %s', e)
             return
         logger.debug('Exchange login success')
 
@@ -28,61 +39,184 @@ class BrokerConnection:
             self.__init__()
         return self.client
 
+    @contextmanager
+    def lease(self):
+        yield self.client
+
+    def stats(self) -> dict[str, dict]:
+        return {user: self.client.limiter.stats()}
+
     def logout(self):
         self.client.logout()
         logger.debug('Exchange logout')
 
 
+class BrokerSession:
+    """one logged-in XTB session with its own rate limiter and health"""
+    max_failures = 3
+    cooldown = 30
+
+    def __init__(self, user: str, mode: str, name: str = '') -> None:
+        self.user = user
+        self.mode = mode
+        self.name = name or user
+        self.client = XTB()
+        self.client.on_command = metrics.observe_command
+        self.client.on_relogin = metrics.observe_relogin
+        self.client.on_order = metrics.observe_order
+        self.in_flight = 0
+        self.failures = 0
+        self.down_since = 0.0
+        self.logging_in = False
+        self.login()
+
+    @property
+    def healthy(self) -> bool:
+        return self.client.status == STATUS.LOGGED and self.failures < self.max_failures
+
+    def login(self) -> bool:
+        try:
+            self.client.login(self.user, _secret(self.user), mode=self.mode)
+        except (CommandFailed, SocketError, OSError) as e:
+            logger.error('Exchange login failed for %s, %s', self.user, e)
+            self.down_since = time.monotonic()
+            return False
+        self.failures = 0
+        logger.debug('Exchange login success for %s', self.user)
+        return True
+
+    def __repr__(self) -> str:
+        return f'BrokerSession({self.user}, in_flight={self.in_flight}, failures={self.failures})'
+
+
+class BrokerPool:
+    """N logged-in sessions over Const.BROKER_USERS, requests go to the least busy healthy one"""
+    mode = 'real'
+
+    def __init__(self, users=Const.BROKER_USERS, sessions_per_user: int = Const.BROKER_SESSIONS_PER_USER) -> None:
+        self._lock = threading.Lock()
+        self.sessions = [
+            BrokerSession(u, self.mode, name=f'{u}#{i}') for u in users for i in range(sessions_per_user)
+        ]
+        logger.debug('Broker pool: %s', self.sessions)
+
+    def _retry(self) -> None:
+        """log in again the unhealthy sessions whose cooldown is over, each
+        by one caller and outside the pool lock"""
+        now = time.monotonic()
+        with self._lock:
+            due = [s for s in self.sessions
+                   if not s.healthy and not s.logging_in and now - s.down_since > s.cooldown]
+            for session in due:
+                session.logging_in = True
+        for session in due:
+            try:
+                if session.login():
+                    metrics.observe_relogin()
+            finally:
+                session.logging_in = False
+
+    def _pick(self) -> BrokerSession:
+        self._retry()
+        with self._lock:
+            healthy = [s for s in self.sessions if s.healthy]
+            if not healthy:
+                raise SocketError()
+            session = min(healthy, key=lambda s: s.in_flight)
+            session.in_flight += 1
+        return session
+
+    @contextmanager
+    def lease(self):
+        """borrow the client of the least busy healthy session"""
+        session = self._pick()
+        try:
+            yield session.client
+            session.failures = 0
+        except (SocketError, NotLogged, OSError, WebSocketException) as e:
+            session.failures += 1
+            if not session.healthy:
+                session.down_since = time.monotonic()
+                logger.warning('%s marked unhealthy, %s', session, e)
+            raise
+        finally:
+            with self._lock:
+                session.in_flight -= 1
+
+    def stats(self) -> dict[str, dict]:
+        return {s.name: dict(failures=s.failures, **s.client.limiter.stats()) for s in self.sessions}
+
+    def ping(self) -> None:
+        """keep idle sessions logged in"""
+        for session in self.sessions:
+            if session.healthy:
+                try:
+                    session.client.ping()
+                except (CommandFailed, SocketError, NotLogged, OSError, WebSocketException) as e:
+                    logger.warning('%s ping failed, %s', session, e)
+
+    def logout(self):
+        for session in self.sessions:
+            if session.client.status == STATUS.LOGGED:
+                session.client.logout()
+        logger.debug('Exchange pool logout')
+
+
 class DBConnections:
-    dbname = {Mongo: Const.MONGODB, Postgres: Const.PGDB}
+    """pooled DB clients, safe to share between worker threads"""
 
     def __init__(self) -> None:
-        mongodb = Mongo(Const.MONGODB)
-        pgdb = Postgres(Const.PGDB)
-        self.dbs = [mongodb, pgdb]
+        self._lock = threading.Lock()
+        self.dbname = {classes.Mongo: Const.MONGODB, classes.Postgres: Const.PGDB}
+        self.dbs = {DBClass: DBClass(dbname) for DBClass, dbname in self.dbname.items()}
 
-    def get_connection(self, DBClass: type[Mongo | Postgres]):
-        # find current connection with match DB type, else None
-        conn = next((v for i, v in enumerate(self.dbs) if isinstance(v, DBClass)), None)
+    def get_connection(self, DBClass: type):
+        # find current connection with match DB type, else create one
+        conn = self.dbs.get(DBClass)
         if not conn:
-            dbname = self.dbname[DBClass]
-            conn = DBClass(dbname)
-            self.dbs.append(conn)
+            with self._lock:
+                conn = self.dbs.get(DBClass)
+                if not conn:
+                    conn = self.dbs[DBClass] = DBClass(self.dbname[DBClass])
         return conn
 
-    def get_mongo(self):
-        conn = self.get_connection(Mongo)
-        logger.debug(f'Got Mongo conn: {conn}')
+    def get_mongo(self) -> 'classes.Mongo':
+        conn = self.get_connection(classes.Mongo)
+        logger.debug('Got Mongo conn: %s', conn)
         return conn
 
-    def get_pg(self):
-        conn = self.get_connection(Postgres)
-        logger.debug(f'Got Postgres conn: {conn}')
+    def get_pg(self) -> 'classes.Postgres':
+        conn = self.get_connection(classes.Postgres)
+        logger.debug('Got Postgres conn: %s', conn)
         return conn
 
+    def check(self) -> bool:
+        """cheap liveness check of every backend"""
+        return self.get_pg().ping() and self.get_mongo().ping()
+
     def close_all(self):
-        for conn in self.dbs:
+        for conn in self.dbs.values():
             conn.close()
-            logger.debug(f'Close conn: {conn}')
+            logger.debug('Close conn: %s', conn)
 
 
 class DBConnection:
     def __init__(self, pgdb: str, mongodb: str) -> None:
         self.pgdb = pgdb
         self.mongodb = mongodb
-        self.mongo = Mongo(mongodb)
-        self.pg = Postgres(pgdb)
+        self.mongo = classes.Mongo(mongodb)
+        self.pg = classes.Postgres(pgdb)
 
     def get_mongo(self):
-        if not self.mongo.db:
-            self.mongo = Mongo(self.mongodb)
+        if not self.mongo.ping():
+            self.mongo = classes.Mongo(self.mongodb)
         return self.mongo
 
     def get_pg(self):
         if not self.pg.db:
-            self.pg = Postgres(self.pgdb)
+            self.pg = classes.Postgres(self.pgdb)
         return self.pg
 
     def close_all(self):
-        self.mongo.client.close()
+        self.mongo.close()
         self.pg.close()
@@ -1,16 +1,18 @@
 import functools
 import time
 from loguru import logger
+from metrics import CALL_SECONDS
 
 
 def timer(func):
-    """Print the runtime of the decorated function"""
+    """Log the runtime of the decorated function and record it in metrics.CALL_SECONDS"""
     @functools.wraps(func)
     def wrapper_timer(*args, **kwargs):
         start_time = time.perf_counter()
         value = func(*args, **kwargs)
         end_time = time.perf_counter()
         run_time = end_time - start_time
-        logger.debug(f"Finished {func.__name__}() in {run_time: .4f} secs")
+        CALL_SECONDS.observe(run_time, function=func.__qualname__)
+        logger.debug("Finished {}() in {: .4f} secs", func.__name__, run_time)
         return value
     return wrapper_timer
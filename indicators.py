@@ -0,0 +1,319 @@
+"""
+Incremental indicators for initials.ind_presets
+
+Every series keeps the running state of its indicators (EMA value, RSI
+average gain/loss, stochastic windows), so a new candle costs O(1) and a
+restart resumes from the state stored in Mongo. Indicators shared by
+several presets are computed once per series. Prices are in points, as
+stored (open + close/high/low deltas).
+"""
+from collections import deque
+from datetime import datetime, timezone
+from threading import Lock
+from initials import Const, ind_presets
+from base_loggers import logger
+logger.service = __name__
+
+# a series without state fed at least this many candles is computed by
+# indicators_batch in one pass
+BATCH_MIN_CANDLES = 1000
+
+
+class EMA:
+    """exponential moving average, seeded with the SMA of the first `length` closes"""
+    __slots__ = ('length', 'alpha', 'count', 'total', 'value')
+
+    def __init__(self, length: int) -> None:
+        self.length = length
+        self.alpha = 2 / (length + 1)
+        self.count = 0
+        self.total = 0.0
+        self.value = None
+
+    def update(self, high: float, low: float, close: float) -> float | None:
+        if self.value is None:
+            self.count += 1
+            self.total += close
+            if self.count == self.length:
+                self.value = self.total / self.length
+        else:
+            self.value += self.alpha * (close - self.value)
+        return self.value
+
+    def to_dict(self) -> dict:
+        return {'count': self.count, 'total': self.total, 'value': self.value}
+
+    def load(self, state: dict) -> None:
+        self.count, self.total, self.value = state['count'], state['total'], state['value']
+
+
+class RSI:
+    """Wilder's relative strength index"""
+    __slots__ = ('length', 'prev', 'count', 'gain', 'loss', 'value')
+
+    def __init__(self, length: int) -> None:
+        self.length = length
+        self.prev = None
+        self.count = 0
+        self.gain = 0.0
+        self.loss = 0.0
+        self.value = None
+
+    def update(self, high: float, low: float, close: float) -> float | None:
+        if self.prev is None:
+            self.prev = close
+            return None
+        change, self.prev = close - self.prev, close
+        gain, loss = max(change, 0.0), max(-change, 0.0)
+        if self.count < self.length:
+            # simple average of the first `length` changes
+            self.count += 1
+            self.gain += gain / self.length
+            self.loss += loss / self.length
+            if self.count < self.length:
+                return None
+        else:
+            self.gain += (gain - self.gain) / self.length
+            self.loss += (loss - self.loss) / self.length
+        self.value = 100.0 if not self.loss else 100.0 - 100.0 / (1.0 + self.gain / self.loss)
+        return self.value
+
+    def to_dict(self) -> dict:
+        return {'prev': self.prev, 'count': self.count, 'gain': self.gain, 'loss': self.loss, 'value': self.value}
+
+    def load(self, state: dict) -> None:
+        self.prev, self.count, self.gain, self.loss, self.value = (
+            state['prev'], state['count'], state['gain'], state['loss'], state['value'])
+
+
+class Stoch:
+    """stochastic oscillator: %K over `k` candles smoothed over `smooth_k`, %D over `d`"""
+    __slots__ = ('k', 'd', 'smooth_k', 'highs', 'lows', 'raw', 'ks', 'value')
+
+    def __init__(self, k: int, d: int, smooth_k: int) -> None:
+        self.k = k
+        self.d = d
+        self.smooth_k = smooth_k
+        self.highs = deque(maxlen=k)
+        self.lows = deque(maxlen=k)
+        self.raw = deque(maxlen=smooth_k)
+        self.ks = deque(maxlen=d)
+        self.value = None
+
+    def update(self, high: float, low: float, close: float) -> tuple | None:
+        self.highs.append(high)
+        self.lows.append(low)
+        if len(self.highs) < self.k:
+            return None
+        top, bottom = max(self.highs), min(self.lows)
+        self.raw.append(100.0 * (close - bottom) / (top - bottom) if top > bottom else 50.0)
+        if len(self.raw) < self.smooth_k:
+            return None
+        self.ks.append(sum(self.raw) / self.smooth_k)
+        if len(self.ks) < self.d:
+            return None
+        self.value = (self.ks[-1], sum(self.ks) / self.d)
+        return self.value
+
+    def to_dict(self) -> dict:
+        return {'highs': list(self.highs), 'lows': list(self.lows), 'raw': list(self.raw),
+                'ks': list(self.ks), 'value': self.value and list(self.value)}
+
+    def load(self, state: dict) -> None:
+        self.highs.extend(state['highs'])
+        self.lows.extend(state['lows'])
+        self.raw.extend(state['raw'])
+        self.ks.extend(state['ks'])
+        self.value = state['value'] and tuple(state['value'])
+
+
+def _key(spec: dict) -> str:
+    """indicator identity, equal for the same indicator in several presets"""
+    if spec['kind'] == 'stoch':
+        return f"stoch_{spec['k']}_{spec['d']}_{spec['smooth_k']}"
+    return f"{spec['kind']}_{spec['length']}"
+
+
+def _new(spec: dict):
+    if spec['kind'] == 'ema':
+        return EMA(spec['length'])
+    if spec['kind'] == 'rsi':
+        return RSI(spec['length'])
+    if spec['kind'] == 'stoch':
+        return Stoch(spec['k'], spec['d'], spec['smooth_k'])
+    raise ValueError(f"Unknown indicator kind {spec['kind']}")
+
+
+def _cross(prev: float | None, value: float, level: float) -> int:
+    """+1 crossing above level, -1 crossing below, else 0"""
+    if prev is None:
+        return 0
+    return (prev <= level < value) - (prev >= level > value)
+
+
+def preset_signal(preset: list[dict], values: dict, prev: dict) -> int:
+    """+1 buy, -1 sell, 0 none: oscillators leaving the oversold (xb) or
+    overbought (xa) zone, EMA crossovers of the first (fast) over the second"""
+    spec = preset[0]
+    if spec['kind'] == 'ema':
+        fast, slow = (values[_key(s)] for s in preset[:2])
+        before = prev.get('diff')
+        prev['diff'] = fast - slow
+        return _cross(before, fast - slow, 0.0)
+    value = values[_key(spec)]
+    if spec['kind'] == 'stoch':
+        value = value[0]
+    before = prev.get('value')
+    prev['value'] = value
+    if 'xb' not in spec:
+        return 0
+    return (_cross(before, value, spec['xb']) > 0) - (_cross(before, value, spec['xa']) < 0)
+
+
+class SeriesIndicators:
+    """indicator states of one series, shared by its presets"""
+    def __init__(self, presets: dict[str, list[dict]]) -> None:
+        self.presets = presets
+        self.last_ctm = 0
+        self.indicators = {_key(spec): _new(spec) for preset in presets.values() for spec in preset}
+        self.prev: dict[str, dict] = {name: {} for name in presets}
+
+    def update(self, ctm: int, high: float, low: float, close: float) -> dict | None:
+        """add one closed candle, return indicator values and preset signals
+        once every indicator is warmed up"""
+        self.last_ctm = ctm
+        values = {key: ind.update(high, low, close) for key, ind in self.indicators.items()}
+        if any(v is None for v in values.values()):
+            return None
+        signals = {name: preset_signal(preset, values, self.prev[name]) for name, preset in self.presets.items()}
+        return {'_id': ctm, 'values': values, 'signals': signals}
+
+    def to_dict(self) -> dict:
+        return {'last_ctm': self.last_ctm, 'prev': self.prev,
+                'indicators': {key: ind.to_dict() for key, ind in self.indicators.items()}}
+
+    def load(self, doc: dict) -> None:
+        self.last_ctm = doc['last_ctm']
+        self.prev.update((k, v) for k, v in doc['prev'].items() if k in self.prev)
+        for key, state in doc['indicators'].items():
+            if key in self.indicators:
+                self.indicators[key].load(state)
+
+
+def series_name(symbol: str, timeframe: int) -> str:
+    """_id in indicator_state, ind_<name> holds the per-candle documents"""
+    return f'{symbol}_{timeframe}'
+
+
+def _rows(candles):
+    """(ctm, high, low, close) in points, candles as list of dicts or CandleBlock"""
+    if isinstance(candles, list):
+        return [(int(c['ctm']), c['open'] + c['high'], c['open'] + c['low'], c['open'] + c['close'])
+                for c in candles]
+    _open = candles['open']
+    return list(zip(candles.ctm.tolist(), (_open + candles['high']).tolist(),
+                    (_open + candles['low']).tolist(), (_open + candles['close']).tolist()))
+
+
+def _batch(series: SeriesIndicators, rows: list[tuple]) -> list[dict]:
+    """SeriesIndicators.update of every row, vectorized"""
+    import numpy as np
+    from indicators_batch import compute, to_docs
+    ctm, high, low, close = (np.array(col) for col in zip(*rows))
+    result = compute(ctm, high, low, close, series.presets)
+    series.load(result['state'])
+    return to_docs(result)
+
+
+class IndicatorEngine:
+    """SeriesIndicators by series name, state persisted in one Mongo collection.
+
+    With a TradingHoursCache, candles apart only by closed market hours
+    count as consecutive"""
+    collection = 'indicator_state'
+
+    def __init__(self, dbs, presets: list[str] | None = None, hours=None) -> None:
+        self.dbs = dbs
+        self.hours = hours
+        self.presets = {name: ind_presets[name] for name in (presets or ind_presets)}
+        self.series: dict[str, SeriesIndicators] = {}
+        self.docs: dict[str, dict] | None = None
+        self.dirty: set[str] = set()
+        self._lock = Lock()
+
+    def load(self) -> None:
+        mongodb = self.dbs.get_mongo()
+        self.docs = {doc['_id']: doc for doc in mongodb.find_all(self.collection)}
+        logger.debug('Loaded %s indicator states', len(self.docs))
+
+    def get(self, name: str) -> SeriesIndicators:
+        with self._lock:
+            series = self.series.get(name)
+            if series is None:
+                series = self.series[name] = SeriesIndicators(self.presets)
+                doc = (self.docs or {}).get(name)
+                if doc:
+                    series.load(doc)
+        return series
+
+    def _history(self, symbol: str, timeframe: int, since: int, until: int) -> list[tuple]:
+        """stored (ctm, high, low, close) of a series after ctm since"""
+        pgdb = self.dbs.get_pg()
+        rows = pgdb.fetch_candles(Const.SYMBOL_ID[symbol], Const.PERIOD_ID[timeframe], since + 1)
+        rows = rows[rows[:, 0] <= until]
+        _open = rows[:, 1]
+        return list(zip(rows[:, 0].astype('int64').tolist(), (_open + rows[:, 3]).tolist(),
+                        (_open + rows[:, 4]).tolist(), (_open + rows[:, 2]).tolist()))
+
+    def _gap(self, symbol: str, timeframe: int, ctm: int, next_ctm: int) -> bool:
+        """candles missing between the ones at ctm and next_ctm (ms) while
+        the market was open"""
+        span = timeframe * 60_000
+        if next_ctm - ctm <= span:
+            return False
+        if self.hours is None:
+            return True
+        try:
+            next_open = self.hours.next_open(symbol, (ctm + span) / 1000)
+        except Exception as e:
+            logger.warning('Trading hours of %s unavailable, %s', symbol, e)
+            return True
+        return next_open is not None and next_open * 1000 < next_ctm
+
+    def update(self, symbol: str, timeframe: int, candles) -> list[dict]:
+        """feed the closed candles newer than the series state, in time order;
+        store and return one document per warmed up candle.
+
+        candles are the ones just stored. A series without state is seeded
+        from the stored history, as are candles that do not follow on from
+        the state, so indicators never run across a gap"""
+        name = series_name(symbol, timeframe)
+        series = self.get(name)
+        # the latest candle may still be forming
+        closed_by = int(datetime.now(timezone.utc).timestamp() * 1000) - timeframe * 60_000
+        rows = [row for row in sorted(_rows(candles)) if series.last_ctm < row[0] <= closed_by]
+        ctms = [series.last_ctm] + [row[0] for row in rows]
+        if rows and (not series.last_ctm or any(
+                self._gap(symbol, timeframe, a, b) for a, b in zip(ctms, ctms[1:]))):
+            rows = self._history(symbol, timeframe, series.last_ctm, closed_by)
+        if not series.last_ctm and len(rows) >= BATCH_MIN_CANDLES:
+            results = _batch(series, rows)
+        else:
+            results = [res for res in (series.update(*row) for row in rows) if res]
+        with self._lock:
+            self.dirty.add(name)
+        if results:
+            mongodb = self.dbs.get_mongo()
+            mongodb.set_many(f'ind_{name}', results)
+            fired = {k: v for k, v in results[-1]['signals'].items() if v}
+            if fired:
+                logger.info('Indicator signals %s: %s', name, fired)
+        return results
+
+    def flush(self) -> int:
+        with self._lock:
+            names, self.dirty = self.dirty, set()
+        if not names:
+            return 0
+        mongodb = self.dbs.get_mongo()
+        return mongodb.set_many(self.collection, [dict(self.series[n].to_dict(), _id=n) for n in names])
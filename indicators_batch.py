@@ -0,0 +1,311 @@
+"""
+Batch indicators for initials.ind_presets
+
+Recomputes the ind_presets indicators of whole series from the `candles`
+table with NumPy: EMA and Wilder smoothing in closed form over chunks,
+stochastic windows with sliding_window_view. Series are spread over a
+process pool and written back in bulk, replacing `ind_<series>` and the
+incremental state in `indicator_state`, so the collector's IndicatorEngine
+resumes where the batch stopped. Run it while the collector daemon is
+stopped, a running daemon would overwrite the state with its own.
+
+    python indicators_batch.py [--workers 4] [--presets TA_RSI_L14_XA70_XB30 ...]
+"""
+import argparse
+import os
+import bson
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from bson.raw_bson import RawBSONDocument
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from time import perf_counter
+from initials import Const, ind_presets
+from connections import DBConnections
+from indicators import IndicatorEngine, SeriesIndicators, _key, series_name
+from base_loggers import logger, init_logging
+logger.service = __name__
+
+# a chunk of the closed form EMA spans weights up to this ratio,
+# large enough for few chunks, small enough to keep float64 precision
+CHUNK_GROWTH = 1e6
+
+
+def smooth(x: np.ndarray, alpha: float, seed: float) -> np.ndarray:
+    """y[t] = y[t-1] + alpha * (x[t] - y[t-1]) from y[-1] = seed.
+
+    Within a chunk of m values y = (seed + alpha * cumsum(x / b^(j+1))) * b^(t+1)
+    with b = 1 - alpha; chunks are computed at once as rows of a matrix and
+    only their seeds are chained"""
+    b = 1.0 - alpha
+    n = len(x)
+    if not n:
+        return np.empty(0)
+    if b <= 0.0:
+        return x.astype(np.float64)
+    m = int(min(n, max(1, np.log(CHUNK_GROWTH) // -np.log(b))))
+    rows = -(-n // m)
+    grid = np.zeros(rows * m)
+    grid[:n] = x
+    grid = grid.reshape(rows, m)
+    decay = b ** np.arange(1, m + 1)
+    z = alpha * np.cumsum(grid / decay, axis=1) * decay
+    seeds = np.empty(rows)
+    s, bm = seed, decay[-1]
+    for i, end in enumerate(z[:, -1].tolist()):
+        seeds[i] = s
+        s = bm * s + end
+    return (z + seeds[:, None] * decay).ravel()[:n]
+
+
+def ema(close: np.ndarray, length: int) -> np.ndarray:
+    """EMA seeded with the SMA of the first `length` closes, NaN before"""
+    out = np.full(len(close), np.nan)
+    if len(close) >= length:
+        seed = close[:length].sum() / length
+        out[length - 1] = seed
+        out[length:] = smooth(close[length:], 2 / (length + 1), seed)
+    return out
+
+
+def wilder(close: np.ndarray, length: int) -> tuple[np.ndarray, np.ndarray]:
+    """Wilder averages of gains and losses, NaN before candle `length`"""
+    change = np.diff(close)
+    gains, losses = np.maximum(change, 0.0), np.maximum(-change, 0.0)
+    avg_gain, avg_loss = np.full(len(close), np.nan), np.full(len(close), np.nan)
+    if len(change) >= length:
+        for avg, x in ((avg_gain, gains), (avg_loss, losses)):
+            seed = x[:length].sum() / length
+            avg[length] = seed
+            avg[length + 1:] = smooth(x[length:], 1 / length, seed)
+    return avg_gain, avg_loss
+
+
+def rsi(gain: np.ndarray, loss: np.ndarray) -> np.ndarray:
+    """Wilder's RSI of the wilder() averages"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        value = 100.0 - 100.0 / (1.0 + gain / loss)
+    return np.where(loss == 0.0, 100.0, value)
+
+
+def _window_mean(x: np.ndarray, length: int) -> np.ndarray:
+    """mean of the last `length` values, NaN before"""
+    out = np.full(len(x), np.nan)
+    if len(x) >= length:
+        out[length - 1:] = sliding_window_view(x, length).mean(axis=1)
+    return out
+
+
+def stoch(high: np.ndarray, low: np.ndarray, close: np.ndarray,
+          k: int, d: int, smooth_k: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """raw %K, smoothed %K and %D, NaN before they are defined"""
+    raw = np.full(len(close), np.nan)
+    if len(close) >= k:
+        top = sliding_window_view(high, k).max(axis=1)
+        bottom = sliding_window_view(low, k).min(axis=1)
+        span = top - bottom
+        with np.errstate(divide='ignore', invalid='ignore'):
+            raw[k - 1:] = np.where(span > 0, 100.0 * (close[k - 1:] - bottom) / span, 50.0)
+    first = min(len(close), k - 1)
+    _k = np.full(len(close), np.nan)
+    _k[first:] = _window_mean(raw[first:], smooth_k)
+    first = min(len(close), k + smooth_k - 2)
+    _d = np.full(len(close), np.nan)
+    _d[first:] = _window_mean(_k[first:], d)
+    return raw, _k, _d
+
+
+def _cross(prev: np.ndarray, value: np.ndarray, level: float) -> np.ndarray:
+    """+1 crossing above level, -1 crossing below, else 0, per row"""
+    up = (prev <= level) & (level < value)
+    down = (prev >= level) & (level > value)
+    return up.astype(np.int8) - down.astype(np.int8)
+
+
+def _signals(preset: list[dict], columns: dict) -> tuple[np.ndarray, str, np.ndarray]:
+    """(signal per row, prev field, its values) as indicators.preset_signal"""
+    spec = preset[0]
+    if spec['kind'] == 'ema':
+        diff = columns[_key(preset[0])] - columns[_key(preset[1])]
+        line, field = diff, 'diff'
+        signal = _cross(diff[:-1], diff[1:], 0.0)
+    else:
+        line = columns[_key(spec)]
+        if spec['kind'] == 'stoch':
+            line = line[0]
+        field = 'value'
+        if 'xb' in spec:
+            signal = ((_cross(line[:-1], line[1:], spec['xb']) > 0).astype(np.int8) -
+                      (_cross(line[:-1], line[1:], spec['xa']) < 0).astype(np.int8))
+        else:
+            signal = np.zeros(len(line) - 1, dtype=np.int8)
+    return np.concatenate([np.zeros(min(len(line), 1), dtype=np.int8), signal]), field, line
+
+
+def compute(ctm: np.ndarray, high: np.ndarray, low: np.ndarray, close: np.ndarray,
+            presets: dict[str, list[dict]]) -> dict:
+    """indicators of one series in time order.
+
+    Returns ctm, values by indicator key, signals by preset of the warmed up
+    candles as arrays, and the SeriesIndicators state after the last candle"""
+    n = len(close)
+    columns, first = {}, 0
+    for preset in presets.values():
+        for spec in preset:
+            key = _key(spec)
+            if key in columns:
+                continue
+            if spec['kind'] == 'ema':
+                columns[key] = ema(close, spec['length'])
+                first = max(first, spec['length'] - 1)
+            elif spec['kind'] == 'rsi':
+                gain, loss = wilder(close, spec['length'])
+                columns[key] = (rsi(gain, loss), gain, loss)
+                first = max(first, spec['length'])
+            elif spec['kind'] == 'stoch':
+                columns[key] = stoch(high, low, close, spec['k'], spec['d'], spec['smooth_k'])
+                first = max(first, spec['k'] + spec['smooth_k'] + spec['d'] - 3)
+            else:
+                raise ValueError(f"Unknown indicator kind {spec['kind']}")
+    if n <= first:
+        # not warmed up, the incremental state is exact and cheap
+        series = SeriesIndicators(presets)
+        for row in zip(ctm.tolist(), high.tolist(), low.tolist(), close.tolist()):
+            series.update(*row)
+        return {'ctm': ctm[:0], 'values': {}, 'signals': {}, 'state': series.to_dict()}
+
+    # every indicator is warmed up from here, the state is its last values
+    state, values = {}, {}
+    for preset in presets.values():
+        for spec in preset:
+            key = _key(spec)
+            if spec['kind'] == 'ema':
+                length, col = spec['length'], columns[key]
+                state[key] = {'count': length, 'total': float(close[:length].sum()), 'value': float(col[-1])}
+                values[key] = col[first:]
+            elif spec['kind'] == 'rsi':
+                col, gain, loss = columns[key]
+                state[key] = {'prev': float(close[-1]), 'count': spec['length'], 'gain': float(gain[-1]),
+                              'loss': float(loss[-1]), 'value': float(col[-1])}
+                values[key] = col[first:]
+            else:
+                raw, _k, _d = columns[key]
+                state[key] = {'highs': high[-spec['k']:].tolist(), 'lows': low[-spec['k']:].tolist(),
+                              'raw': raw[-spec['smooth_k']:].tolist(), 'ks': _k[-spec['d']:].tolist(),
+                              'value': [float(_k[-1]), float(_d[-1])]}
+                values[key] = (_k[first:], _d[first:])
+    signals, prev = {}, {}
+    for name, preset in presets.items():
+        signals[name], field, line = _signals(preset, values)
+        prev[name] = {field: float(line[-1])}
+    return {'ctm': ctm[first:], 'values': values, 'signals': signals,
+            'state': {'last_ctm': int(ctm[-1]), 'prev': prev, 'indicators': state}}
+
+
+def to_docs(result: dict) -> list[dict]:
+    """one `ind_<series>` document per candle, as IndicatorEngine.update"""
+    keys = list(result['values'])
+    columns = [[list(kd) for kd in zip(col[0].tolist(), col[1].tolist())] if isinstance(col, tuple)
+               else col.tolist() for col in result['values'].values()]
+    names = list(result['signals'])
+    signals = [s.tolist() for s in result['signals'].values()]
+    return [{'_id': ctm, 'values': dict(zip(keys, vals)), 'signals': dict(zip(names, sig))}
+            for ctm, vals, sig in zip(result['ctm'].tolist(), zip(*columns), zip(*signals))]
+
+
+def _batch(rows: np.ndarray, presets: dict[str, list[dict]], full: bool) -> tuple[list, dict]:
+    """process pool job: (documents, state) of fetch_candles rows, documents
+    BSON encoded for replace_collection when full, else as dotted field
+    updates for set_many. Encoding them here keeps the parent to the writes"""
+    _open = rows[:, 1]
+    result = compute(rows[:, 0].astype(np.int64), _open + rows[:, 3], _open + rows[:, 4],
+                     _open + rows[:, 2], presets)
+    docs = to_docs(result)
+    if full:
+        return [bson.encode(doc) for doc in docs], result['state']
+    return [dict({f'{field}.{k}': v for field in ('values', 'signals') for k, v in doc[field].items()},
+                 _id=doc['_id']) for doc in docs], result['state']
+
+
+class BatchEngine:
+    """recompute ind_<series> of many series on a process pool.
+
+    With every preset, ind_<series> and the incremental state are replaced;
+    with some presets only their fields of ind_<series> are updated"""
+    def __init__(self, dbs: DBConnections, presets: list[str] | None = None,
+                 workers: int | None = None) -> None:
+        self.dbs = dbs
+        self.presets = {name: ind_presets[name] for name in (presets or ind_presets)}
+        self.workers = workers or os.cpu_count()
+        self.full = self.presets.keys() == ind_presets.keys()
+
+    def load(self, symbol: str, timeframe: int) -> np.ndarray:
+        """closed candles of a series from Postgres"""
+        pgdb = self.dbs.get_pg()
+        rows = pgdb.fetch_candles(Const.SYMBOL_ID[symbol], Const.PERIOD_ID[timeframe])
+        # the latest candle may still be forming
+        closed_by = int(datetime.now(timezone.utc).timestamp() * 1000) - timeframe * 60_000
+        return rows[rows[:, 0] <= closed_by]
+
+    def store(self, name: str, docs: list) -> int:
+        mongodb = self.dbs.get_mongo()
+        if self.full:
+            return mongodb.replace_collection(f'ind_{name}', [RawBSONDocument(doc) for doc in docs])
+        return mongodb.set_many(f'ind_{name}', docs)
+
+    def run(self, series=Const.SYMBOL_DEFAULT) -> dict[str, int]:
+        """documents written per series, -1 for failed series; the state of
+        a series is saved only when its documents were stored"""
+        counts, states = {}, {}
+        start = perf_counter()
+        with ThreadPoolExecutor(max_workers=Const.COLLECT_WORKERS, thread_name_prefix='batch') as io, \
+                ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context('spawn')) as procs:
+            loads = {io.submit(self.load, symbol, timeframe): series_name(symbol, timeframe)
+                     for symbol, timeframe in series}
+            computes = {}
+            for future in as_completed(loads):
+                name = loads[future]
+                try:
+                    computes[procs.submit(_batch, future.result(), self.presets, self.full)] = name
+                except Exception as e:
+                    logger.error('Indicator batch %s load failed, %s', name, e)
+                    counts[name] = -1
+            stores = {}
+            for future in as_completed(computes):
+                name = computes[future]
+                try:
+                    docs, state = future.result()
+                except Exception as e:
+                    logger.error('Indicator batch %s failed, %s', name, e)
+                    counts[name] = -1
+                    continue
+                if self.full:
+                    states[name] = dict(state, _id=name)
+                stores[io.submit(self.store, name, docs)] = name
+            for future in as_completed(stores):
+                name = stores[future]
+                try:
+                    counts[name] = future.result()
+                except Exception as e:
+                    logger.error('Indicator batch %s store failed, %s', name, e)
+                    counts[name] = -1
+        states = [state for name, state in states.items() if counts[name] >= 0]
+        if states:
+            mongodb = self.dbs.get_mongo()
+            mongodb.set_many(IndicatorEngine.collection, states)
+        logger.info('Indicator batch of %s series in %.2fs: %s', len(counts), perf_counter() - start, counts)
+        return counts
+
+
+if __name__ == '__main__':
+    from XTBApi import setup_logging
+    setup_logging()
+    init_logging()
+    parser = argparse.ArgumentParser(description='recompute the ind_presets indicators of stored candles')
+    parser.add_argument('--workers', type=int, default=None, help='compute processes, default one per CPU')
+    parser.add_argument('--presets', nargs='+', default=None, choices=sorted(ind_presets))
+    args = parser.parse_args()
+    dbs = DBConnections()
+    BatchEngine(dbs, presets=args.presets, workers=args.workers).run()
+    dbs.close_all()
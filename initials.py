@@ -3,10 +3,8 @@ Initialize Spider service
 """
 # import os
 import json
-from classes import Settings
+from functools import cache
 from base_loggers import logger
-from dotenv import load_dotenv
-load_dotenv()
 logger.service = __name__
 
 
@@ -14,6 +12,24 @@ class Const:
     """Constant class"""
     MONGODB = 'xtb'
     PGDB = 'tinyco'
+    COLLECT_WORKERS = 4
+    BROKER_USERS = ("50155431",)
+    BROKER_SESSIONS_PER_USER = 2
+    # daemon: seconds after a candle close before it is fetched, server clock resync
+    CLOSE_DELAY = 2
+    CLOCK_SYNC_SECS = 3600
+    # daemon: seconds before a failed run is retried
+    RETRY_SECS = 10
+    # build higher timeframes of a symbol from its lowest one, check against
+    # the broker every RESAMPLE_CHECK_EVERY runs (0: never); needs numpy
+    RESAMPLE = False
+    RESAMPLE_CHECK_EVERY = 24
+    # further behind than this many base candles, series catch up on their own
+    RESAMPLE_MAX_CANDLES = 2000
+    # no present candle requests while the market is closed
+    SKIP_CLOSED = True
+    # update the ind_presets indicators of every collected series; needs numpy
+    INDICATORS = False
     SYMBOL_DEFAULT = (
         ('GOLD', 5), ('GOLD', 15), ('GOLD', 30), ('GOLD', 60),
         ('GOLD.FUT', 15), ('GOLD.FUT', 30), ('GOLD.FUT', 60),
@@ -67,10 +83,32 @@ ind_presets = {
     ],
 }
 
-# Account configuration loading
-accounts: dict = json.load(open('account.json'))
-# Setting configuration loading
-settings = Settings(**json.load(open('settings.json')))
+
+@cache
+def load_accounts() -> dict:
+    """Account configuration loading"""
+    with open('account.json') as f:
+        return json.load(f)
+
+
+@cache
+def load_settings():
+    """Setting configuration loading"""
+    from classes import Settings
+    with open('settings.json') as f:
+        return Settings(**json.load(f))
+
+
+def __getattr__(name: str):
+    # `accounts` and `settings` are read on first access, not at import
+    if name == 'accounts':
+        return load_accounts()
+    if name == 'settings':
+        return load_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == '__main__':
-    logger.warning(str(settings))
+    from base_loggers import init_logging
+    init_logging()
+    logger.warning(str(load_settings()))
@@ -0,0 +1,201 @@
+"""
+Pipeline metrics, exported in OpenMetrics text format
+"""
+import os
+import threading
+from bisect import bisect_left
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{k}="{v}"' for k, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, doc: str, labelnames: tuple = ()) -> None:
+        self.name = name
+        self.doc = doc
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[k]) for k in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f'# TYPE {self.name} {self.kind}', f'# HELP {self.name} {self.doc}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value: float, **labels) -> None:
+        """mirror a total kept elsewhere, it only ever grows"""
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f'{self.name}_total{_labels(self.labelnames, k)} {v}' for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f'{self.name}{_labels(self.labelnames, k)} {v}' for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, doc: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, doc, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            items = [(k, (list(c), s)) for k, (c, s) in self._values.items()]
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {total}')
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: list[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """OpenMetrics text exposition"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+BROKER_SECONDS = REGISTRY.register(Histogram(
+    'xtb_command_seconds', 'Broker round trip time per command', ('command',)))
+BROKER_ERRORS = REGISTRY.register(Counter(
+    'xtb_command_errors', 'Failed broker commands', ('command',)))
+BROKER_RELOGINS = REGISTRY.register(Counter(
+    'xtb_relogins', 'Broker sessions logged in again after a failure'))
+LIMITER_WAIT = REGISTRY.register(Counter(
+    'xtb_limiter_wait_seconds', 'Time spent waiting on the rate limiter', ('session',)))
+LIMITER_BACKOFFS = REGISTRY.register(Counter(
+    'xtb_limiter_backoffs', 'Rate limiter backoffs after throttling', ('session',)))
+CANDLES_FETCHED = REGISTRY.register(Counter(
+    'candles_fetched', 'Candles received from the broker', ('series',)))
+CANDLES_INSERTED = REGISTRY.register(Counter(
+    'candles_inserted', 'New candles stored', ('series', 'sink')))
+CANDLES_SKIPPED = REGISTRY.register(Counter(
+    'candles_skipped', 'Fetched candles already stored', ('series', 'sink')))
+ORDER_SECONDS = REGISTRY.register(Histogram(
+    'xtb_order_seconds', 'Order latency from submit, to the tradeTransaction response and to the final status',
+    ('stage',)))
+RESAMPLE_CHECKS = REGISTRY.register(Counter(
+    'resample_checks', 'Resampled candles compared with the broker', ('series',)))
+RESAMPLE_MISMATCHES = REGISTRY.register(Counter(
+    'resample_mismatches', 'Resampled candles that differ from the broker', ('series',)))
+CALL_SECONDS = REGISTRY.register(Histogram(
+    'call_seconds', 'Run time of functions decorated with decorators.timer', ('function',)))
+
+
+def observe_command(command: str, seconds: float, error: bool) -> None:
+    """XTBApi BaseClient.on_command hook"""
+    BROKER_SECONDS.observe(seconds, command=command)
+    if error:
+        BROKER_ERRORS.inc(command=command)
+
+
+def observe_order(stage: str, seconds: float) -> None:
+    """XTBApi Client.on_order hook"""
+    ORDER_SECONDS.observe(seconds, stage=stage)
+
+
+def observe_relogin() -> None:
+    """XTBApi BaseClient.on_relogin hook"""
+    BROKER_RELOGINS.inc()
+
+
+def observe_limiters(stats: dict) -> None:
+    """limiter totals by session name, as counted by each RateLimiter"""
+    for session, stat in stats.items():
+        LIMITER_WAIT.set(stat['wait_seconds'], session=session)
+        LIMITER_BACKOFFS.set(stat['backoffs'], session=session)
+
+
+def export(path: str | None = None) -> None:
+    """write the exposition to path (atomic rename), for a textfile scraper,
+    METRICS_PATH by default"""
+    if path is None:
+        path = os.getenv("METRICS_PATH", "")
+    if not path:
+        return
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        f.write(REGISTRY.render())
+    os.replace(tmp, path)
+
+
+def serve(port: int | None = None):
+    """serve the exposition over HTTP from a daemon thread, on METRICS_PORT
+    by default"""
+    if port is None:
+        port = int(os.getenv("METRICS_PORT", 9108))
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            body = REGISTRY.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/openmetrics-text; version=1.0.0; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args) -> None:
+            pass
+
+    server = ThreadingHTTPServer(('', port), _Handler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    return server
@@ -0,0 +1,176 @@
+from datetime import datetime
+from initials import Const
+from connections import BrokerConnection, DBConnections
+from XTBApi.api import LOGIN_TIMEOUT
+from XTBApi.streaming import StreamClient
+from XTBApi.trading_hours import SERVER_TZ
+from time import sleep
+from base_loggers import logger, init_logging
+from XTBApi import setup_logging
+logger.service = __name__
+
+
+class CandleAggregator:
+    """Build closed candles of one series from streamed 1-minute candles,
+    in the same point/delta format as getChartRangeRequest rateInfos.
+
+    Only buckets that saw their first minute and no gap are returned; the
+    starts of the others (first bucket after a (re)connect, minutes lost)
+    are collected in `incomplete`.
+
+    Buckets up to H1 start at multiples of the timeframe since the epoch,
+    H4 and D1 ones at multiples from midnight server time, as the broker's"""
+    def __init__(self, symbol: str, timeframe: int, digits: int) -> None:
+        if timeframe > 1440:
+            raise ValueError(f'{symbol}_{timeframe}: streamed candles aggregate up to D1')
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.digits = digits
+        self.span = timeframe * 60_000
+        self.bucket = None
+        self.incomplete: list[int] = []
+
+    def _start(self, ctm: int) -> int:
+        """start of the bucket of the minute at ctm (ms)"""
+        if self.timeframe <= 60:
+            return ctm - ctm % self.span
+        offset = datetime.fromtimestamp(ctm / 1000, SERVER_TZ).utcoffset()
+        return ctm - (ctm + int(offset.total_seconds()) * 1000) % self.span
+
+    def _points(self, price: float) -> int:
+        return round(price * 10 ** self.digits)
+
+    def _close_bucket(self, closed: list) -> None:
+        b, self.bucket = self.bucket, None
+        if not b['complete']:
+            self.incomplete.append(b['ctm'])
+            return
+        closed.append({
+            'ctm': b['ctm'],
+            'ctmString': b['ctmString'],
+            'open': b['open'],
+            'close': b['close'] - b['open'],
+            'high': b['high'] - b['open'],
+            'low': b['low'] - b['open'],
+            'vol': b['vol'],
+        })
+
+    def add(self, candle: dict) -> list:
+        """add a 1-minute candle, return candles closed by it"""
+        closed = []
+        ctm = int(candle['ctm'])
+        start = self._start(ctm)
+        if self.bucket and self.bucket['ctm'] != start:
+            # previous bucket missed its last minute(s)
+            self.bucket['complete'] = False
+            self._close_bucket(closed)
+        if not self.bucket:
+            self.bucket = {
+                'complete': ctm == start,
+                'ctm': start,
+                'ctmString': candle['ctmString'],
+                'open': self._points(candle['open']),
+                'high': self._points(candle['high']),
+                'low': self._points(candle['low']),
+                'close': self._points(candle['close']),
+                'vol': candle['vol'],
+            }
+        else:
+            if ctm != self.bucket['next']:
+                self.bucket['complete'] = False
+            self.bucket['high'] = max(self.bucket['high'], self._points(candle['high']))
+            self.bucket['low'] = min(self.bucket['low'], self._points(candle['low']))
+            self.bucket['close'] = self._points(candle['close'])
+            self.bucket['vol'] += candle['vol']
+        self.bucket['next'] = ctm + 60_000
+        if ctm + 60_000 >= start + self.span:
+            self._close_bucket(closed)
+        return closed
+
+
+class StreamTask:
+    def __init__(self, dbs: DBConnections, broker: BrokerConnection, series=Const.SYMBOL_SUBSCRIBE) -> None:
+        self.dbs = dbs
+        self.broker = broker
+        self.series = series
+        self.aggregators: dict[str, list[CandleAggregator]] = {}
+        self.stream = None
+
+    def setup(self) -> None:
+        bkr_client = self.broker.client
+        for symbol, timeframe in self.series:
+            digits = bkr_client.symbols.static(symbol)['precision']
+            self.aggregators.setdefault(symbol, []).append(CandleAggregator(symbol, timeframe, digits))
+        self.stream = StreamClient(bkr_client.stream_session_id, mode=self.broker.mode)
+        for symbol in self.aggregators:
+            self.stream.subscribe_candles(symbol, self.on_candle)
+        logger.info('Stream subscribed: %s', list(self.aggregators))
+
+    def on_candle(self, candle: dict) -> None:
+        for aggregator in self.aggregators.get(candle['symbol'], []):
+            for closed in aggregator.add(candle):
+                self.store(aggregator, closed)
+            while aggregator.incomplete:
+                self.refetch(aggregator, aggregator.incomplete.pop(0))
+
+    def refetch(self, aggregator: CandleAggregator, ctm: int) -> None:
+        """store the broker's own candle for a bucket the stream saw partly"""
+        symbol, timeframe = aggregator.symbol, aggregator.timeframe
+        start = ctm // 1000
+        try:
+            with self.broker.lease() as bkr_client:
+                res = bkr_client.get_chart_range_request(symbol, timeframe, start, start + timeframe * 60 - 1, 0)
+        except Exception as e:
+            logger.warning('Stream %s_%s %s: incomplete candle dropped, %s', symbol, timeframe, ctm, e)
+            return
+        candles = [c for c in res.get('rateInfos', []) if c['ctm'] == ctm]
+        if candles:
+            self.store(aggregator, candles[0])
+        else:
+            logger.warning('Stream %s_%s %s: incomplete candle dropped, not in chart', symbol, timeframe, ctm)
+
+    def store(self, aggregator: CandleAggregator, candle: dict) -> None:
+        symbol, timeframe = aggregator.symbol, aggregator.timeframe
+        pgdb = self.dbs.get_pg()
+        rowcount = pgdb.upsert_many_candles(Const.SYMBOL_ID.get(symbol), Const.PERIOD_ID.get(timeframe), [candle])
+        mongodb = self.dbs.get_mongo()
+        n_inserted = mongodb.upsert_candles(
+            collection=f'real_{symbol}_{timeframe}',
+            candles=[candle],
+        )['inserted']
+        logger.info('Stream %s_%s %s: PG %s, Mongo %s', symbol, timeframe, candle["ctmString"], rowcount, n_inserted)
+
+    def run(self) -> None:
+        self.setup()
+        self.stream.start()
+        try:
+            while True:
+                # keep the main session, which owns the stream session, alive
+                sleep(LOGIN_TIMEOUT / 2)
+                bkr_client = self.broker.get()
+                bkr_client.ping()
+                # a relogin opened a new stream session
+                self.stream.set_session(bkr_client.stream_session_id)
+        except KeyboardInterrupt:
+            logger.info('Stream interrupted')
+        finally:
+            self.stream.stop()
+
+
+def stream() -> None:
+    logger.debug('Initialize BrokerConnection()')
+    broker = BrokerConnection()
+    logger.debug('Initialize DBConnection()')
+    dbs = DBConnections()
+
+    task = StreamTask(dbs=dbs, broker=broker)
+    task.run()
+
+    dbs.close_all()
+    broker.logout()
+
+
+if __name__ == '__main__':
+    setup_logging()
+    init_logging()
+    stream()
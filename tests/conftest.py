@@ -0,0 +1,39 @@
+"""
+tests.conftest.py
+~~~~~~~
+
+shared fixtures
+"""
+
+import pytest
+
+from XTBApi.mock_server import MockServer
+
+# open all week, so runs on any day fetch the same
+ALL_WEEK = [{'day': day, 'fromT': 0, 'toT': 86400000} for day in range(1, 8)]
+
+
+@pytest.fixture
+def mock_server(monkeypatch):
+    """local XTB stand-in, every client created in the test connects to it"""
+    with MockServer(trading_hours=ALL_WEEK) as server:
+        monkeypatch.setenv('XTB_WS_URL', server.url)
+        yield server
+
+
+@pytest.fixture
+def broker(mock_server, monkeypatch):
+    """BrokerPool logged in to mock_server, which accepts any password"""
+    import initials
+    from connections import BrokerPool
+    monkeypatch.setattr(initials, 'load_accounts', lambda: {'test': {'pass': ''}})
+    pool = BrokerPool(users=('test',), sessions_per_user=2)
+    yield pool
+    pool.logout()
+
+
+@pytest.fixture
+def dbs():
+    """in-memory Postgres and Mongo sinks"""
+    from benchmarks.sinks import MemoryDBConnections
+    return MemoryDBConnections()
@@ -0,0 +1,92 @@
+"""
+tests.test_base_loggers.py
+~~~~~~~
+
+test the queued Loggers service
+"""
+
+import logging
+import threading
+
+from base_loggers import Loggers
+
+LOGGER = logging.getLogger('tests.test_base_loggers')
+
+
+def _recording(name):
+    """Loggers whose writer thread records (level, message) instead of writing"""
+    loggers = Loggers(name=name)
+    written = []
+    loggers._write = lambda level, message, args, service: written.append(
+        (level, message % args if args else message))
+    return loggers, written
+
+
+def _start(loggers):
+    loggers._thread = threading.Thread(target=loggers._drain, daemon=True)
+    loggers._thread.start()
+
+
+def test_level_and_args():
+    loggers, written = _recording('tests.loggers.level')
+    loggers.level = logging.INFO
+    loggers.debug('below level %s', 1)
+    loggers.info('Got %s_%s %s ticks', 'GOLD', 5, 300)
+    loggers.warning('no args, 100%')
+    assert loggers.queue.qsize() == 2
+    _start(loggers)
+    loggers.close()
+    assert written == [(logging.INFO, 'Got GOLD_5 300 ticks'), (logging.WARNING, 'no args, 100%')]
+    LOGGER.debug("passed")
+
+
+def test_drop_when_full():
+    loggers, written = _recording('tests.loggers.drop')
+    loggers.queue.maxsize, loggers._high_water = 10, 8
+    # below WARNING stops at the high water mark, the rest until full
+    for i in range(12):
+        loggers.info('info %s', i)
+    for i in range(4):
+        loggers.error('error %s', i)
+    assert loggers.queue.qsize() == 10 and loggers.dropped == 6
+    _start(loggers)
+    loggers.close()
+    messages = [message for _, message in written]
+    assert messages[:10] == [f'info {i}' for i in range(8)] + ['error 0', 'error 1']
+    # drops are reported once the queue has drained
+    assert written[10:] == [(logging.WARNING, 'Logging queue full, dropped 6 records')]
+    LOGGER.debug("passed")
+
+
+def test_write_error(capsys):
+    loggers, written = _recording('tests.loggers.error')
+    loggers.info('bad format %d', 'text')
+    loggers.info('good %s', 'format')
+    _start(loggers)
+    loggers.close()
+    # the writer thread reports the failed record and keeps going
+    assert written == [(logging.INFO, 'good format')]
+    assert "Message: 'bad format %d'" in capsys.readouterr().err
+    LOGGER.debug("passed")
+
+
+def test_init(monkeypatch, tmp_path):
+    path = tmp_path / 'app.log'
+    monkeypatch.setenv('LOG_PATH', str(path))
+    monkeypatch.setenv('LOG_LEVEL', 'info')
+    monkeypatch.setenv('LOG_QUEUE_SIZE', '50')
+    monkeypatch.delenv('LOKI_ENABLED', raising=False)
+    loggers = Loggers(name='tests.loggers.init')
+    loggers.debug('queued before init %s', 1)
+    loggers.init()
+    assert loggers.level == logging.INFO
+    assert loggers.queue.maxsize == 50 and loggers._high_water == 40
+    loggers.info('written by the %s thread', 'loggers')
+    loggers.close()
+    for handler in loggers.logging.handlers:
+        handler.close()
+    text = path.read_text()
+    # records queued before init are kept, level checked when logged
+    assert 'INFO - written by the loggers thread' in text
+    assert 'DEBUG - queued before init 1' in text
+    LOGGER.debug("passed")
@@ -0,0 +1,236 @@
+"""
+tests.test_candles.py
+~~~~~~~
+
+test the candle collector against the mock server
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+
+import candles
+from initials import Const
+from benchmarks.sinks import MemoryDBConnections
+from candles import CandlesTask, CandlesTime, CloseSchedule, ServerClock, WatermarkStore, collect_series
+from XTBApi.exceptions import SocketError
+
+LOGGER = logging.getLogger('tests.test_candles')
+
+
+def _watermark(dbs, symbol, timeframe):
+    return dbs.get_mongo().find_one('candles_time', {'_id': f'real_{symbol}_{timeframe}'})
+
+
+def _counted(calls, name, func):
+    def wrapper(*args, **kwargs):
+        calls.append(name)
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def test_watermark_store(dbs, monkeypatch):
+    mongodb = dbs.get_mongo()
+    mongodb.set_many('candles_time', [
+        {'_id': 'real_GOLD_5', 'last_backdate': '2024-01-02', 'last_ctm': 1704283200000},
+    ])
+    reads = []
+    for name in ('find_all', 'find_one'):
+        monkeypatch.setattr(mongodb, name, _counted(reads, name, getattr(mongodb, name)))
+    store = WatermarkStore(dbs)
+    # before load every get is a round trip
+    assert store.get('real_GOLD_5')['last_ctm'] == 1704283200000
+    store.load()
+    assert reads == ['find_one', 'find_all']
+    ct = CandlesTime(store, 'GOLD', 5)
+    ct.query()
+    assert ct.last_ctm == 1704283200000 and ct.last_backdate.isoformat() == '2024-01-02'
+    # unknown series start from scratch without another read
+    ct_15 = CandlesTime(store, 'GOLD', 15)
+    ct_15.query()
+    assert ct_15.last_ctm == 0 and len(reads) == 2
+    # advanced watermarks are buffered, readable at once, written by flush
+    ct.last_ctm += 300_000
+    ct.update()
+    ct_15.last_ctm = 1704283200000
+    ct_15.update()
+    assert store.get('real_GOLD_5')['last_ctm'] == 1704283500000
+    assert _watermark(dbs, 'GOLD', 5)['last_ctm'] == 1704283200000
+    assert store.flush() == 2 and store.flush() == 0
+    assert _watermark(dbs, 'GOLD', 5)['last_ctm'] == 1704283500000
+    assert _watermark(dbs, 'GOLD', 15)['candles'] == 'real_GOLD_15'
+    # a new run reads back what was persisted
+    store = WatermarkStore(dbs)
+    store.load()
+    ct = CandlesTime(store, 'GOLD', 15)
+    ct.query()
+    assert ct.last_ctm == 1704283200000
+    LOGGER.debug("passed")
+
+
+def test_present_candles_closed(broker, dbs):
+    task = CandlesTask(dbs=dbs, broker=broker, resample=False, skip_closed=False)
+    now_ms = int(time.time() * 1000)
+    collect_series(task, [('GOLD', 5)])
+    stored = dbs.get_mongo().find_all('real_GOLD_5')
+    assert stored and max(c['ctm'] for c in stored) + 5 * 60_000 <= now_ms + 1000
+    # the forming candle is neither stored nor behind the watermark
+    assert _watermark(dbs, 'GOLD', 5)['last_ctm'] == max(c['ctm'] for c in stored)
+    LOGGER.debug("passed")
+
+
+def _stored(dbs, symbol, timeframe):
+    return dbs.get_mongo().find_all(f'real_{symbol}_{timeframe}')
+
+
+def test_collect_series_fan_out(broker, dbs, monkeypatch):
+    series = [('GOLD', 5), ('GOLD', 15), ('OIL.WTI', 15), ('EURUSD', 15), ('USDJPY', 30), ('GOLD.FUT', 60)]
+    task = CandlesTask(dbs=dbs, broker=broker, resample=False, skip_closed=False)
+    lock, running, peak = threading.Lock(), [0], [0]
+    get_chart = task._get_chart
+
+    def _get_chart(*args, **kwargs):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        try:
+            candles = get_chart(*args, **kwargs)
+            # hold the worker after the lease, as a database write would
+            time.sleep(0.05)
+            return candles
+        finally:
+            with lock:
+                running[0] -= 1
+
+    monkeypatch.setattr(task, '_get_chart', _get_chart)
+    elapsed = collect_series(task, series, workers=4)
+    assert sorted(elapsed) == sorted(series)
+    assert peak[0] > 1
+    pgdb = dbs.get_pg()
+    for symbol, timeframe in series:
+        stored = _stored(dbs, symbol, timeframe)
+        assert stored
+        rows = pgdb.series[(Const.SYMBOL_ID[symbol], Const.PERIOD_ID[timeframe])]
+        assert len(rows) == len(stored)
+        assert _watermark(dbs, symbol, timeframe)['last_ctm'] == max(c['ctm'] for c in stored)
+    LOGGER.debug("passed")
+
+
+def test_collect_series_failure(broker, dbs, monkeypatch):
+    series = [('GOLD', 15), ('OIL.WTI', 15), ('EURUSD', 15)]
+    task = CandlesTask(dbs=dbs, broker=broker, resample=False, skip_closed=False)
+    collect_one = task.collect
+
+    def _collect(symbol, timeframe, present=None):
+        if symbol == 'OIL.WTI':
+            raise SocketError()
+        return collect_one(symbol, timeframe, present)
+
+    monkeypatch.setattr(task, 'collect', _collect)
+    elapsed = collect_series(task, series, workers=3)
+    # the failed series is timed and left behind, the others are stored
+    assert sorted(elapsed) == sorted(series)
+    assert not _stored(dbs, 'OIL.WTI', 15) and _watermark(dbs, 'OIL.WTI', 15) is None
+    assert _stored(dbs, 'GOLD', 15) and _watermark(dbs, 'GOLD', 15)
+    assert _stored(dbs, 'EURUSD', 15) and _watermark(dbs, 'EURUSD', 15)
+    LOGGER.debug("passed")
+
+
+def test_collect(broker, dbs, monkeypatch, tmp_path):
+    series = (('GOLD', 15), ('GOLD', 30), ('EURUSD', 15))
+    monkeypatch.setattr(candles, 'BrokerPool', lambda: broker)
+    monkeypatch.setattr(candles, 'DBConnections', lambda: dbs)
+    monkeypatch.setattr(Const, 'SYMBOL_DEFAULT', series)
+    monkeypatch.setenv('METRICS_PATH', str(tmp_path / 'collector.prom'))
+    candles.collect(workers=2)
+    for symbol, timeframe in series:
+        assert _stored(dbs, symbol, timeframe)
+        assert _watermark(dbs, symbol, timeframe)
+    assert 'xtb_limiter_wait_seconds' in (tmp_path / 'collector.prom').read_text()
+    LOGGER.debug("passed")
+
+
+def test_close_schedule():
+    # 12:00:30 server time, candles closing on the 5 and 15 minutes
+    now = 1704283230.0
+    schedule = CloseSchedule([('GOLD', 5), ('GOLD', 15)], now, delay=2)
+    assert schedule.next_due() == 1704283500 + 2
+    assert schedule.pop_due(1704283500 + 1) == []
+    assert schedule.pop_due(1704283500 + 2) == [('GOLD', 5)]
+    # rescheduled to the following close
+    assert schedule.next_due() == 1704283800 + 2
+    assert sorted(schedule.pop_due(1704284100 + 2)) == [('GOLD', 5), ('GOLD', 15)]
+    assert schedule.next_due() == 1704284400 + 2
+    # within the delay after a close, the close is still ahead
+    assert schedule.next_close(5, 1704283500 + 1) == 1704283500 + 2
+    LOGGER.debug("passed")
+
+
+class _Broker(object):
+    """BrokerPool stand-in answering getServerTime `ahead` seconds ahead"""
+    def __init__(self, ahead):
+        self.ahead = ahead
+        self.calls = 0
+        self.fail = False
+
+    @contextmanager
+    def lease(self):
+        if self.fail:
+            raise SocketError()
+        yield self
+
+    def get_server_time(self):
+        self.calls += 1
+        return {'time': int((time.time() + self.ahead) * 1000)}
+
+
+def test_server_clock():
+    broker = _Broker(ahead=30)
+    clock = ServerClock(broker, sync_secs=0.05)
+    assert abs(clock.now() - time.time() - 30) < 0.5
+    clock.now()
+    assert broker.calls == 1
+    time.sleep(0.06)
+    # the resync fails: the last offset is kept, and retried next time
+    broker.fail = True
+    assert abs(clock.now() - time.time() - 30) < 0.5
+    broker.fail = False
+    broker.ahead = 60
+    assert abs(clock.now() - time.time() - 60) < 0.5
+    assert broker.calls == 2
+    # never synced: nothing to fall back on
+    broker.fail = True
+    with pytest.raises(SocketError):
+        ServerClock(broker).now()
+    LOGGER.debug("passed")
+
+
+def test_daemon_survives_errors(monkeypatch):
+    import candles
+    broker = _Broker(ahead=0)
+    broker.fail = True
+    runs, sleeps = [], []
+
+    def _sleep(secs):
+        sleeps.append(secs)
+        # the broker comes back after the first retry
+        broker.fail = False
+        if len(sleeps) == 3:
+            raise KeyboardInterrupt()
+
+    def _serve():
+        raise OSError('address in use')
+
+    broker.ping = broker.logout = broker.stats = lambda: {}
+    monkeypatch.setattr(candles, 'BrokerPool', lambda: broker)
+    monkeypatch.setattr(candles, 'DBConnections', MemoryDBConnections)
+    monkeypatch.setattr(candles, 'collect_series', lambda task, series, workers: runs.append(series))
+    monkeypatch.setattr(candles, 'sleep', _sleep)
+    monkeypatch.setattr(candles.metrics, 'serve', _serve)
+    candles.daemon(series=[('GOLD', 5)], retry_secs=7)
+    # the first run failed on the server clock and was retried
+    assert sleeps[0] == 7 and runs == [[('GOLD', 5)], [('GOLD', 5)]]
+    LOGGER.debug("passed")
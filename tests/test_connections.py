@@ -0,0 +1,51 @@
+"""
+tests.test_connections.py
+~~~~~~~
+
+test the broker session pool against the mock server
+"""
+
+import logging
+import time
+
+import pytest
+from websockets.protocol import State
+
+from XTBApi.exceptions import SocketError
+
+LOGGER = logging.getLogger('tests.test_connections')
+
+
+def _down(session, since):
+    session.failures = session.max_failures
+    session.down_since = since
+
+
+def test_retry_after_cooldown(broker, mock_server):
+    first, second = broker.sessions
+    ws = first.client.ws
+    _down(first, time.monotonic())
+    with broker.lease() as client:
+        assert client is second.client
+    # cooled down: logged in again on the next pick, the stale socket closed
+    _down(first, time.monotonic() - first.cooldown - 1)
+    with broker.lease():
+        pass
+    assert first.healthy and first.client.ws is not ws
+    assert ws.state is State.CLOSED
+    assert mock_server.requests['login'] == 3
+    LOGGER.debug("passed")
+
+
+def test_lease_failures(broker):
+    session = broker.sessions[0]
+    _down(broker.sessions[1], time.monotonic())
+    for _ in range(session.max_failures):
+        with pytest.raises(OSError):
+            with broker.lease():
+                raise OSError('connection reset')
+    assert not session.healthy and session.in_flight == 0
+    with pytest.raises(SocketError):
+        with broker.lease():
+            pass
+    LOGGER.debug("passed")
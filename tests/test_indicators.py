@@ -0,0 +1,211 @@
+"""
+tests.test_indicators.py
+~~~~~~~
+
+test the incremental ind_presets indicators
+"""
+
+import logging
+import random
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from indicators import (EMA, RSI, Stoch, SeriesIndicators, IndicatorEngine,
+                        preset_signal, series_name)
+from initials import ind_presets
+
+LOGGER = logging.getLogger('tests.test_indicators')
+STEP = 5 * 60_000
+
+
+def _series(n, seed=1, start=1700000100000):
+    """(ctm, high, low, close) rows of a random walk"""
+    rnd = random.Random(seed)
+    rows, close = [], 185000.0
+    for i in range(n):
+        close += rnd.randint(-30, 30)
+        rows.append((start + i * STEP, close + rnd.randint(0, 20), close - rnd.randint(0, 20), close))
+    return rows
+
+
+class FakeDBs:
+    """Mongo documents and Postgres candles kept in dicts"""
+    def __init__(self, candles=()):
+        self.collections = {}
+        self.candles = list(candles)
+        self.history_reads = 0
+
+    def get_mongo(self):
+        return self
+
+    def get_pg(self):
+        return self
+
+    def find_all(self, collection, projection=None):
+        return list(self.collections.get(collection, {}).values())
+
+    def set_many(self, collection, data, batch_size=0):
+        docs = self.collections.setdefault(collection, {})
+        for doc in data:
+            docs.setdefault(doc['_id'], {}).update(doc)
+        return len(data)
+
+    def fetch_candles(self, symbol_id, timeframe_id, since=0):
+        """candles rows: ctm, open, close, high, low deltas"""
+        self.history_reads += 1
+        return np.array([(ctm, close, 0.0, high - close, low - close)
+                         for ctm, high, low, close in self.candles if ctm >= since],
+                        dtype=np.float64).reshape(-1, 5)
+
+
+def _rate_infos(rows):
+    return [{'ctm': ctm, 'open': close, 'close': 0.0, 'high': high - close, 'low': low - close}
+            for ctm, high, low, close in rows]
+
+
+def test_ema_seeding():
+    ema = EMA(3)
+    assert ema.update(0, 0, 1.0) is None
+    assert ema.update(0, 0, 2.0) is None
+    # seeded with the SMA of the first 3 closes
+    assert ema.update(0, 0, 3.0) == 2.0
+    # alpha = 2 / (3 + 1)
+    assert ema.update(0, 0, 4.0) == 3.0
+    LOGGER.debug("passed")
+
+
+def test_rsi_wilder():
+    rsi = RSI(2)
+    assert rsi.update(0, 0, 1.0) is None
+    assert rsi.update(0, 0, 2.0) is None
+    # first value from the simple average of 2 changes: +1, +1
+    assert rsi.update(0, 0, 3.0) == 100.0
+    # Wilder smoothing: gain 1 + (0 - 1) / 2, loss 0 + (1 - 0) / 2
+    assert rsi.update(0, 0, 2.0) == 50.0
+    assert (rsi.gain, rsi.loss) == (0.5, 0.5)
+    LOGGER.debug("passed")
+
+
+def test_stoch_windows():
+    stoch = Stoch(k=3, d=2, smooth_k=2)
+    candles = [(10, 0, 5), (10, 0, 10), (10, 0, 0), (20, 0, 10), (20, 10, 20)]
+    values = [stoch.update(*c) for c in candles]
+    # raw %K from the 3rd candle: 0, 50, 100; %K over 2, %D over 2 of %K
+    assert values[:4] == [None, None, None, None]
+    assert values[4] == (75.0, 50.0)
+    assert list(stoch.ks) == [25.0, 75.0]
+    assert len(stoch.highs) == 3 and list(stoch.raw) == [50.0, 100.0]
+    LOGGER.debug("passed")
+
+
+def test_preset_signal():
+    rsi = ind_presets['TA_RSI_L14_XA70_XB30']
+    prev = {}
+    assert preset_signal(rsi, {'rsi_14': 25.0}, prev) == 0
+    # leaving oversold is a buy, leaving overbought a sell
+    assert preset_signal(rsi, {'rsi_14': 35.0}, prev) == 1
+    assert preset_signal(rsi, {'rsi_14': 75.0}, prev) == 0
+    assert preset_signal(rsi, {'rsi_14': 65.0}, prev) == -1
+    emax = ind_presets['TA_EMAX_F10_S25']
+    prev = {}
+    assert preset_signal(emax, {'ema_10': 1.0, 'ema_25': 2.0}, prev) == 0
+    assert preset_signal(emax, {'ema_10': 3.0, 'ema_25': 2.0}, prev) == 1
+    assert preset_signal(emax, {'ema_10': 1.0, 'ema_25': 2.0}, prev) == -1
+    assert prev == {'diff': -1.0}
+    LOGGER.debug("passed")
+
+
+def test_state_round_trip():
+    rows = _series(300)
+    continuous = SeriesIndicators(ind_presets)
+    expected = [continuous.update(*row) for row in rows]
+    first = SeriesIndicators(ind_presets)
+    results = [first.update(*row) for row in rows[:150]]
+    resumed = SeriesIndicators(ind_presets)
+    resumed.load(first.to_dict())
+    assert resumed.to_dict() == first.to_dict()
+    results += [resumed.update(*row) for row in rows[150:]]
+    assert results == expected
+    LOGGER.debug("passed")
+
+
+def test_engine_resume():
+    now = int(datetime.now(timezone.utc).timestamp() * 1000)
+    rows = _series(300, start=now - 400 * STEP)
+    expected = SeriesIndicators(ind_presets)
+    expected = [doc for doc in (expected.update(*row) for row in rows) if doc]
+    dbs = FakeDBs(rows[:200])
+    engine = IndicatorEngine(dbs)
+    engine.load()
+    engine.update('GOLD', 5, _rate_infos(rows[190:200]))
+    engine.flush()
+    # a restarted engine continues from the flushed state
+    engine = IndicatorEngine(dbs)
+    engine.load()
+    engine.update('GOLD', 5, _rate_infos(rows[200:]))
+    docs = dbs.collections[f"ind_{series_name('GOLD', 5)}"]
+    assert [docs[doc['_id']]['values'] for doc in expected] == [doc['values'] for doc in expected]
+    LOGGER.debug("passed")
+
+
+def test_engine_history():
+    now = int(datetime.now(timezone.utc).timestamp() * 1000)
+    rows = _series(300, start=now - 400 * STEP)
+    expected = SeriesIndicators(ind_presets)
+    expected = [doc for doc in (expected.update(*row) for row in rows) if doc]
+    dbs = FakeDBs(rows)
+    engine = IndicatorEngine(dbs)
+    # present candles plus olden ones from far earlier: a new series is fed
+    # from the stored history, not across the gap
+    results = engine.update('GOLD', 5, _rate_infos(rows[:20] + rows[-10:]))
+    assert results == expected
+    LOGGER.debug("passed")
+
+
+@pytest.mark.parametrize('gap', [0, 1])
+def test_engine_gap(gap):
+    now = int(datetime.now(timezone.utc).timestamp() * 1000)
+    rows = _series(300, start=now - 400 * STEP)
+    expected = SeriesIndicators(ind_presets)
+    expected = [doc for doc in (expected.update(*row) for row in rows) if doc]
+    dbs = FakeDBs(rows[:200])
+    engine = IndicatorEngine(dbs)
+    engine.update('GOLD', 5, _rate_infos(rows[:200]))
+    # candles missing after the state are read from the stored history
+    dbs.candles = rows
+    results = engine.update('GOLD', 5, _rate_infos(rows[200 + 50 * gap:]))
+    assert results == expected[-100:]
+    LOGGER.debug("passed")
+
+
+class _Hours:
+    """TradingHoursCache stand-in, closed from `close` until `reopen` (s)"""
+    def __init__(self, close, reopen):
+        self.close = close
+        self.reopen = reopen
+
+    def next_open(self, symbol, ts):
+        return self.reopen if self.close <= ts < self.reopen else ts
+
+
+@pytest.mark.parametrize('closed', [True, False])
+def test_engine_closed_hours(closed):
+    now = int(datetime.now(timezone.utc).timestamp() * 1000)
+    rows = _series(300, start=now - 400 * STEP)
+    # no candles between rows 200 and 250
+    rows = rows[:200] + rows[250:]
+    expected = SeriesIndicators(ind_presets)
+    expected = [doc for doc in (expected.update(*row) for row in rows) if doc]
+    dbs = FakeDBs(rows[:200])
+    close = rows[200][0] / 1000 - 50 * STEP / 1000 if closed else rows[200][0] / 1000
+    engine = IndicatorEngine(dbs, hours=_Hours(close, rows[200][0] / 1000))
+    engine.update('GOLD', 5, _rate_infos(rows[:200]))
+    dbs.candles = rows
+    reads = dbs.history_reads
+    # reloaded from the history only when the market was open over the gap
+    results = engine.update('GOLD', 5, _rate_infos(rows[200:]))
+    assert results == expected[-50:]
+    assert dbs.history_reads == reads + (not closed)
+    LOGGER.debug("passed")
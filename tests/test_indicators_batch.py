@@ -0,0 +1,87 @@
+"""
+tests.test_indicators_batch.py
+~~~~~~~
+
+test the vectorized indicators against the incremental ones, and the batch run
+"""
+
+import logging
+
+import numpy as np
+import pytest
+
+from benchmarks.sinks import MemoryDBConnections
+from indicators import IndicatorEngine, SeriesIndicators
+from indicators_batch import BatchEngine, compute, to_docs
+from initials import ind_presets
+from tests.test_indicators import _series
+
+LOGGER = logging.getLogger('tests.test_indicators_batch')
+
+
+def _close(a, b):
+    """equal up to float rounding, tuples and lists alike"""
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(_close(a[k], b[k]) for k in a)
+    if isinstance(a, (list, tuple)):
+        return len(a) == len(b) and all(_close(x, y) for x, y in zip(a, b))
+    if a is None or b is None:
+        return a is b
+    return a == pytest.approx(b, rel=1e-9, abs=1e-9)
+
+
+def _compute(rows):
+    ctm, high, low, close = (np.array(col) for col in zip(*rows)) if rows else [np.empty(0)] * 4
+    return compute(ctm.astype(np.int64), high, low, close, ind_presets)
+
+
+@pytest.mark.parametrize('n', [0, 5, 52, 60, 2000])
+def test_compute(n):
+    rows = _series(n)
+    series = SeriesIndicators(ind_presets)
+    expected = [doc for doc in (series.update(*row) for row in rows) if doc]
+    result = _compute(rows)
+    docs = to_docs(result)
+    assert [doc['_id'] for doc in docs] == [doc['_id'] for doc in expected]
+    assert [doc['signals'] for doc in docs] == [doc['signals'] for doc in expected]
+    assert all(_close(doc['values'], exp['values']) for doc, exp in zip(docs, expected))
+    assert _close(result['state'], series.to_dict())
+    LOGGER.debug("passed")
+
+
+def test_state_handoff():
+    rows = _series(2000)
+    continuous = SeriesIndicators(ind_presets)
+    expected = [continuous.update(*row) for row in rows]
+    # the incremental engine continues from the state of a batch run
+    resumed = SeriesIndicators(ind_presets)
+    resumed.load(_compute(rows[:1500])['state'])
+    results = [resumed.update(*row) for row in rows[1500:]]
+    assert [doc['signals'] for doc in results] == [doc['signals'] for doc in expected[1500:]]
+    assert _close([doc['values'] for doc in results], [doc['values'] for doc in expected[1500:]])
+    assert _close(resumed.to_dict(), continuous.to_dict())
+    LOGGER.debug("passed")
+
+
+def test_run_store_failure(monkeypatch):
+    dbs = MemoryDBConnections()
+    engine = BatchEngine(dbs, workers=1)
+    # fetch_candles rows, (ctm, open, close, high, low) relative to open 0
+    rows = np.array([(ctm, 0, close, high, low) for ctm, high, low, close in _series(300)], dtype=np.float64)
+    monkeypatch.setattr(engine, 'load', lambda symbol, timeframe: rows)
+    store = engine.store
+
+    def _store(name, docs):
+        if name == 'EURUSD_15':
+            raise OSError('connection reset')
+        return store(name, docs)
+
+    monkeypatch.setattr(engine, 'store', _store)
+    counts = engine.run([('GOLD', 15), ('EURUSD', 15)])
+    assert counts['EURUSD_15'] == -1 and counts['GOLD_15'] > 0
+    # the failed series keeps its previous state, the next incremental
+    # update continues from there
+    mongodb = dbs.get_mongo()
+    assert mongodb.find_one(IndicatorEngine.collection, {'_id': 'GOLD_15'})
+    assert mongodb.find_one(IndicatorEngine.collection, {'_id': 'EURUSD_15'}) is None
+    LOGGER.debug("passed")
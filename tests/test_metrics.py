@@ -0,0 +1,54 @@
+"""
+tests.test_metrics.py
+~~~~~~~
+
+test the OpenMetrics exposition
+"""
+
+import logging
+
+import metrics
+from metrics import Counter, Gauge, Histogram, Registry
+
+LOGGER = logging.getLogger('tests.test_metrics')
+
+
+def test_render():
+    registry = Registry()
+    fetched = registry.register(Counter('candles_fetched', 'Candles received', ('series',)))
+    lag = registry.register(Gauge('stream_lag_seconds', 'Stream lag'))
+    seconds = registry.register(Histogram('call_seconds', 'Run time', ('function',), buckets=(0.1, 1.0)))
+    fetched.inc(300, series='GOLD_5')
+    fetched.inc(2, series='GOLD_5')
+    lag.set(0.5)
+    seconds.observe(0.05, function='collect')
+    seconds.observe(2.0, function='collect')
+    assert registry.render() == '\n'.join([
+        '# TYPE candles_fetched counter',
+        '# HELP candles_fetched Candles received',
+        'candles_fetched_total{series="GOLD_5"} 302',
+        '# TYPE stream_lag_seconds gauge',
+        '# HELP stream_lag_seconds Stream lag',
+        'stream_lag_seconds 0.5',
+        '# TYPE call_seconds histogram',
+        '# HELP call_seconds Run time',
+        'call_seconds_bucket{function="collect",le="0.1"} 1',
+        'call_seconds_bucket{function="collect",le="1.0"} 1',
+        'call_seconds_bucket{function="collect",le="+Inf"} 2',
+        'call_seconds_count{function="collect"} 2',
+        'call_seconds_sum{function="collect"} 2.05',
+        '# EOF',
+    ]) + '\n'
+    LOGGER.debug("passed")
+
+
+def test_limiter_totals():
+    metrics.observe_limiters({'test#0': {'wait_seconds': 1.5, 'backoffs': 2}})
+    metrics.observe_limiters({'test#0': {'wait_seconds': 2.5, 'backoffs': 3}})
+    text = metrics.REGISTRY.render()
+    # totals kept by the limiters, exposed as counters so rate() applies
+    assert '# TYPE xtb_limiter_wait_seconds counter' in text
+    assert 'xtb_limiter_wait_seconds_total{session="test#0"} 2.5' in text
+    assert 'xtb_limiter_backoffs_total{session="test#0"} 3' in text
+    assert text.endswith('# EOF\n')
+    LOGGER.debug("passed")
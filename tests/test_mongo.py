@@ -0,0 +1,155 @@
+"""
+tests.test_mongo.py
+~~~~~~~
+
+test the Mongo client against an in-memory MongoClient
+"""
+
+import logging
+
+import pytest
+from pymongo.errors import ServerSelectionTimeoutError
+
+from classes import mongo
+from classes.mongo import Mongo
+from XTBApi.columnar import CandleBlock
+
+LOGGER = logging.getLogger('tests.test_mongo')
+
+
+class FakeResult(object):
+    def __init__(self):
+        self.upserted_count = 0
+        self.matched_count = 0
+        self.modified_count = 0
+
+
+class FakeCollection(dict):
+    """collection of documents keyed by _id, bulk_write applies UpdateOne ops"""
+    def __init__(self):
+        super().__init__()
+        self.bulk_writes = 0
+
+    def bulk_write(self, ops, ordered=True):
+        self.bulk_writes += 1
+        res = FakeResult()
+        for op in ops:
+            _id = op._filter['_id']
+            (operator, fields), = op._doc.items()
+            if _id not in self:
+                self[_id] = dict(fields, _id=_id)
+                res.upserted_count += 1
+                continue
+            res.matched_count += 1
+            if operator == '$set' and any(self[_id].get(k) != v for k, v in fields.items()):
+                self[_id].update(fields)
+                res.modified_count += 1
+        return res
+
+
+class FakeDatabase(dict):
+    def __missing__(self, collection):
+        self[collection] = FakeCollection()
+        return self[collection]
+
+
+class FakeAdmin(object):
+    def __init__(self, client):
+        self.client = client
+
+    def command(self, name):
+        if self.client.down:
+            raise ServerSelectionTimeoutError('no servers available')
+        return {'ok': 1.0}
+
+
+class FakeClient(object):
+    """MongoClient stand-in, databases are dicts of FakeCollection"""
+    def __init__(self):
+        self.admin = FakeAdmin(self)
+        self.databases = {}
+        self.down = False
+
+    def __getitem__(self, dbname):
+        return self.databases.setdefault(dbname, FakeDatabase())
+
+
+@pytest.fixture
+def clients(monkeypatch):
+    """every MongoClient created, Mongo instances share the first one"""
+    created = []
+
+    def _new_client():
+        created.append(FakeClient())
+        return created[-1]
+
+    monkeypatch.setattr(mongo, '_new_client', _new_client)
+    monkeypatch.setattr(Mongo, '_client', None)
+    return created
+
+
+def test_shared_client(clients):
+    first, second = Mongo('xtb'), Mongo('other')
+    assert first.client is second.client and len(clients) == 1
+    assert first.ping()
+    # closing drops the shared client, the next instance opens a new one
+    first.close()
+    third = Mongo('xtb')
+    assert third.client is not first.client and len(clients) == 2
+    # closing a stale instance leaves the current client in place
+    second.close()
+    assert Mongo('xtb').client is third.client
+    LOGGER.debug("passed")
+
+
+def test_ping_failure(clients):
+    mongodb = Mongo('xtb')
+    mongodb.client.down = True
+    assert not mongodb.ping()
+    mongodb.client.down = False
+    assert mongodb.ping()
+    LOGGER.debug("passed")
+
+
+def test_upsert_list_of_dict(clients):
+    mongodb = Mongo('xtb')
+    docs = [{'_id': i, 'value': i} for i in range(5)]
+    counts = mongodb.upsert_list_of_dict('docs', docs, batch_size=2)
+    assert counts == {'inserted': 5, 'matched': 0, 'skipped': 0}
+    assert mongodb.db['docs'].bulk_writes == 3
+    # existing documents are matched and left untouched
+    docs = [{'_id': i, 'value': -i} for i in range(3, 8)]
+    counts = mongodb.upsert_list_of_dict('docs', docs, batch_size=2)
+    assert counts == {'inserted': 3, 'matched': 2, 'skipped': 2}
+    assert mongodb.db['docs'][4] == {'_id': 4, 'value': 4}
+    assert mongodb.db['docs'][7] == {'_id': 7, 'value': -7}
+    LOGGER.debug("passed")
+
+
+def test_set_many(clients):
+    mongodb = Mongo('xtb')
+    assert mongodb.set_many('docs', [{'_id': i, 'value': i} for i in range(4)], batch_size=3) == 4
+    # inserted and changed documents count, unchanged ones do not
+    docs = [{'_id': 2, 'value': 2}, {'_id': 3, 'value': 0}, {'_id': 4, 'value': 4}]
+    assert mongodb.set_many('docs', docs) == 2
+    assert mongodb.db['docs'][3] == {'_id': 3, 'value': 0}
+    assert len(mongodb.db['docs']) == 5
+    LOGGER.debug("passed")
+
+
+def test_upsert_candles(clients):
+    mongodb = Mongo('xtb')
+    candles = [{'ctm': 60000 * i, 'ctmString': '', 'open': 1.0, 'close': 0.5, 'high': 1.0, 'low': 0.0, 'vol': 1.0}
+               for i in range(6)]
+    counts = mongodb.upsert_candles('EURUSD_1', candles[:4])
+    assert counts == {'inserted': 4, 'matched': 0, 'skipped': 0}
+    counts = mongodb.upsert_candles('EURUSD_1', candles, batch_size=4)
+    assert counts == {'inserted': 2, 'matched': 4, 'skipped': 4}
+    assert sorted(mongodb.db['EURUSD_1']) == [c['ctm'] for c in candles]
+    assert mongodb.db['EURUSD_1'][0]['close'] == 0.5
+    # a CandleBlock is stored the same way
+    block = CandleBlock.from_rate_infos(candles, digits=5)
+    counts = mongodb.upsert_candles('EURUSD_5', block, batch_size=4)
+    assert counts == {'inserted': 6, 'matched': 0, 'skipped': 0}
+    assert mongodb.db['EURUSD_5'][300000]['close'] == 0.5
+    LOGGER.debug("passed")
@@ -0,0 +1,204 @@
+"""
+tests.test_postgres.py
+~~~~~~~
+
+test the Postgres client against an in-memory connection pool
+"""
+
+import csv
+import io
+import logging
+import threading
+import time
+
+import pytest
+
+from classes import postgres
+from classes.postgres import Postgres, _CsvStream
+
+LOGGER = logging.getLogger('tests.test_postgres')
+
+
+class FakeCursor(object):
+    """psycopg2 cursor stand-in, tables are sets of row ids"""
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = -1
+        self.statements = conn.pool.statements
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute(self, sql, args=None):
+        self.statements.append(sql)
+        tables = self.conn.pool.tables
+        if sql.startswith('TRUNCATE'):
+            tables[sql.split()[1].rstrip(';')] = {}
+        elif sql.startswith('INSERT INTO') and 'SELECT * FROM' in sql:
+            table, staging = sql.split()[2], sql.split()[6]
+            new = {k: v for k, v in tables[staging].items() if k not in tables[table]}
+            tables[table].update(new)
+            self.rowcount = len(new)
+
+    def copy_expert(self, sql, file, size=8192):
+        staging = sql.split()[1]
+        chunks = iter(lambda: file.read(size), '')
+        rows = list(csv.reader(io.StringIO(''.join(chunks))))
+        self.conn.pool.tables[staging] = {int(row[0]): row for row in rows}
+        self.conn.pool.copies.append(len(rows))
+
+
+class FakeConnection(object):
+    def __init__(self, pool):
+        self.pool = pool
+        self.closed = 0
+        self.autocommit = False
+
+    def cursor(self):
+        if self.pool.broken:
+            self.closed = 2
+            raise postgres.OperationalError('server closed the connection')
+        return FakeCursor(self)
+
+
+class FakePool(object):
+    """ThreadedConnectionPool stand-in"""
+    def __init__(self, minconn, maxconn, **kwargs):
+        self.tables = {'candles': {}}
+        self.statements = []
+        self.copies = []
+        self.idle = []
+        self.out = []
+        self.discarded = 0
+        self.broken = False
+
+    def getconn(self):
+        if self.broken and not self.idle:
+            raise postgres.OperationalError('could not connect to server')
+        conn = self.idle.pop() if self.idle else FakeConnection(self)
+        self.out.append(conn)
+        return conn
+
+    def putconn(self, conn, close=False):
+        self.out.remove(conn)
+        if close:
+            self.discarded += 1
+        else:
+            self.idle.append(conn)
+
+    def closeall(self):
+        self.idle = []
+
+
+def _execute_values(cursor, sql, data, page_size=100, fetch=False):
+    """one INSERT per page, like psycopg2.extras.execute_values"""
+    table, ids, data = sql.split()[2], [], list(data)
+    stored = cursor.conn.pool.tables[table]
+    for i in range(0, len(data), page_size):
+        cursor.statements.append(sql)
+        page = [row for row in data[i:i + page_size] if row[0] not in stored]
+        stored.update((row[0], row) for row in page)
+        cursor.rowcount = len(page)
+        ids.extend((row[0],) for row in page)
+    return ids if fetch else None
+
+
+@pytest.fixture
+def pgdb(monkeypatch):
+    monkeypatch.setattr(postgres, 'ThreadedConnectionPool', FakePool)
+    monkeypatch.setattr(postgres, 'execute_values', _execute_values)
+    return Postgres('test', maxconn=2)
+
+
+def _candles(n, start=0):
+    return [{'ctm': 1700000000000 + i * 300000, 'ctmString': f'candle, "{i}"', 'open': 185000.0 + i,
+             'close': 1.0, 'high': 2.0, 'low': -1.0, 'vol': 3.0} for i in range(start, start + n)]
+
+
+def test_csv_stream():
+    rows = [(i, f'a,"{i}"', 1.5) for i in range(2500)]
+    stream = _CsvStream(rows)
+    # read in small pieces, as COPY does
+    text = ''.join(iter(lambda: stream.read(100), ''))
+    assert [tuple(row) for row in csv.reader(io.StringIO(text))] == \
+        [(str(i), f'a,"{i}"', '1.5') for i in range(2500)]
+    assert stream.read() == ''
+    LOGGER.debug("passed")
+
+
+def test_upsert_pages(pgdb):
+    data = [(i, 'x') for i in range(25)]
+    assert pgdb.upsert_many('candles', data, page_size=10) == 25
+    # every page counted, not only the last one
+    assert pgdb.upsert_many('candles', data + [(25, 'x'), (26, 'x')], page_size=10) == 2
+    LOGGER.debug("passed")
+
+
+def test_upsert_candles_paths(pgdb, monkeypatch):
+    monkeypatch.setattr(postgres, 'COPY_THRESHOLD', 10)
+    # below the threshold: execute_values
+    assert pgdb.upsert_many_candles(1, 1, _candles(5)) == 5
+    assert not pgdb.db.copies
+    # from the threshold on: COPY into the staging table, then merged
+    assert pgdb.upsert_many_candles(1, 1, _candles(12, start=3)) == 10
+    assert pgdb.db.copies == [12]
+    assert len(pgdb.db.tables['candles']) == 15
+    assert pgdb.db.tables['candles_staging'] == {}
+    stored = pgdb.db.tables['candles'][1 * 10 + 1 + 1700000000000 + 14 * 300000]
+    assert stored[4] == 'candle, "14"' and float(stored[5]) == 185014.0
+    LOGGER.debug("passed")
+
+
+def test_pool_checkout(pgdb):
+    with pgdb.cursor():
+        assert len(pgdb.db.out) == 1
+    conn, = pgdb.db.idle
+    assert conn.autocommit and not pgdb.db.out
+    # the connection is reused, and the pool bounded by maxconn
+    entered = threading.Event()
+    release = threading.Event()
+
+    def _hold():
+        with pgdb.cursor():
+            entered.set()
+            release.wait()
+
+    holders = [threading.Thread(target=_hold) for _ in range(2)]
+    for holder in holders:
+        holder.start()
+    waiter = threading.Thread(target=_hold)
+    time.sleep(0.05)
+    waiter.start()
+    time.sleep(0.05)
+    assert len(pgdb.db.out) == 2 and waiter.is_alive()
+    release.set()
+    for thread in holders + [waiter]:
+        thread.join(timeout=1)
+    assert not pgdb.db.out and len(pgdb.db.idle) == 2 and conn in pgdb.db.idle
+    LOGGER.debug("passed")
+
+
+def test_broken_connection(pgdb):
+    with pytest.raises(postgres.OperationalError):
+        with pgdb.cursor():
+            raise postgres.OperationalError('connection lost')
+    # discarded, not returned to the pool, and its slot freed
+    assert pgdb.db.discarded == 1 and not pgdb.db.idle and not pgdb.db.out
+    # server down
+    pgdb.db.broken = True
+    assert not pgdb.ping()
+    pgdb.db.broken = False
+    assert pgdb.ping()
+    # an idle connection found dead is replaced at checkout
+    conn, = pgdb.db.idle
+    conn.closed = 1
+    with pgdb.cursor():
+        assert pgdb.db.out[0] is not conn
+    assert pgdb.db.discarded == 2
+    # no pool at all: connect again
+    pgdb.close()
+    assert pgdb.db is None and pgdb.ping()
+    LOGGER.debug("passed")
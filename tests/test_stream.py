@@ -0,0 +1,101 @@
+"""
+tests.test_stream.py
+~~~~~~~
+
+test the streamed candle aggregation
+"""
+
+import logging
+from datetime import datetime, timezone
+
+import pytest
+
+from stream import CandleAggregator
+from XTBApi.streaming import StreamClient
+
+LOGGER = logging.getLogger('tests.test_stream')
+MINUTE = 60_000
+# 2024-01-03 00:00 UTC, a multiple of every timeframe up to H1
+START = 1704240000000
+
+
+def _minute(ctm, price=1950.0, move=0.5):
+    """streamed 1-minute candle, prices in base currency"""
+    return {'symbol': 'GOLD', 'ctm': ctm, 'ctmString': str(ctm),
+            'open': price, 'high': price + 2 * move, 'low': price - move,
+            'close': price + move, 'vol': 1.0}
+
+
+def _feed(aggregator, ctms):
+    return [closed for ctm in ctms for closed in aggregator.add(_minute(ctm))]
+
+
+def test_bucket_boundaries():
+    aggregator = CandleAggregator('GOLD', 5, 2)
+    closed = _feed(aggregator, range(START, START + 10 * MINUTE, MINUTE))
+    # closed by their last minute, not by the next bucket
+    assert [c['ctm'] for c in closed] == [START, START + 5 * MINUTE]
+    assert aggregator.bucket is None and not aggregator.incomplete
+    LOGGER.debug("passed")
+
+
+def test_relative_encoding():
+    aggregator = CandleAggregator('GOLD', 5, 2)
+    aggregator.add(_minute(START, 1950.0))
+    aggregator.add(_minute(START + MINUTE, 1949.0, move=3.0))
+    for i in range(2, 4):
+        aggregator.add(_minute(START + i * MINUTE, 1951.0))
+    closed, = aggregator.add(_minute(START + 4 * MINUTE, 1952.25, move=0.25))
+    # open in points, close/high/low as deltas from it, as rateInfos
+    assert closed == {'ctm': START, 'ctmString': str(START), 'open': 195000,
+                      'close': 250, 'high': 500, 'low': -400, 'vol': 5.0}
+    LOGGER.debug("passed")
+
+
+def test_partial_buckets_discarded():
+    aggregator = CandleAggregator('GOLD', 5, 2)
+    # joined mid-bucket: the first bucket is not returned
+    closed = _feed(aggregator, range(START + 2 * MINUTE, START + 10 * MINUTE, MINUTE))
+    assert [c['ctm'] for c in closed] == [START + 5 * MINUTE]
+    assert aggregator.incomplete == [START]
+    # a lost minute
+    closed = _feed(aggregator, [START + 10 * MINUTE, START + 12 * MINUTE, START + 13 * MINUTE,
+                                START + 14 * MINUTE])
+    assert closed == [] and aggregator.incomplete == [START, START + 10 * MINUTE]
+    # a lost last minute closes the bucket on the next one
+    closed = _feed(aggregator, range(START + 15 * MINUTE, START + 19 * MINUTE, MINUTE))
+    assert closed == [] and aggregator.bucket['ctm'] == START + 15 * MINUTE
+    _feed(aggregator, [START + 20 * MINUTE])
+    assert aggregator.incomplete[-1] == START + 15 * MINUTE
+    LOGGER.debug("passed")
+
+
+@pytest.mark.parametrize('month', [1, 7])
+def test_h4_server_time(month):
+    # bars start at midnight server time, 23:00 UTC in winter, 22:00 in summer
+    midnight = int(datetime(2024, month, 2, 23 - month // 7, tzinfo=timezone.utc).timestamp() * 1000)
+    aggregator = CandleAggregator('GOLD', 240, 2)
+    closed = _feed(aggregator, range(midnight, midnight + 480 * MINUTE, MINUTE))
+    assert [c['ctm'] for c in closed] == [midnight, midnight + 240 * MINUTE]
+    with pytest.raises(ValueError):
+        CandleAggregator('GOLD', 10080, 2)
+    LOGGER.debug("passed")
+
+
+class _Socket(object):
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_stream_session_switch():
+    stream = StreamClient('first')
+    stream.ws, stream._thread = _Socket(), object()
+    ws = stream.ws
+    stream.set_session('first')
+    assert not ws.closed
+    # closed for the read loop to reconnect with the new session
+    stream.set_session('second')
+    assert ws.closed and stream.stream_session_id == 'second'
+    LOGGER.debug("passed")